@@ -0,0 +1,309 @@
+from typing import Callable, Dict, List, Optional, Pattern, Tuple
+
+import math
+import multiprocessing
+import statistics
+import time
+
+from .dispatch import REPEATS, sre_parse
+from .module import Module
+from .parser import Grammar, unanchor_pattern
+
+InputGenerator = Callable[[int], str]
+
+SIZES = [8, 12, 16, 24, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192]
+
+# below this a single measurement is mostly timer noise
+_MIN_SECONDS = 2e-5
+# repeat fast calls until they add up to this much
+_SAMPLE_SECONDS = 1e-3
+# timings per size, of which the median is kept
+_RUNS = 3
+_FILLERS = ['a', ' ', '\n', '\x00']
+_MAX_PAIR_CHARS = 8
+
+
+class PatternReport:
+  """Worst growth found for one rule pattern."""
+  __slots__ = ('owner', 'kind', 'source', 'mode', 'input', 'exponent', 'seconds', 'timed_out', 'error')
+
+  def __init__(self, owner: str, kind: str, source: str):
+    self.owner = owner
+    self.kind = kind
+    self.source = source
+    self.mode = None
+    self.input = None
+    self.exponent = 0.0
+    self.seconds = 0.0
+    self.timed_out = False
+    # why the pattern could not be audited, if it could not
+    self.error: Optional[str] = None
+
+  def is_superlinear(self, threshold: float = 1.5) -> bool:
+    return self.timed_out or self.exponent > threshold
+
+  def __repr__(self):
+    return '<PatternReport {} {!r} exponent={:.2f}{}{}>'.format(
+      self.owner, self.source, self.exponent, ' timed out' if self.timed_out else '',
+      ' error={!r}'.format(self.error) if self.error is not None else '',
+    )
+
+
+def _literals(items, chars: List[str]):
+  for op, av in items:
+    if op is sre_parse.LITERAL:
+      chars.append(chr(av))
+    elif op is sre_parse.IN:
+      for sub_op, sub_av in av:
+        if sub_op is sre_parse.LITERAL:
+          chars.append(chr(sub_av))
+        elif sub_op is sre_parse.RANGE:
+          chars.append(chr(sub_av[0]))
+    elif op is sre_parse.BRANCH:
+      for alternative in av[1]:
+        _literals(alternative, chars)
+    elif op is sre_parse.SUBPATTERN:
+      _literals(av[-1], chars)
+    elif isinstance(av, tuple) and av and isinstance(av[-1], sre_parse.SubPattern):
+      _literals(av[-1], chars)  # repeats and assertions
+
+
+def _prefix(items) -> Tuple[str, bool]:
+  """Literal text leading into the pattern, skipping optional groups.
+
+  The second value tells whether ``items`` was literal all the way.
+  """
+  prefix = []
+  for op, av in items:
+    if op is sre_parse.AT or (op in REPEATS and av[:2] == (0, 1)):
+      continue
+    elif op is sre_parse.LITERAL:
+      prefix.append(chr(av))
+    elif op is sre_parse.SUBPATTERN:
+      sub, complete = _prefix(av[-1])
+      prefix.append(sub)
+      if not complete:
+        return ''.join(prefix), False
+    else:
+      return ''.join(prefix), False
+  return ''.join(prefix), True
+
+
+def adversarial_inputs(pattern: Pattern) -> Dict[str, InputGenerator]:
+  """Inputs of a given length built from the pattern's own characters.
+
+  Repetitions of single characters and character pairs, with and without
+  the pattern's literal prefix in front, are the usual shapes that make
+  nested or adjacent quantifiers backtrack.
+  """
+  try:
+    parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+  except (TypeError, ValueError, sre_parse.error):
+    parsed = []
+  chars: List[str] = []
+  _literals(parsed, chars)
+  prefix = _prefix(parsed)[0] or pattern.pattern[:1]
+  alphabet = list(dict.fromkeys(chars + _FILLERS))
+  pair_chars = list(dict.fromkeys(
+    [c for c in alphabet if not c.isalnum()][:_MAX_PAIR_CHARS - 1] + ['a']
+  ))
+
+  inputs: Dict[str, InputGenerator] = {}
+  for c in alphabet:
+    inputs['{!r}*n'.format(c)] = lambda n, c=c: c * n
+    inputs['{!r}+{!r}*n'.format(prefix, c)] = lambda n, c=c: prefix + c * n
+  for c in pair_chars:
+    for d in pair_chars:
+      if c != d:
+        inputs['{!r}*n'.format(c + d)] = lambda n, p=c + d: p * (n // 2)
+        inputs['{!r}+{!r}*n+NUL'.format(prefix, c + d)] = lambda n, p=c + d: prefix + p * (n // 2) + '\x00'
+  if prefix:
+    inputs['{!r}*n'.format(prefix)] = lambda n: prefix * max(1, n // len(prefix))
+  return inputs
+
+
+def _time(func: Callable[[], object]) -> float:
+  start = time.perf_counter()
+  func()
+  elapsed = time.perf_counter() - start
+  if elapsed >= _SAMPLE_SECONDS:
+    return elapsed
+  count = max(1, int(_SAMPLE_SECONDS / max(elapsed, 1e-7)))
+  start = time.perf_counter()
+  for _ in range(count):
+    func()
+  return min(elapsed, (time.perf_counter() - start) / count)
+
+
+def _match_once(pattern: Pattern, text: str):
+  return lambda: pattern.match(text)
+
+
+def _match_everywhere(pattern: Pattern, text: str):
+  # what InlineParser pays on unmatched text: an attempt wherever the rule
+  # could start, which for adversarial inputs is every position
+  match = pattern.match
+
+  def scan():
+    for pos in range(len(text)):
+      match(text, pos)
+
+  return scan
+
+
+MODES = {
+  'match': _match_once,
+  'scan': _match_everywhere,
+}
+
+
+def growth_exponent(samples: List[Tuple[int, float]], tail: int = 6, min_points: int = 5) -> float:
+  """Least-squares slope of log(time) over log(size).
+
+  Only the ``tail`` largest samples above the timer noise are used, since
+  the asymptotic growth is what matters; with fewer than ``min_points`` of
+  them the growth is taken as flat.
+  """
+  points = [(math.log(n), math.log(t)) for n, t in samples if t >= _MIN_SECONDS][-tail:]
+  if len(points) < min_points:
+    return 0.0
+  mean_x = sum(x for x, _ in points) / len(points)
+  mean_y = sum(y for _, y in points) / len(points)
+  var = sum((x - mean_x) ** 2 for x, _ in points)
+  if not var:
+    return 0.0
+  return sum((x - mean_x) * (y - mean_y) for x, y in points) / var
+
+
+def measure(
+    pattern: Pattern,
+    generator: InputGenerator,
+    mode: str = 'match',
+    sizes: List[int] = SIZES,
+    budget: float = 0.1,
+    runs: int = _RUNS,
+) -> List[Tuple[int, float]]:
+  """Time ``pattern`` on growing inputs until a call exceeds ``budget``.
+
+  Each size is timed ``runs`` times and the median kept, so one hiccup
+  cannot bend the curve; a call over ``budget`` is not repeated.
+  """
+  samples = []
+  for size in sizes:
+    func = MODES[mode](pattern, generator(size))
+    timings = [_time(func)]
+    while len(timings) < runs and timings[0] <= budget:
+      timings.append(_time(func))
+    seconds = statistics.median(timings)
+    samples.append((size, seconds))
+    if seconds > budget:
+      break
+  return samples
+
+
+def audit_pattern(
+    pattern: Pattern,
+    owner: str,
+    kind: str,
+    sizes: List[int] = SIZES,
+    budget: float = 0.1,
+) -> PatternReport:
+  report = PatternReport(owner, kind, str(pattern.pattern))
+  modes = ['match', 'scan'] if kind == 'inline' else ['match']
+  for mode in modes:
+    for name, generator in adversarial_inputs(pattern).items():
+      samples = measure(pattern, generator, mode, sizes, budget)
+      exponent = growth_exponent(samples)
+      seconds = samples[-1][1]
+      if seconds > budget and samples[-1][0] < sizes[-1]:
+        exponent = math.inf
+      if exponent > report.exponent or (exponent == report.exponent and seconds > report.seconds):
+        report.mode = mode
+        report.input = name
+        report.exponent = exponent
+        report.seconds = seconds
+  return report
+
+
+def collect_patterns(modules: List[Module], grammar: Grammar = Grammar()) -> List[Tuple[Pattern, str, str]]:
+  """Every rule pattern the parsers would build, with owner and kind."""
+  patterns = []
+  for module in modules:
+    for kind, types, gen_pattern in (
+        ('block', module.get_block_types(), grammar.gen_block_pattern),
+        ('inline', module.get_inline_types(), grammar.gen_inline_pattern),
+    ):
+      for t in types:
+        owner = '{}.{}'.format(type(t).__module__, type(t).__qualname__)
+        for pattern in t.get_patterns():
+          patterns.append((unanchor_pattern(pattern), owner, kind))
+        generated = 'Grammar.gen_{}_pattern({!r})'.format(kind, t.get_name())
+        patterns.append((unanchor_pattern(gen_pattern(t.get_name())), generated, kind))
+  return patterns
+
+
+def _errored(pattern, owner: str, kind: str, error: str) -> PatternReport:
+  report = PatternReport(owner, kind, str(pattern.pattern))
+  report.error = error
+  return report
+
+
+def _audit_or_error(pattern, owner, kind, sizes, budget) -> PatternReport:
+  try:
+    return audit_pattern(pattern, owner, kind, sizes, budget)
+  except Exception as e:
+    return _errored(pattern, owner, kind, '{}: {}'.format(type(e).__name__, e))
+
+
+def _audit_child(connection, pattern, owner, kind, sizes, budget):
+  connection.send(_audit_or_error(pattern, owner, kind, sizes, budget))
+  connection.close()
+
+
+def audit_modules(
+    modules: List[Module],
+    grammar: Grammar = Grammar(),
+    sizes: List[int] = SIZES,
+    budget: float = 0.1,
+    timeout: Optional[float] = 30.0,
+) -> List[PatternReport]:
+  """Fuzz every pattern of ``modules``, worst growth first.
+
+  Each pattern is audited in a child process that is killed after
+  ``timeout`` seconds, since a catastrophic pattern cannot be interrupted
+  from Python; such patterns are reported as timed out. A pattern whose
+  audit raises, or whose child process dies, gets a report with ``error``
+  set and the other patterns are still audited.
+  """
+  context = multiprocessing.get_context()
+  reports = []
+  for pattern, owner, kind in collect_patterns(modules, grammar):
+    if timeout is None:
+      reports.append(_audit_or_error(pattern, owner, kind, sizes, budget))
+      continue
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+      target=_audit_child,
+      args=(sender, pattern, owner, kind, sizes, budget),
+      daemon=True,
+    )
+    process.start()
+    sender.close()
+    if receiver.poll(timeout):
+      try:
+        reports.append(receiver.recv())
+      except EOFError:
+        process.join()
+        reports.append(_errored(
+          pattern, owner, kind, 'audit process exited with code {}'.format(process.exitcode),
+        ))
+    else:
+      report = PatternReport(owner, kind, str(pattern.pattern))
+      report.timed_out = True
+      report.exponent = math.inf
+      reports.append(report)
+    process.terminate()
+    process.join()
+    receiver.close()
+  reports.sort(key=lambda r: (r.exponent, r.seconds), reverse=True)
+  return reports
@@ -0,0 +1,231 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .cache import ParseCache, RenderCache
+from .module import Module
+from .ordering import RuleOrdering
+from .parser import Parser
+from .registry import ModuleRegistry, default_registry
+from .render import HtmlRenderEngine
+from .snapshot import GrammarSnapshot
+
+ModulesFactory = Callable[[], List[Module]]
+
+SOURCE_SUFFIX = '.ag'
+OUTPUT_SUFFIX = '.html'
+# where highlighted code and rendered blocks are kept inside ``cache_dir``
+HIGHLIGHT_DIR = 'highlight'
+RENDER_CACHE_FILE = 'render.agr'
+
+
+def default_modules() -> List[Module]:
+  from .modules.code import CodeModule
+  from .modules.core import BoldModule, ItalicModule, LinkModule, UnderlineModule
+  from .modules.paragraph import ParagraphModule
+  return [
+    CodeModule(),
+    BoldModule(),
+    ItalicModule(),
+    UnderlineModule(),
+    LinkModule(),
+    ParagraphModule(),
+  ]
+
+
+class DocumentResult:
+  __slots__ = ('source', 'output', 'seconds', 'error')
+
+  def __init__(self, source: str, output: str, seconds: float, error: Optional[str]):
+    self.source = source
+    self.output = output
+    self.seconds = seconds
+    self.error = error
+
+
+class BatchResult:
+  """Per-document results of a batch, in the order the sources were given."""
+
+  def __init__(self, documents: List[DocumentResult], seconds: float):
+    self.documents = documents
+    self.seconds = seconds
+
+  @property
+  def failures(self) -> List[DocumentResult]:
+    return [d for d in self.documents if d.error is not None]
+
+  @property
+  def docs_per_second(self) -> float:
+    if not self.seconds:
+      return 0.0
+    return len(self.documents) / self.seconds
+
+  def slowest(self, count: int = 10) -> List[DocumentResult]:
+    return sorted(self.documents, key=lambda d: d.seconds, reverse=True)[:count]
+
+
+def find_sources(paths: Iterable[str]) -> List[Tuple[str, str]]:
+  """Expand files and directories into ``(source, relative output name)``.
+
+  Directories are searched recursively for ``.ag`` files in sorted order, so
+  the batch order does not depend on the file system.
+  """
+  sources = []
+  for path in paths:
+    if os.path.isdir(path):
+      found = []
+      for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in files:
+          if name.endswith(SOURCE_SUFFIX):
+            found.append(os.path.join(root, name))
+      for source in sorted(found):
+        sources.append((source, os.path.relpath(source, path)))
+    else:
+      sources.append((path, os.path.basename(path)))
+  return sources
+
+
+def output_path(output_dir: Optional[str], source: str, relative: str) -> str:
+  base = os.path.join(output_dir, relative) if output_dir is not None else source
+  if base.endswith(SOURCE_SUFFIX):
+    base = base[:-len(SOURCE_SUFFIX)]
+  return base + OUTPUT_SUFFIX
+
+
+Worker = Tuple[Parser, HtmlRenderEngine]
+
+_worker: Optional[Worker] = None
+
+
+def _build_worker(
+    modules_factory: ModulesFactory,
+    cache_dir: Optional[str] = None,
+    rule_order: Optional[str] = None,
+    snapshot: Optional[str] = None,
+    render_cache: Optional[RenderCache] = None,
+    registry_factory: Callable[[], ModuleRegistry] = default_registry,
+) -> Worker:
+  modules = modules_factory()
+  registry = registry_factory()
+  parse_cache = None
+  if cache_dir is not None:
+    parse_cache = ParseCache(cache_dir)
+    if render_cache is None:
+      render_cache = RenderCache()
+      render_cache.load(os.path.join(cache_dir, RENDER_CACHE_FILE))
+  ordering = RuleOrdering.load(rule_order) if rule_order is not None else None
+  parser = Parser(modules, registry=registry, parse_cache=parse_cache, ordering=ordering)
+  if snapshot is not None:
+    # a stale snapshot is ignored and the parsers are built as usual
+    GrammarSnapshot.load(snapshot).install(parser)
+  engine = HtmlRenderEngine(modules, registry=registry, cache=render_cache)
+  if cache_dir is not None:
+    # handed to the code renderers rather than installed as
+    # ``code.highlight_cache``, so the caller's global is left alone
+    from .modules import code
+    highlight_cache = code.HighlightCache(directory=os.path.join(cache_dir, HIGHLIGHT_DIR))
+    renderers = [*engine.block_renderers.values(), *engine.inline_renderers.values()]
+    for renderer in renderers:
+      if isinstance(renderer, (code.CodeBlockRenderer, code.CodeInlineRenderer)) and renderer.cache is None:
+        renderer.cache = highlight_cache
+  return parser, engine
+
+
+def _init_worker(*args):
+  global _worker
+  _worker = _build_worker(*args)
+
+
+def _compile(
+    task: Tuple[str, str],
+    worker: Optional[Worker] = None,
+) -> Tuple[float, Optional[str], Optional[Dict[str, str]]]:
+  # also returns the blocks rendered into the render cache, to be saved
+  source, output = task
+  parser, engine = worker if worker is not None else _worker
+  start = time.perf_counter()
+  error = None
+  try:
+    with open(source, encoding='utf-8') as f:
+      document = parser.parse(f.read())
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+      engine.render(document, f)
+  except Exception as e:
+    error = '{}: {}'.format(type(e).__name__, e)
+  rendered = engine.cache.drain() if engine.cache is not None else None
+  return time.perf_counter() - start, error, rendered
+
+
+def compile_files(
+    paths: Iterable[str],
+    output_dir: Optional[str] = None,
+    workers: Optional[int] = None,
+    modules_factory: ModulesFactory = default_modules,
+    chunksize: int = 16,
+    cache_dir: Optional[str] = None,
+    rule_order: Optional[str] = None,
+    snapshot: Optional[str] = None,
+    registry_factory: Callable[[], ModuleRegistry] = default_registry,
+) -> BatchResult:
+  """Parse and render every source to HTML across a process pool.
+
+  Each worker builds one ``Parser`` and ``HtmlRenderEngine`` from
+  ``modules_factory`` (which must be picklable) and keeps them for all its
+  documents. A failing document is recorded in its result and the batch goes
+  on. ``workers=1`` compiles in the current process. With ``cache_dir``,
+  block tokens are kept in a ``ParseCache`` shared by the workers,
+  highlighted code in its ``HIGHLIGHT_DIR`` and the HTML of blocks in a
+  ``RenderCache`` saved to ``RENDER_CACHE_FILE`` when the batch is done.
+  ``rule_order`` is a file saved by ``RuleOrdering.save``, ``snapshot`` one
+  saved by ``GrammarSnapshot.save``. ``::usemodule:`` headers are resolved
+  through the registry ``registry_factory`` builds, also picklable.
+  """
+  sources = find_sources(paths)
+  tasks = [
+    (source, output_path(output_dir, source, relative))
+    for source, relative in sources
+  ]
+
+  render_cache = None
+  if cache_dir is not None:
+    render_cache = RenderCache()
+    render_cache.load(os.path.join(cache_dir, RENDER_CACHE_FILE))
+  rendered_any = False
+
+  def merge(outcomes):
+    # keep only timings and errors: the rendered blocks go to render_cache
+    # as each result arrives
+    nonlocal rendered_any
+    for elapsed, error, rendered in outcomes:
+      if rendered:
+        render_cache.update(rendered)
+        rendered_any = True
+      yield elapsed, error
+
+  start = time.perf_counter()
+  if workers == 1:
+    # the worker shares render_cache, so its entries are not held twice
+    worker = _build_worker(
+      modules_factory, cache_dir, rule_order, snapshot, render_cache, registry_factory)
+    outcomes = list(merge(_compile(task, worker) for task in tasks))
+  else:
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(modules_factory, cache_dir, rule_order, snapshot, None, registry_factory),
+    ) as executor:
+      outcomes = list(merge(executor.map(_compile, tasks, chunksize=chunksize)))
+  seconds = time.perf_counter() - start
+
+  if rendered_any:
+    render_cache.save(os.path.join(cache_dir, RENDER_CACHE_FILE))
+
+  documents = [
+    DocumentResult(source, output, elapsed, error)
+    for (source, output), (elapsed, error) in zip(tasks, outcomes)
+  ]
+  return BatchResult(documents, seconds)
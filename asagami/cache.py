@@ -0,0 +1,330 @@
+from typing import Dict, List, Optional, Tuple
+
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+from .parser import INLINE_LAZY, INLINE_NONE, BlockParser
+from .token import EMPTY_ATTRIBUTES, BlockToken, TokenAttributes
+
+MAGIC = b'AGC\x01'
+SUFFIX = '.agc'
+
+_U32 = struct.Struct('<I')
+_STR = 0
+_LIST = 1
+
+
+def _write_str(out: bytearray, value: str):
+  data = value.encode('utf-8', 'surrogatepass')
+  out += _U32.pack(len(data))
+  out += data
+
+
+def _read_str(data: memoryview, pos: int) -> Tuple[str, int]:
+  size, = _U32.unpack_from(data, pos)
+  pos += 4
+  return str(data[pos:pos + size], 'utf-8', 'surrogatepass'), pos + size
+
+
+def dump_blocks(tokens: List[BlockToken]) -> bytes:
+  """Serialize block names, bodies and attributes (not children)."""
+  out = bytearray()
+  out += _U32.pack(len(tokens))
+  for token in tokens:
+    _write_str(out, token.name)
+    _write_str(out, token.body)
+    out += _U32.pack(len(token.attributes))
+    for name, value in token.attributes.items():
+      _write_str(out, name)
+      if isinstance(value, str):
+        out.append(_STR)
+        _write_str(out, value)
+      else:
+        out.append(_LIST)
+        out += _U32.pack(len(value))
+        for item in value:
+          _write_str(out, item)
+  return MAGIC + zlib.compress(bytes(out), 1)
+
+
+def _remove(path: str):
+  try:
+    os.remove(path)
+  except OSError:
+    pass
+
+
+def load_blocks(data: bytes) -> List[BlockToken]:
+  if not data.startswith(MAGIC):
+    raise ValueError('not a parse cache entry')
+  data = memoryview(zlib.decompress(data[len(MAGIC):]))
+  count, = _U32.unpack_from(data, 0)
+  pos = 4
+  tokens = []
+  for _ in range(count):
+    name, pos = _read_str(data, pos)
+    body, pos = _read_str(data, pos)
+    attribute_count, = _U32.unpack_from(data, pos)
+    pos += 4
+    attributes: TokenAttributes = EMPTY_ATTRIBUTES
+    if attribute_count:
+      attributes = OrderedDict()
+      for _ in range(attribute_count):
+        key, pos = _read_str(data, pos)
+        tag = data[pos]
+        pos += 1
+        if tag == _STR:
+          value, pos = _read_str(data, pos)
+        else:
+          item_count, = _U32.unpack_from(data, pos)
+          pos += 4
+          items = []
+          for _ in range(item_count):
+            item, pos = _read_str(data, pos)
+            items.append(item)
+          value = tuple(items)
+        attributes[key] = value
+    tokens.append(BlockToken(name=name, body=body, attributes=attributes))
+  return tokens
+
+
+class ParseCache:
+  """Content-addressed on-disk cache of block tokens.
+
+  Entries are keyed by the block parser's ``fingerprint()`` and the text, so
+  a change to any module pattern or tokenizer simply misses. When the
+  directory grows past ``max_bytes`` the least recently used entries are
+  removed. Entries are written atomically, so concurrent build processes
+  can share a directory.
+  """
+  directory: str
+  max_bytes: int
+  hits: int
+  misses: int
+
+  def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    self._size: Optional[int] = None
+
+  @staticmethod
+  def key(block_parser: BlockParser, text: str) -> str:
+    digest = hashlib.sha256(block_parser.fingerprint().encode('ascii'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+  def _path(self, key: str) -> str:
+    return os.path.join(self.directory, key[:2], key + SUFFIX)
+
+  def get(self, key: str) -> Optional[List[BlockToken]]:
+    path = self._path(key)
+    try:
+      with open(path, 'rb') as f:
+        data = f.read()
+      tokens = load_blocks(data)
+    except FileNotFoundError:
+      self.misses += 1
+      return None
+    except (OSError, ValueError, zlib.error, struct.error, UnicodeDecodeError):
+      self.misses += 1
+      _remove(path)
+      return None
+    self.hits += 1
+    try:
+      os.utime(path)
+    except OSError:
+      pass
+    return tokens
+
+  def put(self, key: str, tokens: List[BlockToken]):
+    data = dump_blocks(tokens)
+    path = self._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+      replaced = os.stat(path).st_size
+    except OSError:
+      replaced = 0
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+      os.replace(tmp, path)
+    except BaseException:
+      _remove(tmp)
+      raise
+
+    if self._size is None:
+      self._size = sum(size for _, size, _ in self._entries())
+    else:
+      self._size += len(data) - replaced
+    if self._size > self.max_bytes:
+      self.evict()
+
+  def parse(self, block_parser: BlockParser, text: str, inline: str = INLINE_LAZY) -> List[BlockToken]:
+    """``block_parser.parse`` that reads and fills the cache."""
+    key = self.key(block_parser, text)
+    tokens = self.get(key)
+    if tokens is None:
+      tokens = block_parser.parse(text, inline)
+      self.put(key, tokens)
+    elif inline != INLINE_NONE:
+      block_parser.attach_children(tokens, inline)
+    return tokens
+
+  def evict(self, target: Optional[int] = None):
+    """Remove least recently used entries until at most ``target`` bytes."""
+    if target is None:
+      target = self.max_bytes * 9 // 10
+    entries = sorted(self._entries())
+    size = sum(entry_size for _, entry_size, _ in entries)
+    for _, entry_size, path in entries:
+      if size <= target:
+        break
+      _remove(path)
+      size -= entry_size
+    self._size = size
+
+  def clear(self):
+    self.evict(0)
+
+  def _entries(self) -> List[Tuple[float, int, str]]:
+    entries = []
+    if not os.path.isdir(self.directory):
+      return entries
+    for shard in os.scandir(self.directory):
+      if not shard.is_dir():
+        continue
+      for entry in os.scandir(shard.path):
+        if not entry.name.endswith(SUFFIX):
+          continue
+        try:
+          stat = entry.stat()
+        except OSError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+
+RENDER_MAGIC = b'AGR\x01'
+
+
+class RenderCache:
+  """Bounded LRU of rendered block HTML, shared across documents.
+
+  ``HtmlRenderEngine`` looks blocks up by ``key``: the renderers and modules
+  in use, the block's name, attributes and whether it has inline children,
+  and a digest of its body. Unchanged blocks of an edited document are then
+  copied from the cache instead of rendered. ``save`` and ``load`` keep the
+  entries between builds; ``drain`` hands over the entries added since it
+  was last called, e.g. from worker processes to the one that saves.
+  """
+  maxsize: int
+  hits: int
+  misses: int
+
+  def __init__(self, maxsize: int = 65536):
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._entries: 'OrderedDict[str, str]' = OrderedDict()
+    self._fresh: 'OrderedDict[str, str]' = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  @staticmethod
+  def key(context: bytes, token: BlockToken) -> str:
+    digest = hashlib.sha256(context)
+    digest.update(repr((token.name, tuple(token.attributes.items()), token.has_children)).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(token.body.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+  def get(self, key: str) -> Optional[str]:
+    with self._lock:
+      html = self._entries.get(key)
+      if html is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self._entries.move_to_end(key)
+      return html
+
+  def put(self, key: str, html: str):
+    with self._lock:
+      self._fresh[key] = html
+      # more could not be kept by whoever takes them either
+      if len(self._fresh) > self.maxsize:
+        self._fresh.popitem(last=False)
+      self._put(key, html)
+
+  def _put(self, key: str, html: str):
+    self._entries[key] = html
+    self._entries.move_to_end(key)
+    if len(self._entries) > self.maxsize:
+      self._entries.popitem(last=False)
+
+  def update(self, entries: Dict[str, str]):
+    """Add entries, e.g. from another cache's ``drain``."""
+    with self._lock:
+      for key, html in entries.items():
+        self._put(key, html)
+
+  def drain(self) -> Dict[str, str]:
+    """Entries put since the last call, at most ``maxsize`` of the newest."""
+    with self._lock:
+      fresh, self._fresh = self._fresh, OrderedDict()
+    return fresh
+
+  def load(self, path: str):
+    """Add the entries saved at ``path``; a missing or broken file adds none."""
+    try:
+      with open(path, 'rb') as f:
+        data = f.read()
+      if not data.startswith(RENDER_MAGIC):
+        return
+      data = memoryview(zlib.decompress(data[len(RENDER_MAGIC):]))
+      count, = _U32.unpack_from(data, 0)
+      pos = 4
+      entries = OrderedDict()
+      for _ in range(count):
+        key, pos = _read_str(data, pos)
+        html, pos = _read_str(data, pos)
+        entries[key] = html
+    except (OSError, zlib.error, struct.error, UnicodeDecodeError):
+      return
+    with self._lock:
+      # saved entries are older than anything added in this process
+      for key, html in reversed(entries.items()):
+        if key not in self._entries:
+          self._entries[key] = html
+          self._entries.move_to_end(key, last=False)
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+
+  def save(self, path: str):
+    """Write the entries atomically, least recently used first."""
+    out = bytearray()
+    with self._lock:
+      out += _U32.pack(len(self._entries))
+      for key, html in self._entries.items():
+        _write_str(out, key)
+        _write_str(out, html)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write(RENDER_MAGIC + zlib.compress(bytes(out), 1))
+      os.replace(tmp, path)
+    except BaseException:
+      _remove(tmp)
+      raise
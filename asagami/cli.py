@@ -0,0 +1,126 @@
+import argparse
+import importlib
+import sys
+
+from .batch import compile_files, default_modules
+from .profiling import SORT_KEYS
+
+
+def build(args) -> int:
+  result = compile_files(
+    args.sources,
+    output_dir=args.output,
+    workers=args.jobs,
+    cache_dir=args.cache,
+    rule_order=args.rule_order,
+    snapshot=args.snapshot,
+  )
+  for document in result.failures:
+    error = document.error.splitlines()[0]
+    print('error: {}: {}'.format(document.source, error), file=sys.stderr)
+  print('{} documents, {} failed, {:.2f} s, {:.1f} docs/sec'.format(
+    len(result.documents),
+    len(result.failures),
+    result.seconds,
+    result.docs_per_second,
+  ))
+  if args.slowest:
+    print('slowest:')
+    for document in result.slowest(args.slowest):
+      print('  {:8.1f} ms  {}'.format(document.seconds * 1e3, document.source))
+  return 1 if result.failures else 0
+
+
+def load_module(spec: str):
+  """Instantiate a module given as ``package.module:ClassName``."""
+  module_name, _, class_name = spec.partition(':')
+  if not class_name:
+    raise argparse.ArgumentTypeError('expected package.module:ClassName, got {!r}'.format(spec))
+  try:
+    return getattr(importlib.import_module(module_name), class_name)()
+  except (ImportError, AttributeError) as e:
+    raise argparse.ArgumentTypeError('cannot load {}: {}'.format(spec, e))
+
+
+def audit(args) -> int:
+  from .audit import audit_modules
+  modules = args.modules or default_modules()
+  reports = audit_modules(modules, timeout=args.timeout)
+  flagged = [r for r in reports if r.is_superlinear(args.threshold)]
+  errored = [r for r in reports if r.error is not None]
+  for report in reports:
+    status = 'FAIL' if report in flagged or report in errored else 'ok'
+    if report.error is not None:
+      growth = 'error'
+    elif report.timed_out:
+      growth = 'timeout'
+    else:
+      growth = 'n^{:.2f}'.format(report.exponent)
+    print('{:4}  {:>8}  {}  {}'.format(status, growth, report.owner, report.source))
+    if report.error is not None:
+      print('      {}'.format(report.error))
+    elif report in flagged and not report.timed_out:
+      print('      worst: {} on {}'.format(report.mode, report.input))
+  print('{} patterns, {} superlinear, {} not audited'.format(len(reports), len(flagged), len(errored)))
+  return 1 if flagged or errored else 0
+
+
+def profile(args) -> int:
+  from .batch import find_sources
+  from .parser import INLINE_EAGER, Parser, ParserCache
+  from .ordering import RuleOrdering
+  from .profiling import ParseProfile
+  rule_profile = ParseProfile()
+  parser = Parser(default_modules(), cache=ParserCache(), profile=rule_profile)
+  for source, _ in find_sources(args.sources):
+    with open(source, encoding='utf-8') as f:
+      parser.parse(f.read(), INLINE_EAGER)
+  print(rule_profile.format(args.sort, args.limit))
+  if args.save_order:
+    RuleOrdering.from_profile(rule_profile).save(args.save_order)
+  return 0
+
+
+def snapshot(args) -> int:
+  from .parser import Parser, ParserCache
+  from .snapshot import GrammarSnapshot
+  GrammarSnapshot.of(Parser(default_modules(), cache=ParserCache())).save(args.output)
+  return 0
+
+
+def main(argv=None) -> int:
+  parser = argparse.ArgumentParser(prog='asagami')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+
+  build_parser = subparsers.add_parser('build', help='compile .ag files to HTML')
+  build_parser.add_argument('sources', nargs='+', help='.ag files or directories')
+  build_parser.add_argument('-o', '--output', help='output directory (default: next to sources)')
+  build_parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes')
+  build_parser.add_argument('--cache', metavar='DIR', help='reuse parse results and highlighted code stored in DIR')
+  build_parser.add_argument('--rule-order', metavar='FILE', help='try rules in the order saved by profile --save-order')
+  build_parser.add_argument('--snapshot', metavar='FILE', help='load parsers from a file saved by the snapshot command')
+  build_parser.add_argument('--slowest', type=int, default=10, help='number of slowest files to list')
+  build_parser.set_defaults(func=build)
+
+  audit_parser = subparsers.add_parser('audit', help='check module patterns for superlinear matching')
+  audit_parser.add_argument(
+    'modules', nargs='*', type=load_module, metavar='MODULE',
+    help='package.module:ClassName (default: the built-in modules)',
+  )
+  audit_parser.add_argument('--threshold', type=float, default=1.5, help='largest allowed growth exponent')
+  audit_parser.add_argument('--timeout', type=float, default=30.0, help='seconds allowed per pattern')
+  audit_parser.set_defaults(func=audit)
+
+  profile_parser = subparsers.add_parser('profile', help='count and time parse rules over .ag files')
+  profile_parser.add_argument('sources', nargs='+', help='.ag files or directories')
+  profile_parser.add_argument('--sort', choices=SORT_KEYS, default='total_seconds', help='report order')
+  profile_parser.add_argument('--limit', type=int, default=None, help='number of rules to list')
+  profile_parser.add_argument('--save-order', metavar='FILE', help='save rule hit counts for build --rule-order')
+  profile_parser.set_defaults(func=profile)
+
+  snapshot_parser = subparsers.add_parser('snapshot', help='save the built parsers for build --snapshot')
+  snapshot_parser.add_argument('output', help='file to write')
+  snapshot_parser.set_defaults(func=snapshot)
+
+  args = parser.parse_args(argv)
+  return args.func(args)
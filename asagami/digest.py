@@ -0,0 +1,45 @@
+"""Process-independent digests of code, for keys that must outlive a process."""
+from typing import Any, Dict
+
+import hashlib
+from types import CodeType
+
+
+def code_digest(code: CodeType) -> tuple:
+  """Process-independent summary of a function body (no addresses)."""
+  consts = tuple(
+    code_digest(const) if isinstance(const, CodeType) else repr(const)
+    for const in code.co_consts
+  )
+  return code.co_code, consts
+
+
+_class_digests: Dict[type, str] = {}
+
+
+def class_digest(obj: Any) -> str:
+  """Digest of the code of every method ``obj``'s class defines or inherits."""
+  cached = _class_digests.get(type(obj))
+  if cached is not None:
+    return cached
+  digest = hashlib.sha256()
+  for klass in type(obj).__mro__:
+    if klass.__module__ in ('builtins', 'abc'):
+      continue
+    for name, value in sorted(vars(klass).items()):
+      function = getattr(value, '__func__', value)
+      code = getattr(function, '__code__', None)
+      if code is not None:
+        digest.update(repr((klass.__qualname__, name, code_digest(code))).encode('utf-8'))
+  cached = _class_digests[type(obj)] = digest.hexdigest()
+  return cached
+
+
+def signature(obj: Any) -> list:
+  """Class, ``version`` attribute and ``class_digest`` of ``obj``."""
+  return [
+    type(obj).__module__,
+    type(obj).__qualname__,
+    getattr(obj, 'version', None),
+    class_digest(obj),
+  ]
@@ -0,0 +1,233 @@
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Pattern, Set, Tuple
+
+import re
+
+try:
+  from re import _parser as sre_parse
+except ImportError:  # python < 3.11
+  import sre_parse
+
+Rule = Tuple[Pattern, Callable]
+
+_MAX_RANGE = 256
+REPEATS = tuple(
+  getattr(sre_parse, op)
+  for op in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+  if hasattr(sre_parse, op)
+)
+
+
+def first_chars(pattern: Pattern) -> Optional[FrozenSet[str]]:
+  """Return every character a match of ``pattern`` can start with.
+
+  ``None`` means the set is unknown: the pattern may match the empty string,
+  start with a character class that cannot be enumerated, or depend on flags
+  such as ``re.IGNORECASE``.
+  """
+  if not isinstance(pattern.pattern, str) or pattern.flags & re.IGNORECASE:
+    return None
+  chars, nullable = _first_chars(sre_parse.parse(pattern.pattern, pattern.flags))
+  if chars is None or nullable:
+    return None
+  return frozenset(chars)
+
+
+def _first_chars(items) -> Tuple[Optional[Set[str]], bool]:
+  chars: Set[str] = set()
+  for op, av in items:
+    if op is sre_parse.AT:
+      continue
+    elif op is sre_parse.LITERAL:
+      chars.add(chr(av))
+      return chars, False
+    elif op is sre_parse.IN:
+      sub = in_chars(av)
+      if sub is None:
+        return None, False
+      chars |= sub
+      return chars, False
+    elif op is sre_parse.SUBPATTERN:
+      add_flags = av[1]
+      if add_flags & re.IGNORECASE:
+        return None, False
+      sub, nullable = _first_chars(av[-1])
+      if sub is None:
+        return None, False
+      chars |= sub
+      if not nullable:
+        return chars, False
+    elif op is sre_parse.BRANCH:
+      branch_nullable = False
+      for alternative in av[1]:
+        sub, nullable = _first_chars(alternative)
+        if sub is None:
+          return None, False
+        chars |= sub
+        branch_nullable = branch_nullable or nullable
+      if not branch_nullable:
+        return chars, False
+    elif op in REPEATS:
+      min_count, _, item = av
+      sub, nullable = _first_chars(item)
+      if sub is None:
+        return None, False
+      chars |= sub
+      if min_count > 0 and not nullable:
+        return chars, False
+    else:
+      return None, False
+  return chars, True
+
+
+def in_chars(items) -> Optional[Set[str]]:
+  """Characters a ``[...]`` set matches; ``None`` if negated or too many."""
+  chars: Set[str] = set()
+  for op, av in items:
+    if op is sre_parse.LITERAL:
+      chars.add(chr(av))
+    elif op is sre_parse.RANGE:
+      low, high = av
+      if high - low > _MAX_RANGE:
+        return None
+      chars.update(chr(c) for c in range(low, high + 1))
+    else:  # NEGATE, CATEGORY, ...
+      return None
+  return chars
+
+
+_BYTES_SAFE_AT = frozenset(
+  getattr(sre_parse, code)
+  for code in (
+    'AT_BEGINNING', 'AT_BEGINNING_LINE', 'AT_BEGINNING_STRING',
+    'AT_END', 'AT_END_LINE', 'AT_END_STRING',
+  )
+)
+
+
+def bytes_pattern(pattern: Pattern) -> Optional[Pattern]:
+  """Return a pattern that matches the UTF-8 encoding of what ``pattern`` does.
+
+  Objects that match bytes themselves (``matches_bytes``) are returned as is.
+  A ``re.Pattern`` is recompiled from its source when that cannot change the result:
+  the source is ASCII, there are no character categories (``\\w``, ``\\s``,
+  ...), word boundaries, lookbehinds or ``re.IGNORECASE``, and items that can
+  match a non-ASCII character (``.``, ``[^...]``) only appear as ``*`` or
+  ``+`` repeats, which take whole characters the same way bytes do.
+  ``None`` means the pattern has to be matched on decoded text, as does
+  any other object: its ``pattern`` need not be a regex source.
+  """
+  if getattr(pattern, 'matches_bytes', False):
+    return pattern
+  if not isinstance(pattern, re.Pattern):
+    return None
+  source = pattern.pattern
+  if not isinstance(source, str) or not source.isascii() or pattern.flags & re.IGNORECASE:
+    return None
+  flags = pattern.flags & ~(re.UNICODE | re.ASCII)
+  try:
+    if not _bytes_safe(sre_parse.parse(source, pattern.flags)):
+      return None
+    return re.compile(source.encode('ascii'), flags)
+  except (sre_parse.error, re.error):
+    return None
+
+
+def _bytes_safe(items, repeated: bool = False) -> bool:
+  for op, av in items:
+    if op is sre_parse.LITERAL:
+      continue
+    elif op is sre_parse.AT:
+      if av not in _BYTES_SAFE_AT:
+        return False
+    elif op in (sre_parse.ANY, sre_parse.NOT_LITERAL):
+      if not repeated:
+        return False
+    elif op is sre_parse.IN:
+      for in_op, _ in av:
+        if in_op is sre_parse.NEGATE:
+          if not repeated:
+            return False
+        elif in_op not in (sre_parse.LITERAL, sre_parse.RANGE):
+          return False
+    elif op is sre_parse.SUBPATTERN:
+      if av[1] & re.IGNORECASE or not _bytes_safe(av[-1]):
+        return False
+    elif op is sre_parse.BRANCH:
+      if not all(_bytes_safe(alternative) for alternative in av[1]):
+        return False
+    elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+      direction, sub = av
+      if direction < 0 or not _bytes_safe(sub):
+        return False
+    elif op in REPEATS:
+      min_count, max_count, item = av
+      wide_ok = min_count <= 1 and max_count == sre_parse.MAXREPEAT
+      if not _bytes_safe(item, wide_ok and len(item) == 1):
+        return False
+    elif op is sre_parse.GROUPREF:
+      continue
+    else:
+      return False
+  return True
+
+
+class DispatchTable:
+  """Maps the character at the cursor to the rules that can match there.
+
+  Each entry keeps the rules in their original priority order, so trying the
+  candidates in turn gives the same result as walking every rule. When every
+  rule's first characters are known, ``skip`` is a character class of them
+  all: searching it finds the next position where any rule can match.
+  """
+  table: Dict[str, Tuple[Rule, ...]]
+  fallback: Tuple[Rule, ...]
+  skip: Optional[Pattern]
+
+  def __init__(self, rules: Dict[Pattern, Any], firsts: Optional[List[Optional[FrozenSet[str]]]] = None):
+    items = list(rules.items())
+    if firsts is None:
+      firsts = [first_chars(pattern) for pattern, _ in items]
+    keys: Set[str] = set()
+    for chars in firsts:
+      if chars is not None:
+        keys |= chars
+
+    self.table = {
+      key: tuple(
+        rule
+        for rule, chars in zip(items, firsts)
+        if chars is None or key in chars
+      )
+      for key in keys
+    }
+    self.fallback = tuple(
+      rule
+      for rule, chars in zip(items, firsts)
+      if chars is None
+    )
+    self.skip = None
+    if not self.fallback:
+      # no rule at all: a class that never matches
+      self.skip = re.compile('[{}]'.format(''.join(map(re.escape, sorted(keys)))) if keys else r'(?!)')
+
+  def candidates(self, char: str) -> Tuple[Rule, ...]:
+    return self.table.get(char, self.fallback)
+
+  def encode(self, patterns: Dict[Pattern, Pattern]) -> 'DispatchTable':
+    """The same table for matching bytes.
+
+    Keys become byte values, as indexing ``bytes`` gives, and every pattern
+    is replaced by ``patterns[pattern]``. There is no ``skip``.
+    """
+    def rules(candidates):
+      return tuple((patterns[pattern], tokenizer) for pattern, tokenizer in candidates)
+
+    table = DispatchTable.__new__(DispatchTable)
+    table.table = {
+      ord(char): rules(candidates)
+      for char, candidates in self.table.items()
+      if ord(char) < 0x80
+    }
+    table.fallback = rules(self.fallback)
+    table.skip = None
+    return table
@@ -1,16 +1,41 @@
-from typing import List
+from typing import Dict, Iterable, List
 
 from asagami.token import BlockToken
 
 
 class Document:
-  def __init__(self, metadata: 'DocumentMetaData', blocks: List[BlockToken]):
-    pass
+  def __init__(self, metadata: 'DocumentMetaData', blocks: Iterable[BlockToken]):
+    self.metadata = metadata
+    self.blocks = blocks
 
 
 class DocumentMetaData:
+  """Header values in the order they were given; names may repeat."""
+  values: Dict[str, List[str]]
+
+  def __init__(self):
+    self.values = {}
+
   def register(self, name: str, value: str):
-    pass
+    self.values.setdefault(name, []).append(value)
+
+  def get(self, name: str) -> List[str]:
+    return self.values.get(name, [])
+
+  @property
+  def modules(self) -> List[str]:
+    """Names given by ``::usemodule:``, as ``name`` or ``[name, name]``.
+
+    Either form is read as an attribute list, see ``parse_attribute_value``.
+    """
+    from asagami.parser import parse_attribute_value
+    names = []
+    for value in self.get('usemodule'):
+      value = value.strip()
+      if not (value.startswith('[') and value.endswith(']')):
+        value = '[{}]'.format(value)
+      names.extend(name for name in parse_attribute_value(value) if name)
+    return names
 
 
 class DocumentEnvironment:
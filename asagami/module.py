@@ -1,4 +1,4 @@
-from typing import Any, Callable, List, Match, Optional, Pattern
+from typing import TYPE_CHECKING, Any, Callable, List, Match, Optional, Pattern
 
 import abc
 
@@ -8,11 +8,16 @@ from .token import (
   InlineToken,
 )
 
+if TYPE_CHECKING:
+  from .render import HtmlWriter
+
+# a block tokenizer may return ``None`` for text that makes no token, such
+# as blank lines between blocks
 BlockTokenizer = Callable[
   [
     Match,
   ],
-  BlockToken,
+  Optional[BlockToken],
 ]
 InlineTokenizer = Callable[
   [
@@ -38,6 +43,14 @@ InlineTransformer = Callable[
 ]
 
 
+def dedent_block_body(body: str) -> str:
+  """Strip the leading newline and 4-space indentation of a block body."""
+  return '\n'.join(
+    line[4:]
+    for line in body.lstrip('\n').split('\n')
+  )
+
+
 class Module(metaclass=abc.ABCMeta):
   @abc.abstractmethod
   def get_name(self) -> str:
@@ -65,6 +78,10 @@ class BlockType(metaclass=abc.ABCMeta):
   def get_patterns(self) -> List[Pattern]:
     pass
 
+  def get_fallback_patterns(self) -> List[Pattern]:
+    """Patterns tried after every other rule, for text no block takes."""
+    return []
+
   def get_tokenizer(self) -> BlockTokenizer:
     return self.tokenizer
 
@@ -75,6 +92,10 @@ class BlockType(metaclass=abc.ABCMeta):
   def get_transformer(self) -> Optional[BlockTransformer]:
     return None
 
+  def get_inline_body(self, token: BlockToken) -> Optional[str]:
+    """Text of ``token`` to parse for inline markup, ``None`` to keep it raw."""
+    return dedent_block_body(token.body)
+
 
 class InlineType(metaclass=abc.ABCMeta):
   @abc.abstractmethod
@@ -97,6 +118,12 @@ class InlineType(metaclass=abc.ABCMeta):
 
 
 class BlockRenderer(metaclass=abc.ABCMeta):
+  # output may be cached by block name, attributes and body: bump ``version``
+  # when it changes through code outside the class, and clear ``cacheable``
+  # if it depends on anything else, such as ``env``
+  version = 1
+  cacheable = True
+
   @abc.abstractmethod
   def get_name(self):
     pass
@@ -104,8 +131,15 @@ class BlockRenderer(metaclass=abc.ABCMeta):
   def render_html(self, token: BlockToken, env: DocumentEnvironment) -> Any:
     pass
 
+  def write_html(self, token: BlockToken, env: DocumentEnvironment, out: 'HtmlWriter'):
+    """Streaming ``render_html``: pass the output to ``out.write`` in chunks."""
+    out.write(self.render_html(token, env))
+
 
 class InlineRenderer(metaclass=abc.ABCMeta):
+  # part of the cache key of every block, see ``BlockRenderer``
+  version = 1
+
   @abc.abstractmethod
   def get_name(self):
     pass
@@ -113,3 +147,7 @@ class InlineRenderer(metaclass=abc.ABCMeta):
   def render_html(self, token: InlineToken, env: DocumentEnvironment) -> Any:
     pass
 
+  def write_html(self, token: InlineToken, env: DocumentEnvironment, out: 'HtmlWriter'):
+    """Streaming ``render_html``: pass the output to ``out.write`` in chunks."""
+    out.write(self.render_html(token, env))
+
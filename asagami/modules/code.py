@@ -1,6 +1,12 @@
-from typing import Match
+from typing import Dict, Iterable, Iterator, List, Match, Optional, Pattern, Tuple, Union
 
+import hashlib
+import html
+import os
 import re
+import tempfile
+import threading
+from collections import OrderedDict
 
 from asagami.document import DocumentEnvironment
 from asagami.module import (
@@ -11,12 +17,443 @@ from asagami.module import (
   Module,
 )
 from asagami.token import (
+  EMPTY_ATTRIBUTES,
   BlockToken,
   InlineToken,
 )
 
 name = 'code'
 
+_backticks = {str: re.compile(r'`+'), bytes: re.compile(rb'`+')}
+_closing_fences: Dict[Tuple[int, type], Pattern] = {}
+
+
+def _closing_fence(length: int, kind: type = str) -> Pattern:
+  # only a newline can start a candidate and backticks cannot be traded for
+  # blanks, so searching is linear in the text scanned
+  pattern = _closing_fences.get((length, kind))
+  if pattern is None:
+    source = r'\n`{%d,}[ \t]*(?:\n|\Z)' % length
+    pattern = _closing_fences[length, kind] = re.compile(
+      source if kind is str else source.encode('ascii'),
+    )
+  return pattern
+
+
+class FenceMatch:
+  """The subset of ``re.Match`` that block tokenizers use.
+
+  Groups are kept as offsets and sliced when asked for, so the code of a
+  fence is not copied unless a tokenizer reads it.
+  """
+  __slots__ = ('string', 'pos', 'endpos', '_spans')
+
+  def __init__(self, string: str, pos: int, endpos: int, spans: Dict[Union[int, str], Tuple[int, int]]):
+    self.string = string
+    self.pos = pos
+    self.endpos = endpos
+    self._spans = spans
+
+  def __getitem__(self, group):
+    return self.group(group)
+
+  def group(self, group=0):
+    start, end = self._spans[group]
+    return self.string[start:end]
+
+  def groupdict(self) -> Dict[str, str]:
+    return {group: self.group(group) for group in self._spans if group != 0}
+
+  def start(self, group=0) -> int:
+    return self._spans[group][0]
+
+  def end(self, group=0) -> int:
+    return self._spans[group][1]
+
+  def span(self, group=0) -> Tuple[int, int]:
+    return self._spans[group]
+
+
+class FenceMatcher:
+  """Line-based matcher for fenced code, usable as a block pattern.
+
+  A fence opens with three or more backticks followed by the language on the
+  same line, and closes at the first line made of at least as many
+  backticks (trailing blanks allowed); the match includes that line's
+  newline. Neither step can backtrack across lines, so long or unterminated
+  fences cost linear time. ``pattern`` is the opening delimiter, which is
+  what rule dispatch looks at. UTF-8 bytes are matched the same way.
+  """
+  pattern = '```'
+  flags = 0
+  # bump when the matching changes, so cached blocks are not reused
+  version = 1
+  matches_bytes = True
+
+  def match(self, string: str, pos: int = 0, endpos: Optional[int] = None) -> Optional[FenceMatch]:
+    if endpos is None or endpos > len(string):
+      endpos = len(string)
+    kind = str if isinstance(string, str) else bytes
+    opening = _backticks[kind].match(string, pos, endpos)
+    if opening is None or opening.end() - pos < 3:
+      return None
+    lang_end = string.find('\n' if kind is str else b'\n', opening.end(), endpos)
+    if lang_end < 0:
+      return None
+    close = _closing_fence(opening.end() - pos, kind).search(string, lang_end, endpos)
+    if close is None:
+      return None
+    return FenceMatch(string, pos, endpos, {
+      0: (pos, close.end()),
+      'lang': (opening.end(), lang_end),
+      'code': (lang_end, close.start()),
+    })
+
+
+# bump when lexers, schemes or the markup the renderers produce change, so
+# that persisted highlights and rendered blocks are not reused
+HIGHLIGHT_VERSION = 3
+
+_NUMBER = r'\b(?:0[xX][0-9a-fA-F]+|\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)'
+_DOUBLE_QUOTED = r'"(?:[^"\\\n]|\\.)*"'
+_SINGLE_QUOTED = r"'(?:[^'\\\n]|\\.)*'"
+# comments and multi-line strings left open run to the end of the code, so
+# each opener is scanned past once rather than rescanned to the end
+_BLOCK_COMMENT = r'/\*(?:[^*]|\*(?!/))*(?:\*/|\Z)'
+
+
+class Lexer:
+  """Splits code into ``(token type, text)`` pairs in one regex scan.
+
+  ``rules`` are tried in order at each position. A ``name`` rule matches
+  identifiers, which become ``keyword`` or ``builtin`` tokens when listed;
+  text between matches is yielded with type ``None``.
+  """
+
+  def __init__(
+      self,
+      rules: List[Tuple[str, str]],
+      keywords: Iterable[str] = (),
+      builtins: Iterable[str] = (),
+  ):
+    self.pattern = re.compile('|'.join('(?P<{}>{})'.format(kind, source) for kind, source in rules))
+    self.keywords = frozenset(keywords)
+    self.builtins = frozenset(builtins)
+
+  def tokens(self, code: str) -> Iterator[Tuple[Optional[str], str]]:
+    pos = 0
+    for match in self.pattern.finditer(code):
+      start, end = match.span()
+      if start > pos:
+        yield None, code[pos:start]
+      kind = match.lastgroup
+      text = code[start:end]
+      if kind == 'name':
+        kind = 'keyword' if text in self.keywords else 'builtin' if text in self.builtins else None
+      yield kind, text
+      pos = end
+    if pos < len(code):
+      yield None, code[pos:]
+
+
+LEXERS: Dict[str, Lexer] = {
+  'python': Lexer(
+    [
+      ('comment', r'#[^\n]*'),
+      ('string', r'(?:[rRbBuUfF]{1,2})?(?:"""(?:[^\\]|\\[\s\S])*?(?:"""|\\?\Z)|' + r"'''(?:[^\\]|\\[\s\S])*?(?:'''|\\?\Z)|"
+                 + _DOUBLE_QUOTED + '|' + _SINGLE_QUOTED + ')'),
+      ('number', _NUMBER),
+      ('decorator', r'@[A-Za-z_][\w.]*'),
+      ('name', r'[A-Za-z_]\w*'),
+    ],
+    keywords=(
+      'False None True and as assert async await break class continue def del '
+      'elif else except finally for from global if import in is lambda nonlocal '
+      'not or pass raise return try while with yield'
+    ).split(),
+    builtins=(
+      'abs all any bool bytes dict enumerate filter float int isinstance len '
+      'list map max min next object open print range repr set sorted str sum '
+      'super tuple type zip self cls'
+    ).split(),
+  ),
+  'c': Lexer(
+    [
+      ('comment', r'//[^\n]*|' + _BLOCK_COMMENT),
+      ('preproc', r'#[ \t]*[A-Za-z]+'),
+      ('string', _DOUBLE_QUOTED + '|' + _SINGLE_QUOTED),
+      ('number', _NUMBER + r'[uUlLfF]*'),
+      ('name', r'[A-Za-z_]\w*'),
+    ],
+    keywords=(
+      'auto break case const continue default do else enum extern for goto if '
+      'inline register restrict return sizeof static struct switch typedef '
+      'union volatile while'
+    ).split(),
+    builtins=(
+      'char double float int long short signed unsigned void bool size_t NULL'
+    ).split(),
+  ),
+  'javascript': Lexer(
+    [
+      ('comment', r'//[^\n]*|' + _BLOCK_COMMENT),
+      ('string', _DOUBLE_QUOTED + '|' + _SINGLE_QUOTED + r'|`(?:[^`\\]|\\[\s\S])*(?:`|\\?\Z)'),
+      ('number', _NUMBER),
+      ('name', r'[A-Za-z_$][\w$]*'),
+    ],
+    keywords=(
+      'async await break case catch class const continue default delete do '
+      'else export extends false finally for function if import in instanceof '
+      'let new null return super switch this throw true try typeof undefined '
+      'var void while yield'
+    ).split(),
+    builtins=(
+      'Array Boolean Date Error JSON Map Math Number Object Promise RegExp Set '
+      'String console document window'
+    ).split(),
+  ),
+  'shell': Lexer(
+    [
+      ('comment', r'(?<![^\s;])#[^\n]*'),
+      ('string', r"'[^']*'|" + r'"(?:[^"\\]|\\.)*"'),
+      ('variable', r'\$(?:\{[^}\n]*\}|[A-Za-z_]\w*|[0-9@*#?$!-])'),
+      ('number', r'\b\d+\b'),
+      ('name', r'[A-Za-z_][\w-]*'),
+    ],
+    keywords=(
+      'case do done elif else esac fi for function if in local return select '
+      'then until while export readonly'
+    ).split(),
+    builtins=(
+      'alias cd echo eval exec exit printf pwd read set shift source test trap '
+      'unset cat grep sed awk wc ls'
+    ).split(),
+  ),
+  'ruby': Lexer(
+    [
+      ('comment', r'#[^\n]*'),
+      ('string', _DOUBLE_QUOTED + '|' + _SINGLE_QUOTED),
+      ('symbol', r'(?<!:):[A-Za-z_]\w*[?!]?'),
+      ('variable', r'@@?[A-Za-z_]\w*|\$[A-Za-z_]\w*'),
+      ('number', _NUMBER),
+      ('type', r'[A-Z]\w*'),
+      ('name', r'[a-z_]\w*[?!]?'),
+    ],
+    keywords=(
+      'BEGIN END alias and begin break case class def defined? do else elsif '
+      'end ensure false for if in module next nil not or redo rescue retry '
+      'return self super then true undef unless until when while yield'
+    ).split(),
+    builtins=(
+      'attr_accessor attr_reader attr_writer include extend lambda proc puts '
+      'print p require require_relative raise'
+    ).split(),
+  ),
+  'haskell': Lexer(
+    [
+      ('comment', r'--[^\n]*|\{-(?:[^-]|-(?!\}))*(?:-\}|\Z)'),
+      ('string', _DOUBLE_QUOTED + r"|'(?:[^'\\\n]|\\[^'\n]+)'"),
+      ('number', _NUMBER),
+      ('type', r"[A-Z][\w']*"),
+      ('name', r"[a-z_][\w']*"),
+    ],
+    keywords=(
+      'case class data default deriving do else forall if import in infix '
+      'infixl infixr instance let module newtype of qualified then type where'
+    ).split(),
+    builtins=(
+      'map filter foldl foldr head tail length show read print putStrLn '
+      'putStr return mapM_ mapM fmap pure not otherwise'
+    ).split(),
+  ),
+}
+
+LEXER_ALIASES: Dict[str, str] = {
+  'py': 'python',
+  'python3': 'python',
+  'h': 'c',
+  'js': 'javascript',
+  'sh': 'shell',
+  'bash': 'shell',
+  'zsh': 'shell',
+  'rb': 'ruby',
+  'hs': 'haskell',
+}
+
+# token type -> CSS color; without a known scheme tokens get a class instead
+SCHEMES: Dict[str, Dict[str, str]] = {
+  'molokai': {
+    'comment': '#7e8e91',
+    'string': '#e6db74',
+    'number': '#ae81ff',
+    'keyword': '#f92672',
+    'builtin': '#66d9ef',
+    'type': '#66d9ef',
+    'variable': '#fd971f',
+    'symbol': '#ae81ff',
+    'decorator': '#a6e22e',
+    'preproc': '#a6e22e',
+  },
+  'monokai': {
+    'comment': '#75715e',
+    'string': '#e6db74',
+    'number': '#ae81ff',
+    'keyword': '#f92672',
+    'builtin': '#a6e22e',
+    'type': '#66d9ef',
+    'variable': '#fd971f',
+    'symbol': '#ae81ff',
+    'decorator': '#a6e22e',
+    'preproc': '#f92672',
+  },
+  'solarized': {
+    'comment': '#93a1a1',
+    'string': '#2aa198',
+    'number': '#d33682',
+    'keyword': '#859900',
+    'builtin': '#268bd2',
+    'type': '#b58900',
+    'variable': '#cb4b16',
+    'symbol': '#6c71c4',
+    'decorator': '#268bd2',
+    'preproc': '#cb4b16',
+  },
+}
+
+
+def lexer_name(lang: Optional[str]) -> Optional[str]:
+  """The ``LEXERS`` key for a ``lang`` attribute, or ``None``."""
+  if not lang:
+    return None
+  lang = lang.strip().lower()
+  lang = LEXER_ALIASES.get(lang, lang)
+  return lang if lang in LEXERS else None
+
+
+def highlight(code: str, lang: Optional[str], scheme: Optional[str] = None) -> Optional[str]:
+  """Escaped HTML of ``code`` with its tokens in ``<span>``s.
+
+  ``None`` if there is no lexer for ``lang``. With a scheme from
+  ``SCHEMES`` spans carry inline colors, otherwise their token type as class.
+  """
+  lang = lexer_name(lang)
+  if lang is None:
+    return None
+  colors = SCHEMES.get(scheme) if scheme else None
+  out = []
+  for kind, text in LEXERS[lang].tokens(code):
+    text = html.escape(text, quote=False)
+    if kind is None:
+      out.append(text)
+    elif colors is None:
+      out.append('<span class="{}">{}</span>'.format(kind, text))
+    else:
+      out.append('<span style="color:{}">{}</span>'.format(colors.get(kind, 'inherit'), text))
+  return ''.join(out)
+
+
+class HighlightCache:
+  """Bounded LRU of ``highlight`` results, optionally backed by a directory.
+
+  Entries are keyed by a digest of the language, scheme and code (and
+  ``HIGHLIGHT_VERSION``), so a snippet that recurs across documents or
+  builds is highlighted once. Files in ``directory`` are written atomically
+  and never evicted; remove the directory to clear it.
+  """
+  maxsize: int
+  directory: Optional[str]
+  hits: int
+  misses: int
+
+  def __init__(self, maxsize: int = 1024, directory: Optional[str] = None):
+    self.maxsize = maxsize
+    self.directory = directory
+    self.hits = 0
+    self.misses = 0
+    self._entries: 'OrderedDict[str, str]' = OrderedDict()
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def key(code: str, lang: str, scheme: Optional[str] = None) -> str:
+    digest = hashlib.sha256(repr((HIGHLIGHT_VERSION, lang, scheme)).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(code.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+  def _path(self, key: str) -> str:
+    return os.path.join(self.directory, key[:2], key + '.html')
+
+  def highlight(self, code: str, lang: Optional[str], scheme: Optional[str] = None) -> Optional[str]:
+    """``highlight`` that reads and fills the cache."""
+    lang = lexer_name(lang)
+    if lang is None:
+      return None
+    key = self.key(code, lang, scheme)
+    with self._lock:
+      result = self._entries.get(key)
+      if result is not None:
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return result
+
+    result = self._read(key)
+    if result is not None:
+      self.hits += 1
+    else:
+      self.misses += 1
+      result = highlight(code, lang, scheme)
+      self._write(key, result)
+    with self._lock:
+      self._entries[key] = result
+      if len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+    return result
+
+  def _read(self, key: str) -> Optional[str]:
+    if self.directory is None:
+      return None
+    try:
+      with open(self._path(key), encoding='utf-8') as f:
+        return f.read()
+    except (OSError, UnicodeDecodeError):
+      return None
+
+  def _write(self, key: str, result: str):
+    if self.directory is None:
+      return
+    path = self._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(result)
+      os.replace(tmp, path)
+    except BaseException:
+      os.remove(tmp)
+      raise
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+
+# shared by renderers created without a cache of their own
+highlight_cache = HighlightCache()
+
+
+def _open_tag(attributes) -> str:
+  return '<code class="language-{}">'.format(html.escape(lexer_name(attributes['lang'])))
+
+
+def _highlighted(cache: Optional[HighlightCache], code: str, attributes) -> Optional[str]:
+  lang = attributes.get('lang')
+  if not isinstance(lang, str):
+    return None
+  scheme = attributes.get('scheme')
+  if not isinstance(scheme, str):
+    scheme = None
+  return (cache if cache is not None else highlight_cache).highlight(code, lang, scheme)
+
 
 class CodeModule(Module):
   def get_name(self):
@@ -44,13 +481,16 @@ class CodeBlockType(BlockType):
     return name
 
   def get_patterns(self):
-    return [re.compile(r"```(?P<lang>[^\n]*)(?=\n)(?P<code>(\n.*(?!```))*)\n```")]
+    return [FenceMatcher()]
 
   def get_tokenizer(self):
-    return self._tokenizer
+    return self.tokenizer
+
+  def get_inline_body(self, token: BlockToken):
+    return None
 
   @staticmethod
-  def _tokenizer(match: Match) -> BlockToken:
+  def tokenizer(match: Match) -> BlockToken:
     attributes = {'lang': match['lang']}
     code = match['code']
     return BlockToken(
@@ -68,24 +508,56 @@ class CodeInlineType(InlineType):
     return [re.compile(r"`(?P<code>([^`]*))`")]
 
   def get_tokenizer(self):
-    return self._tokenizer
+    return self.tokenizer
 
   @staticmethod
-  def _tokenizer(match: Match) -> InlineToken:
-    attributes = {'lang': match['lang']}
+  def tokenizer(match: Match) -> InlineToken:
     code = match['code']
     return InlineToken(
       name=name,
-      attributes=attributes,
+      attributes=EMPTY_ATTRIBUTES,
       value=code,
     )
 
 
 class CodeBlockRenderer(BlockRenderer):
+  """``<code>``, with the body highlighted when ``lang`` has a lexer."""
+  version = HIGHLIGHT_VERSION
+
+  def __init__(self, cache: Optional[HighlightCache] = None):
+    self.cache = cache
+
+  def get_name(self):
+    return name
+
   def render_html(self, token: BlockToken, env: DocumentEnvironment):
-    return f'<code>{token.body}</code>'
+    code = _highlighted(self.cache, token.body, token.attributes)
+    if code is None:
+      return '<code>{}</code>'.format(html.escape(token.body, quote=False))
+    return _open_tag(token.attributes) + code + '</code>'
+
+  def write_html(self, token: BlockToken, env: DocumentEnvironment, out):
+    code = _highlighted(self.cache, token.body, token.attributes)
+    if code is None:
+      out.write('<code>')
+      out.write(html.escape(token.body, quote=False))
+    else:
+      out.write(_open_tag(token.attributes))
+      out.write(code)
+    out.write('</code>')
 
 
 class CodeInlineRenderer(InlineRenderer):
+  version = HIGHLIGHT_VERSION
+
+  def __init__(self, cache: Optional[HighlightCache] = None):
+    self.cache = cache
+
+  def get_name(self):
+    return name
+
   def render_html(self, token: InlineToken, env: DocumentEnvironment):
-    return f'<code>{token.value}</code>'
+    code = _highlighted(self.cache, token.value, token.attributes)
+    if code is None:
+      return '<code>{}</code>'.format(html.escape(token.value, quote=False))
+    return _open_tag(token.attributes) + code + '</code>'
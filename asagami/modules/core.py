@@ -1,10 +1,12 @@
 from typing import Match
 
+import html
 import re
 
 from asagami.document import DocumentEnvironment
 from asagami.module import InlineRenderer, InlineType, Module
 from asagami.token import (
+  EMPTY_ATTRIBUTES,
   InlineToken,
 )
 
@@ -35,7 +37,7 @@ class BoldInlineType(InlineType):
     return InlineToken(
       name='bold',
       value=match['value'],
-      attributes={},
+      attributes=EMPTY_ATTRIBUTES,
     )
 
 
@@ -44,7 +46,7 @@ class BoldInlineRenderer(InlineRenderer):
     return 'bold'
 
   def render_html(self, token: InlineToken, env: DocumentEnvironment):
-    return f'<b>{token.value}</b>'
+    return f'<b>{html.escape(token.value, quote=False)}</b>'
 
 
 class ItalicModule(Module):
@@ -73,7 +75,7 @@ class ItalicInlineType(InlineType):
     return InlineToken(
       name='italic',
       value=match['value'],
-      attributes={},
+      attributes=EMPTY_ATTRIBUTES,
     )
 
 
@@ -82,7 +84,7 @@ class ItalicInlineRenderer(InlineRenderer):
     return 'italic'
 
   def render_html(self, token: InlineToken, env: DocumentEnvironment):
-    return f'<i>{token.value}</i>'
+    return f'<i>{html.escape(token.value, quote=False)}</i>'
 
 
 class UnderlineModule(Module):
@@ -111,7 +113,7 @@ class UnderlineInlineType(InlineType):
     return InlineToken(
       name='underline',
       value=match['value'],
-      attributes={},
+      attributes=EMPTY_ATTRIBUTES,
     )
 
 
@@ -120,7 +122,7 @@ class UnderlineInlineRenderer(InlineRenderer):
     return 'underline'
 
   def render_html(self, token: InlineToken, env: DocumentEnvironment):
-    return f'<u>{token.value}</u>'
+    return f'<u>{html.escape(token.value, quote=False)}</u>'
 
 
 class LinkModule(Module):
@@ -160,5 +162,5 @@ class UrlLinkInlineRenderer(InlineRenderer):
     return 'link'
 
   def render_html(self, token: InlineToken, env: DocumentEnvironment):
-    href = token.attributes["href"]
-    return f'<a href="{href}">{token.value}</a>'
+    href = html.escape(token.attributes['href'], quote=True)
+    return f'<a href="{href}">{html.escape(token.value, quote=False)}</a>'
@@ -0,0 +1,86 @@
+from typing import Match, Optional
+
+import html
+import io
+import re
+
+from asagami.document import DocumentEnvironment
+from asagami.module import BlockRenderer, BlockType, Module, dedent_block_body
+from asagami.token import (
+  EMPTY_ATTRIBUTES,
+  BlockToken,
+)
+
+name = 'paragraph'
+
+
+class ParagraphModule(Module):
+  """Plain text between blocks; list it last, it matches any other line."""
+
+  def get_name(self):
+    return name
+
+  def get_block_types(self):
+    return [ParagraphBlockType()]
+
+  def get_block_renderer(self):
+    return [ParagraphBlockRenderer()]
+
+
+class ParagraphBlockType(BlockType):
+  def get_name(self):
+    return name
+
+  def get_patterns(self):
+    # blank lines, or lines up to a blank line, a `..` block or a fence
+    return [re.compile(r'\n+|(?P<body>(?!\.\.)(?!```)[^\n]+(?:\n(?!\.\.)(?!```)[^\n]+)*)\n*')]
+
+  def get_fallback_patterns(self):
+    # a `..` or fence line that no block took, e.g. an unknown name or an
+    # unterminated fence
+    return [re.compile(r'(?P<body>[^\n]+)\n*')]
+
+  def get_tokenizer(self):
+    return self.tokenizer
+
+  def get_inline_body(self, token: BlockToken):
+    if token.body.startswith('\n'):  # written as `.. paragraph`
+      return dedent_block_body(token.body)
+    return token.body
+
+  @staticmethod
+  def tokenizer(match: Match) -> Optional[BlockToken]:
+    body = match['body']
+    if body is None:
+      return None
+    return BlockToken(
+      name=name,
+      body=body,
+      attributes=EMPTY_ATTRIBUTES,
+    )
+
+
+class ParagraphBlockRenderer(BlockRenderer):
+  _engine = None
+
+  def get_name(self):
+    return name
+
+  def render_html(self, token: BlockToken, env: DocumentEnvironment):
+    """``write_html`` to a string; children get the built-in inline renderers."""
+    from asagami.batch import default_modules
+    from asagami.render import HtmlRenderEngine, HtmlWriter
+    if self._engine is None:
+      self._engine = HtmlRenderEngine(default_modules())
+    out = io.StringIO()
+    self.write_html(token, env, HtmlWriter(self._engine, env, out.write))
+    return out.getvalue()
+
+  def write_html(self, token: BlockToken, env: DocumentEnvironment, out):
+    out.write('<p>')
+    children = token.children
+    if children is None:
+      out.write(html.escape(token.body, quote=False))
+    else:
+      out.write_inline(children)
+    out.write('</p>')
@@ -0,0 +1,299 @@
+from typing import Any, Dict, FrozenSet, List, Optional, Pattern, Set, Tuple
+
+import copy
+import json
+import os
+import re
+import tempfile
+import weakref
+from collections import OrderedDict
+
+from .dispatch import REPEATS, DispatchTable, in_chars, sre_parse
+from .parser import BlockParser, InlineParser
+from .profiling import ParseProfile
+
+VERSION = 1
+
+# A transition accepts the characters in the set, or all but them.
+Label = Tuple[bool, FrozenSet[str]]
+_ANY: Label = (False, frozenset())
+_MAX_UNROLL = 32
+_MAX_PAIRS = 20000
+
+
+class _Nfa:
+  """Thompson automaton of a pattern, over-approximating what it matches.
+
+  Constructs that cannot be followed (flags, back references, ...) lead to
+  the accepting state, i.e. "anything may follow". Assertions are skipped,
+  except that a negative lookahead of a literal is kept on its state.
+  """
+
+  def __init__(self, pattern: Pattern):
+    self.edges: List[List[Tuple[Label, int]]] = []
+    self.epsilons: List[List[int]] = []
+    self.forbidden: Dict[int, str] = {}
+    self.accept = self._state()
+    self.start = self._state()
+    source = getattr(pattern, 'pattern', None)
+    try:
+      if not isinstance(source, str) or pattern.flags & re.IGNORECASE:
+        raise ValueError(source)
+      items = sre_parse.parse(source, pattern.flags)
+    except (sre_parse.error, TypeError, ValueError):
+      self.epsilons[self.start].append(self.accept)
+      return
+    self.epsilons[self._build(items, self.start)].append(self.accept)
+
+  def _state(self) -> int:
+    self.edges.append([])
+    self.epsilons.append([])
+    return len(self.edges) - 1
+
+  def _edge(self, start: int, label: Label) -> int:
+    end = self._state()
+    self.edges[start].append((label, end))
+    return end
+
+  def _build(self, items, state: int) -> int:
+    for op, av in items:
+      state = self._build_one(op, av, state)
+    return state
+
+  def _build_one(self, op, av, state: int) -> int:
+    if op is sre_parse.ASSERT_NOT:
+      direction, item = av
+      if direction == 1 and item and all(o is sre_parse.LITERAL for o, _ in item):
+        guarded = self._state()
+        self.epsilons[state].append(guarded)
+        self.forbidden[guarded] = ''.join(chr(c) for _, c in item)
+        return guarded
+      return state
+    elif op in (sre_parse.AT, sre_parse.ASSERT):
+      return state
+    elif op is sre_parse.LITERAL:
+      return self._edge(state, (True, frozenset(chr(av))))
+    elif op is sre_parse.NOT_LITERAL:
+      return self._edge(state, (False, frozenset(chr(av))))
+    elif op is sre_parse.ANY:
+      return self._edge(state, _ANY)
+    elif op is sre_parse.IN:
+      return self._edge(state, _in_label(av))
+    elif op is sre_parse.SUBPATTERN and not av[1] & re.IGNORECASE:
+      return self._build(av[-1], state)
+    elif op is sre_parse.BRANCH:
+      end = self._state()
+      for alternative in av[1]:
+        self.epsilons[self._build(alternative, state)].append(end)
+      return end
+    elif op in REPEATS and av[0] <= _MAX_UNROLL:
+      min_count, max_count, item = av
+      for _ in range(min_count):
+        state = self._build(item, state)
+      if max_count - min_count > _MAX_UNROLL:
+        loop = self._state()
+        self.epsilons[state].append(loop)
+        self.epsilons[self._build(item, loop)].append(loop)
+        return loop
+      end = self._state()
+      for _ in range(max_count - min_count):
+        self.epsilons[state].append(end)
+        state = self._build(item, state)
+      self.epsilons[state].append(end)
+      return end
+    self.epsilons[state].append(self.accept)
+    return self._state()
+
+  def must_read(self, state: int, literal: str) -> bool:
+    """Whether every match going on from ``state`` reads ``literal`` next."""
+    states = self.closure(state)
+    for char in literal:
+      following = set()
+      for current in states:
+        if current == self.accept:
+          return False
+        for (positive, chars), target in self.edges[current]:
+          if not positive or not chars <= {char}:
+            return False
+          following |= self.closure(target)
+      states = following
+    return True
+
+  def closure(self, state: int) -> Set[int]:
+    states = {state}
+    stack = [state]
+    while stack:
+      for target in self.epsilons[stack.pop()]:
+        if target not in states:
+          states.add(target)
+          stack.append(target)
+    return states
+
+
+def _in_label(items) -> Label:
+  if items and items[0][0] is sre_parse.NEGATE:
+    chars = in_chars(items[1:])
+    return (False, frozenset(chars)) if chars is not None else _ANY
+  chars = in_chars(items)
+  return (True, frozenset(chars)) if chars is not None else _ANY
+
+
+def _intersects(first: Label, second: Label) -> bool:
+  first_positive, first_chars = first
+  second_positive, second_chars = second
+  if first_positive and second_positive:
+    return not first_chars.isdisjoint(second_chars)
+  elif first_positive:
+    return not first_chars <= second_chars
+  elif second_positive:
+    return not second_chars <= first_chars
+  return True
+
+
+def may_overlap(first: Pattern, second: Pattern) -> bool:
+  """Whether both patterns might match at the same position of some text.
+
+  Walks both automata on the same characters until one of them could end
+  its match while the other is still alive. ``False`` is certain: the two
+  rules can be tried in either order without changing any result.
+  """
+  return _overlap(_Nfa(first), _Nfa(second))
+
+
+def _overlap(a: _Nfa, b: _Nfa) -> bool:
+  seen = set()
+  stack = [(a.start, b.start)]
+  while stack:
+    pair = stack.pop()
+    if pair in seen:
+      continue
+    seen.add(pair)
+    if len(seen) > _MAX_PAIRS:
+      return True
+    x, y = pair
+    if x in a.forbidden and b.must_read(y, a.forbidden[x]):
+      continue
+    if y in b.forbidden and a.must_read(x, b.forbidden[y]):
+      continue
+    if x == a.accept or y == b.accept:
+      return True
+    stack.extend((x2, y) for x2 in a.epsilons[x])
+    stack.extend((x, y2) for y2 in b.epsilons[y])
+    for x_label, x_target in a.edges[x]:
+      for y_label, y_target in b.edges[y]:
+        if _intersects(x_label, y_label):
+          stack.append((x_target, y_target))
+  return False
+
+
+def order_rules(rules: Dict[Pattern, Any], hits: Dict[str, int]) -> 'OrderedDict[Pattern, Any]':
+  """Reorder ``rules`` so the ones hit most often are tried first.
+
+  ``hits`` maps pattern sources to counts. A rule only moves ahead of rules
+  it cannot overlap with, so the first rule that matches anywhere is the
+  same as before and so is every parse result. A frequent rule held back by
+  rarer ones it overlaps pulls them forward with it, whenever the group
+  still has the most hits per rule.
+  """
+  items = list(rules.items())
+  automata = [_Nfa(pattern) for pattern, _ in items]
+  counts = [hits.get(str(pattern.pattern), 0) for pattern, _ in items]
+  # every earlier rule a rule must stay behind, directly or through others
+  ancestors: List[Set[int]] = []
+  for j in range(len(items)):
+    blockers = {i for i in range(j) if _overlap(automata[i], automata[j])}
+    ancestors.append(blockers.union(*(ancestors[i] for i in blockers)))
+
+  order: List[int] = []
+  placed: Set[int] = set()
+  while len(placed) < len(items):
+    best = None
+    for j in range(len(items)):
+      if j in placed:
+        continue
+      group = (ancestors[j] - placed) | {j}
+      density = sum(counts[i] for i in group) / len(group)
+      if best is None or density > best[0]:
+        best = (density, group)
+    for i in sorted(best[1]):
+      order.append(i)
+      placed.add(i)
+  return OrderedDict(items[i] for i in order)
+
+
+class RuleOrdering:
+  """Hit counts per rule pattern, for trying frequent rules first.
+
+  Counts come from a ``ParseProfile`` of a warm-up corpus, or from a file
+  saved by an earlier run. ``apply`` returns a copy of a parser whose rules
+  are reordered with ``order_rules``; rules that may match the same text
+  keep their order, so documents parse exactly as before.
+  """
+  block_hits: Dict[str, int]
+  inline_hits: Dict[str, int]
+
+  def __init__(
+      self,
+      block_hits: Optional[Dict[str, int]] = None,
+      inline_hits: Optional[Dict[str, int]] = None,
+  ):
+    self.block_hits = dict(block_hits or {})
+    self.inline_hits = dict(inline_hits or {})
+    # an ordered copy is kept only as long as the parser it was made from
+    self._applied: 'weakref.WeakKeyDictionary[Any, Any]' = weakref.WeakKeyDictionary()
+
+  @classmethod
+  def from_profile(cls, profile: ParseProfile) -> 'RuleOrdering':
+    ordering = cls()
+    ordering.update(profile)
+    return ordering
+
+  def update(self, profile: ParseProfile):
+    """Add the hits counted by ``profile``."""
+    for stats in profile.stats.values():
+      hits = self.block_hits if stats.kind == 'block' else self.inline_hits
+      hits[stats.pattern] = hits.get(stats.pattern, 0) + stats.hits
+    self._applied.clear()
+
+  @classmethod
+  def load(cls, path: str) -> 'RuleOrdering':
+    with open(path, encoding='utf-8') as f:
+      data = json.load(f)
+    if data.get('version') != VERSION:
+      raise ValueError('unsupported rule ordering version: {}'.format(repr(data.get('version'))))
+    return cls(data['block'], data['inline'])
+
+  def save(self, path: str):
+    data = {'version': VERSION, 'block': self.block_hits, 'inline': self.inline_hits}
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+      os.replace(tmp, path)
+    except BaseException:
+      os.remove(tmp)
+      raise
+
+  def apply_inline_parser(self, inline_parser: InlineParser) -> InlineParser:
+    applied = self._applied.get(inline_parser)
+    if applied is not None:
+      return applied
+    ordered = copy.copy(inline_parser)
+    ordered.rules = order_rules(inline_parser.rules, self.inline_hits)
+    ordered.dispatch = DispatchTable(ordered.rules)
+    self._applied[inline_parser] = ordered
+    return ordered
+
+  def apply(self, block_parser: BlockParser) -> BlockParser:
+    applied = self._applied.get(block_parser)
+    if applied is not None:
+      return applied
+    ordered = copy.copy(block_parser)
+    ordered.rules = order_rules(block_parser.rules, self.block_hits)
+    ordered.dispatch = DispatchTable(ordered.rules) if block_parser.dispatch is not None else None
+    if block_parser.inline_parser is not None:
+      ordered.inline_parser = self.apply_inline_parser(block_parser.inline_parser)
+    # same results, so cached parses stay valid
+    ordered._fingerprint = block_parser.fingerprint()
+    self._applied[block_parser] = ordered
+    return ordered
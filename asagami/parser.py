@@ -1,28 +1,203 @@
-from typing import Dict, List, Match, Optional, Pattern, Set, Tuple
+from typing import (
+  Any,
+  Callable,
+  Dict,
+  FrozenSet,
+  Hashable,
+  IO,
+  Iterable,
+  Iterator,
+  List,
+  Match,
+  Optional,
+  Pattern,
+  Tuple,
+  Union,
+)
 
+import asyncio
+import bisect
+import copy
+import functools
+import hashlib
+import io
+import itertools
+import mmap
+import os
 import re
-from collections import OrderedDict
+import threading
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
 
+from .digest import code_digest
+from .dispatch import DispatchTable, bytes_pattern
 from .document import Document, DocumentMetaData
 from .module import BlockTokenizer, BlockType, InlineTokenizer, InlineType
-from .token import BlockToken, InlineToken, TokenAttributes
+from .token import (
+  EMPTY_ATTRIBUTES,
+  SPAN_GROUPS,
+  TEXT_TOKEN_NAME,
+  BlockToken,
+  Buffer,
+  InlineToken,
+  TextSpan,
+  TokenAttributes,
+)
 
 BlockGrammarRules = Dict[Pattern, BlockTokenizer]
 InlineGrammarRules = Dict[Pattern, InlineTokenizer]
 
+# how block bodies are inline-parsed: on first access to ``children``, while
+# parsing blocks, or not at all
+INLINE_LAZY = 'lazy'
+INLINE_EAGER = 'eager'
+INLINE_NONE = 'none'
+
+
+def unanchor_pattern(pattern: Pattern) -> Pattern:
+  """Drop a leading ``^`` so the pattern can be matched at an offset.
+
+  The parsers call ``pattern.match(text, pos)`` on one buffer, and ``^`` only
+  matches at the real start of the string there. ``match`` is anchored at
+  ``pos`` already, so the leading ``^`` carries no meaning of its own.
+  """
+  source = pattern.pattern
+  caret = '^' if isinstance(source, str) else b'^'
+  if not source.startswith(caret):
+    return pattern
+  return re.compile(source[1:], pattern.flags)
+
+
+def _content_end(text: Union[str, Buffer]) -> int:
+  """``len(text.rstrip('\n'))`` without copying ``text``."""
+  newline = '\n' if isinstance(text, str) else ord('\n')
+  end = len(text)
+  while end and text[end - 1] == newline:
+    end -= 1
+  return end
+
+
+class SpanMatch:
+  """Match wrapper for span-mode parsing.
+
+  The ``SPAN_GROUPS`` are returned as ``TextSpan``s into the parsed text
+  instead of copies; every other group is returned as usual, decoded from
+  UTF-8 when the text is bytes.
+  """
+  __slots__ = ('match',)
+
+  def __init__(self, match: Match):
+    self.match = match
+
+  def __getitem__(self, group):
+    return self.group(group)
+
+  def group(self, group=0):
+    if group in SPAN_GROUPS:
+      start, end = self.match.span(group)
+      if start < 0:
+        return None
+      return TextSpan(self.match.string, start, end)
+    value = self.match.group(group)
+    if value is None or isinstance(value, str):
+      return value
+    return str(value, 'utf-8')
+
+  def groupdict(self) -> Dict[str, Any]:
+    return {group: self.group(group) for group in self.match.groupdict()}
+
+  def start(self, group=0) -> int:
+    return self.match.start(group)
+
+  def end(self, group=0) -> int:
+    return self.match.end(group)
+
+  def span(self, group=0) -> Tuple[int, int]:
+    return self.match.span(group)
+
+
+def gen_name_alternation(names: Iterable[str]) -> str:
+  return '(?P<name>' + '|'.join('(?:{})'.format(name) for name in names) + ')'
+
+
+# distinct attribute texts whose parsed mappings are kept per grammar pattern
+ATTRIBUTE_CACHE_SIZE = 4096
+
+# quotes only delimit an item they start; `it's` is a plain item
+_attribute_item_pattern = re.compile(r' *(?P<item>"[^"]*"|\'[^\']*\'|[^,]*) *(?:,|\Z)')
+
+
+def _unquote(value: str) -> str:
+  if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+    return value[1:-1]
+  return value
+
+
+def parse_attribute_value(value: str) -> Union[str, Tuple[str, ...]]:
+  """``"text"``, ``'text'`` or ``text`` as a str, ``[a, "b, c"]`` as a tuple."""
+  if len(value) < 2 or value[0] != '[' or value[-1] != ']':
+    return _unquote(value)
+  items = []
+  pos, end = 1, len(value) - 1
+  while pos < end:
+    result = _attribute_item_pattern.match(value, pos, end)
+    if result is None:
+      raise RuntimeError('invalid attribute value: {}'.format(repr(value)))
+    items.append(_unquote(result['item'].rstrip(' ')))
+    pos = result.end()
+  return tuple(items)
+
+
+@functools.lru_cache(maxsize=ATTRIBUTE_CACHE_SIZE)
+def _parse_block_attributes(pattern: Pattern, attribute_text: str) -> TokenAttributes:
+  attributes = OrderedDict()
+  pos, end = 0, len(attribute_text)
+  while True:
+    while pos < end and attribute_text[pos] == '\n':
+      pos += 1
+    if pos == end:
+      break
+    result = pattern.match(attribute_text, pos)
+    if result is None:
+      raise RuntimeError('invalid attributes text: {}'.format(repr(attribute_text[pos:])))
+    attributes[result['name']] = parse_attribute_value(result['value'])
+    pos = result.end()
+  return MappingProxyType(attributes) if attributes else EMPTY_ATTRIBUTES
+
+
+@functools.lru_cache(maxsize=ATTRIBUTE_CACHE_SIZE)
+def _parse_inline_attributes(pattern: Pattern, attribute_text: str) -> TokenAttributes:
+  assert attribute_text.startswith('{')
+  assert attribute_text.endswith('}')
+  attributes = OrderedDict()
+  pos, end = 1, len(attribute_text) - 1
+  while pos < end:
+    result = pattern.match(attribute_text, pos, end)
+    if result is None:
+      raise RuntimeError('invalid attributes text: {}'.format(repr(attribute_text[pos:end])))
+    attributes[result['name']] = parse_attribute_value(result['value'].rstrip(' '))
+    pos = result.end()
+  return MappingProxyType(attributes) if attributes else EMPTY_ATTRIBUTES
+
 
 class Grammar:
+  # bump when tokens change in ways the patterns below do not show
+  version = 2
+
   block_attribute_pattern = re.compile(
     r'^ {4}\.\. *(?P<name>[a-zA-Z0-9_]+) *: *(?P<value>.+?) *$',
     re.MULTILINE,
   )
 
+  # ``name=value`` or ``name:value``; quoted values and lists may hold
+  # commas, and quotes or brackets only delimit a value they start
   inline_attribute_pattern = re.compile(
-    r'^(?P<name>[a-zA-Z0-9_]+) *= *(?P<value>[^,]+),?',
+    r' *(?P<name>[a-zA-Z0-9_]+) *[=:] *'
+    r'(?P<value>"[^"]*"|\'[^\']*\'|\[[^\]]*\]|[^,]*) *(?:,|\Z)'
   )
 
   metadata_pattern = re.compile(
-    r'r^::(?P<name>[a-zA-Z0-9_]+) *: *(?P<value>.*)$',
+    r'^::(?P<name>[a-zA-Z0-9_]+) *: *(?P<value>.*)$',
     re.MULTILINE,
   )
 
@@ -35,44 +210,37 @@ class Grammar:
     return pattern
 
   def gen_inline_pattern(self, name):
+    # braces cannot nest, so a match attempt ends at the next '{' and
+    # scanning text full of unclosed ':name:{' stays linear
     pattern: Pattern = re.compile(
       r'^:'
       + f'{name}'
-      + r'(?P<attributes>(\{[^\}]*\})?):'
-      + '\{(?P<value>[^\}]*)\}'
+      + r'(?P<attributes>(\{[^{}]*\})?):'
+      + r'\{(?P<value>[^{}]*)\}'
     )
     return pattern
 
   def parse_block_attributes(self, attribute_text: str) -> TokenAttributes:
-    attributes = OrderedDict()
-    attribute_text = attribute_text.strip('\n')
-    while attribute_text:
-      result = self.block_attribute_pattern.match(attribute_text)
-      if result is None:
-        raise RuntimeError('invalid attributes text: {}'.format(repr(attribute_text)))
-      name = result['name']
-      value = result['value']
-      attributes[name] = value
-      attribute_text = attribute_text[result.end():]
-      attribute_text = attribute_text.strip('\n')
-    return attributes
+    """Read-only mapping of names to ``parse_attribute_value`` values.
+
+    Results are memoized on the text, so identical attribute blocks share
+    one mapping.
+    """
+    if not attribute_text:
+      return EMPTY_ATTRIBUTES
+    return _parse_block_attributes(self.block_attribute_pattern, attribute_text)
 
   def parse_inline_attributes(self, attribute_text: str) -> TokenAttributes:
-    attributes = OrderedDict()
+    """Like ``parse_block_attributes``, for ``{name=value,...}``."""
     if not attribute_text:  # empty string
-      return attributes
-    assert attribute_text.startswith('{')
-    assert attribute_text.endswith('}')
-    attribute_text = attribute_text[1:-1]
-    while attribute_text:
-      result = self.inline_attribute_pattern.match(attribute_text)
-      if result is None:
-        raise RuntimeError('invalid attributes text: {}'.format(repr(attribute_text)))
-      name = result['name']
-      value = result['value']
-      attributes[name] = value
-      attribute_text = attribute_text[result.end():]
-    return attributes
+      return EMPTY_ATTRIBUTES
+    return _parse_inline_attributes(self.inline_attribute_pattern, attribute_text)
+
+
+# headers are a few short lines; a page is as little as a read can cost
+_HEADER_BUFFER = 4096
+
+_header_blank = {str: re.compile('[\n ]*'), bytes: re.compile(b'[\n ]*')}
 
 
 class MetaDataParser:
@@ -80,48 +248,270 @@ class MetaDataParser:
     self.grammar = grammar
 
   def parse(self, metadata: DocumentMetaData, text: str) -> Tuple[DocumentMetaData, str]:
-    text = text.lstrip('\n ')
-    while text:
-      match = self.grammar.metadata_pattern.match(text)
+    metadata, pos = self.parse_header(metadata, text)
+    return metadata, text[pos:]
+
+  def parse_header(
+      self,
+      metadata: DocumentMetaData,
+      text: Union[str, Buffer],
+  ) -> Tuple[DocumentMetaData, int]:
+    """``parse`` that returns where the body starts instead of a copy of it.
+
+    ``text`` may also be UTF-8 bytes.
+    """
+    pattern = unanchor_pattern(self.grammar.metadata_pattern)
+    blank = _header_blank[str]
+    if not isinstance(text, str):
+      pattern = bytes_pattern(pattern)
+      blank = _header_blank[bytes]
+      if pattern is None:
+        raise ValueError('metadata pattern cannot match bytes: {}'.format(
+          repr(self.grammar.metadata_pattern.pattern),
+        ))
+    pos = blank.match(text).end()
+    while pos < len(text):
+      match = pattern.match(text, pos)
       if match is None:
         break
       name = match['name']
       value = match['value']
+      if not isinstance(name, str):
+        name, value = str(name, 'utf-8'), str(value, 'utf-8')
       metadata.register(name, value)
-      text = text[match.end():].lstrip('\n ')
-    return metadata, text
+      pos = blank.match(text, match.end()).end()
+    return metadata, pos
+
+  def parse_lines(
+      self,
+      metadata: DocumentMetaData,
+      lines: Iterable[str],
+  ) -> Tuple[DocumentMetaData, Iterator[str]]:
+    """Line-by-line ``parse``: consume header lines, return the rest lazily."""
+    lines = iter(lines)
+    for line in lines:
+      line = line.lstrip('\n ')
+      if not line:
+        continue
+      match = self.grammar.metadata_pattern.match(line)
+      if match is None:
+        return metadata, itertools.chain([line], lines)
+      metadata.register(match['name'], match['value'])
+    return metadata, iter(())
+
+
+class _Run:
+  """Blocks ``tokens[lo:hi]`` of one scan, placed in a later text.
+
+  The run covers ``[begin, end)`` of that text, which reads
+  ``text[begin - delta:end - delta]``; block ``i`` starts at
+  ``starts[i] + delta``.
+  """
+  __slots__ = ('text', 'tokens', 'starts', 'lo', 'hi', 'delta', 'begin', 'end')
+
+  def __init__(
+      self,
+      text: str,
+      tokens: List[BlockToken],
+      starts: List[int],
+      lo: int,
+      hi: int,
+      delta: int,
+      begin: int,
+      end: int,
+  ):
+    self.text = text
+    self.tokens = tokens
+    self.starts = starts
+    self.lo = lo
+    self.hi = hi
+    self.delta = delta
+    self.begin = begin
+    self.end = end
+
+  def is_whole(self) -> bool:
+    return self.delta == 0 and self.lo == 0 and self.hi == len(self.tokens) and self.end == len(self.text)
+
+  def moved(self, lo: int, hi: int, shift: int, begin: int, end: int) -> '_Run':
+    return _Run(self.text, self.tokens, self.starts, lo, hi, self.delta + shift, begin + shift, end + shift)
+
+
+# runs a result may be split into before ``reparse`` joins them back
+_MAX_RUNS = 32
+# how far ``reparse`` reads before and past where it scans
+_LOOKBEHIND = 64
+_READ_AHEAD = 1024
+
+
+class BlockParseResult:
+  """Blocks of ``text`` along with the offset where each one starts.
+
+  A result of ``reparse`` refers to the unchanged runs of blocks and text
+  of the one it came from, with their offsets moved lazily, and only builds
+  ``text``, ``tokens`` and ``starts`` when one of them is read.
+  """
+  __slots__ = ('_runs', '_length')
+
+  def __init__(self, text: str, tokens: List[BlockToken], starts: List[int]):
+    self._runs = [_Run(text, tokens, starts, 0, len(tokens), 0, 0, len(text))]
+    self._length = len(text)
+
+  @classmethod
+  def _of_runs(cls, runs: List[_Run], length: int) -> 'BlockParseResult':
+    result = cls.__new__(cls)
+    result._runs = runs
+    result._length = length
+    if len(runs) > _MAX_RUNS:
+      result._flat()
+    return result
+
+  def _flat(self) -> _Run:
+    runs = self._runs
+    if len(runs) == 1 and runs[0].is_whole():
+      return runs[0]
+    text = ''.join(run.text[run.begin - run.delta:run.end - run.delta] for run in runs)
+    tokens = [token for run in runs for token in itertools.islice(run.tokens, run.lo, run.hi)]
+    starts = [start + run.delta for run in runs for start in itertools.islice(run.starts, run.lo, run.hi)]
+    run = _Run(text, tokens, starts, 0, len(tokens), 0, 0, len(text))
+    self._runs = [run]
+    return run
+
+  @property
+  def text(self) -> str:
+    return self._flat().text
+
+  @property
+  def tokens(self) -> List[BlockToken]:
+    return self._flat().tokens
+
+  @property
+  def starts(self) -> List[int]:
+    return self._flat().starts
+
+  def span(self, index: int) -> Tuple[int, int]:
+    starts = self.starts
+    start = starts[index]
+    if index + 1 < len(starts):
+      return start, starts[index + 1]
+    return start, _content_end(self.text)
+
+  def _slice(self, begin: int, end: int) -> str:
+    return ''.join(
+      run.text[max(run.begin, begin) - run.delta:min(run.end, end) - run.delta]
+      for run in self._runs
+      if run.begin < end and run.end > begin
+    )
+
+  def _index(self, pos: int) -> int:
+    """``bisect_right(starts, pos)``."""
+    count = 0
+    for run in self._runs:
+      if run.end <= pos:
+        count += run.hi - run.lo
+        continue
+      return count + bisect.bisect_right(run.starts, pos - run.delta, run.lo, run.hi) - run.lo
+    return count
+
+  def _block_at(self, pos: int) -> Optional[int]:
+    """Index of the block starting at ``pos``, if one does."""
+    count = 0
+    for run in self._runs:
+      if run.end <= pos:
+        count += run.hi - run.lo
+        continue
+      i = bisect.bisect_left(run.starts, pos - run.delta, run.lo, run.hi)
+      if i < run.hi and run.starts[i] + run.delta == pos:
+        return count + i - run.lo
+      return None
+    return None
+
+  def _count(self) -> int:
+    return sum(run.hi - run.lo for run in self._runs)
+
+  def _start(self, index: int) -> int:
+    for run in self._runs:
+      if index < run.hi - run.lo:
+        return run.starts[run.lo + index] + run.delta
+      index -= run.hi - run.lo
+    raise IndexError(index)
+
+  def _split(self, index: int, pos: int) -> Tuple[List[_Run], List[_Run]]:
+    """Runs of the blocks before ``index`` and text before ``pos``, and the rest.
+
+    ``pos`` lies between the start of block ``index - 1`` and that of
+    ``index``.
+    """
+    head, tail = [], []
+    count = 0
+    for run in self._runs:
+      middle = run.lo + min(max(index - count, 0), run.hi - run.lo)
+      if run.begin < pos:
+        head.append(run.moved(run.lo, middle, 0, run.begin, min(run.end, pos)))
+      if run.end > pos:
+        tail.append(run.moved(middle, run.hi, 0, max(run.begin, pos), run.end))
+      count += run.hi - run.lo
+    return head, tail
 
 
 class BlockParser:
   types: List[BlockType]
+  type_map: Dict[str, BlockType]
   rules: BlockGrammarRules
+  dispatch: Optional[DispatchTable]
   inline_parser: 'InlineParser'
+  grammar: Grammar
 
   def __init__(
       self,
       block_types: List[BlockType],
       inline_parser: 'InlineParser',
       grammar: Grammar = Grammar(),
+      compiled: bool = False,
+      rules: Optional[BlockGrammarRules] = None,
+      firsts: Optional[List[Optional[FrozenSet[str]]]] = None,
   ):
     self.types = block_types
-    self.rules = self._gen_rules(grammar, block_types)
+    self.type_map = {t.get_name(): t for t in block_types}
+    # prebuilt ``rules`` and their ``first_chars`` come from a snapshot
+    self.rules = rules if rules is not None else self._gen_rules(grammar, block_types, compiled)
+    self.dispatch = DispatchTable(self.rules, firsts) if compiled else None
     self.inline_parser = inline_parser
+    self.grammar = grammar
+    self._fingerprint: Optional[str] = None
 
   @classmethod
-  def _gen_rules(cls, grammer: Grammar, types: List[BlockType]) -> BlockGrammarRules:
+  def _gen_rules(
+      cls,
+      grammer: Grammar,
+      types: List[BlockType],
+      compiled: bool = False,
+  ) -> BlockGrammarRules:
     rules = OrderedDict()
     for t in types:
       tokenizer = t.get_tokenizer()
       for pattern in t.get_patterns():
-        rules[pattern] = tokenizer
+        rules[unanchor_pattern(pattern)] = tokenizer
 
-    names: Set[str] = set([
+    # first-seen order rather than a set, so the rule order (and anything
+    # derived from it, like cache fingerprints) is the same in every process
+    names: List[str] = list(OrderedDict.fromkeys(
       t.get_name()
       for t in types
-    ])
-    for name in names:
-      pattern = grammer.gen_block_pattern(name)
-      rules[pattern] = cls._gen_tokenizer(grammer, name)
+    ))
+    if compiled and names:
+      # the generated rules are contiguous and differ only by name, so one
+      # alternation tried in the same order is equivalent to walking them
+      pattern = unanchor_pattern(grammer.gen_block_pattern(gen_name_alternation(names)))
+      rules[pattern] = cls._gen_named_tokenizer(grammer, names)
+    else:
+      for name in names:
+        pattern = unanchor_pattern(grammer.gen_block_pattern(name))
+        rules[pattern] = cls._gen_tokenizer(grammer, name)
+
+    for t in types:
+      tokenizer = t.get_tokenizer()
+      for pattern in t.get_fallback_patterns():
+        rules[unanchor_pattern(pattern)] = tokenizer
     return rules
 
   @staticmethod
@@ -137,51 +527,384 @@ class BlockParser:
 
     return tokenizer
 
-  def parse(self, text: str) -> List[BlockToken]:
-    tokens = []
-    text = text.rstrip('\n')
+  @classmethod
+  def _gen_named_tokenizer(cls, grammer, names):
+    tokenizers = {
+      name: cls._gen_tokenizer(grammer, name)
+      for name in names
+    }
+
+    def tokenizer(match: Match):
+      return tokenizers[match['name']](match)
+
+    return tokenizer
+
+  def parse(
+      self,
+      text: str,
+      inline: str = INLINE_LAZY,
+      spans: bool = False,
+      pos: int = 0,
+  ) -> List[BlockToken]:
+    """Tokenize ``text`` from ``pos`` on into blocks.
+
+    With ``spans``, tokenizers get the ``SPAN_GROUPS`` as ``TextSpan``s, so
+    token bodies point into ``text`` and are only copied when read.
+    """
+    return list(self.iter_tokens(text, inline, spans, pos))
 
-    while text:
-      for pat, tokenizer in self.rules.items():
-        result: Optional[Match] = pat.match(text)
+  def iter_tokens(
+      self,
+      text: str,
+      inline: str = INLINE_LAZY,
+      spans: bool = False,
+      pos: int = 0,
+  ) -> Iterator[BlockToken]:
+    """``parse`` that yields the blocks one by one."""
+    end = _content_end(text)
+    rules = tuple(self.rules.items())
+    dispatch = self.dispatch
+    children = self._gen_children(inline)
+
+    while pos < end:
+      candidates = rules if dispatch is None else dispatch.candidates(text[pos])
+      for pat, tokenizer in candidates:
+        result: Optional[Match] = pat.match(text, pos, end)
         if result is None:
           continue
         else:
-          token = tokenizer(result)  # TODO: catch tokenizer failure
-          tokens.append(token)
-          text = text[result.end():]
+          token = tokenizer(SpanMatch(result) if spans else result)  # TODO: catch tokenizer failure
+          if token is not None:
+            if children is not None:
+              token.children = children(token)
+            yield token
+          pos = result.end()
           break
       else:
-        raise RuntimeError('Infinite loop at: %s' % text)
-    return tokens
+        raise RuntimeError('Infinite loop at: %s' % text[pos:])
+
+  def for_bytes(self) -> Optional['BlockParser']:
+    """Copy of this parser whose rules match UTF-8 bytes.
+
+    ``None`` if some rule has to see decoded text; see ``bytes_pattern``.
+    Parse bytes with ``spans`` so tokenizers get decoded groups.
+    """
+    patterns = OrderedDict()
+    for pattern in self.rules:
+      encoded = bytes_pattern(pattern)
+      if encoded is None:
+        return None
+      patterns[pattern] = encoded
+    parser = copy.copy(self)
+    parser.rules = OrderedDict(
+      (patterns[pattern], tokenizer)
+      for pattern, tokenizer in self.rules.items()
+    )
+    parser.dispatch = self.dispatch.encode(patterns) if self.dispatch is not None else None
+    parser._fingerprint = self.fingerprint()
+    return parser
+
+  def fingerprint(self) -> str:
+    """Digest of everything that decides which blocks a text yields.
+
+    Covers the grammar version and attribute pattern, and every rule's
+    pattern, flags, ``version`` (for pattern objects that are not regexes)
+    and tokenizer code, so editing a module invalidates
+    anything cached under the old fingerprint.
+    """
+    if self._fingerprint is None:
+      digest = hashlib.sha256()
+      digest.update(repr((
+        type(self.grammar).__qualname__,
+        self.grammar.version,
+        self.grammar.block_attribute_pattern.pattern,
+      )).encode('utf-8'))
+      for pattern, tokenizer in self.rules.items():
+        code = getattr(tokenizer, '__code__', None)
+        digest.update(repr((
+          pattern.pattern,
+          pattern.flags,
+          getattr(pattern, 'version', None),
+          getattr(tokenizer, '__module__', None),
+          getattr(tokenizer, '__qualname__', None),
+          code_digest(code) if code is not None else None,
+        )).encode('utf-8'))
+      self._fingerprint = digest.hexdigest()
+    return self._fingerprint
+
+  def parse_inline_body(self, token: BlockToken) -> Optional[List[InlineToken]]:
+    block_type = self.type_map.get(token.name)
+    if block_type is None or self.inline_parser is None:
+      return None
+    body = block_type.get_inline_body(token)
+    if body is None:
+      return None
+    return self.inline_parser.parse(body)
+
+  def attach_children(self, tokens: Iterable[BlockToken], inline: str = INLINE_LAZY):
+    """Set ``children`` for ``inline`` on blocks tokenized elsewhere."""
+    children = self._gen_children(inline)
+    if children is None:
+      return
+    for token in tokens:
+      token.children = children(token)
+
+  def _gen_children(self, inline: str) -> Optional[Callable[[BlockToken], Any]]:
+    """What to set as ``token.children`` for the given inline mode."""
+    if inline == INLINE_NONE:
+      return None
+    elif inline == INLINE_LAZY:
+      parse_inline_body = self.parse_inline_body
+      return lambda token: parse_inline_body
+    elif inline == INLINE_EAGER:
+      return self.parse_inline_body
+    raise ValueError('unknown inline mode: {}'.format(repr(inline)))
+
+  def parse_blocks(self, text: str, inline: str = INLINE_LAZY) -> 'BlockParseResult':
+    """``parse`` that also records where each block starts, for ``reparse``."""
+    tokens: List[BlockToken] = []
+    starts: List[int] = []
+    end = _content_end(text)
+    children = self._gen_children(inline)
+    pos = 0
+    while pos < end:
+      pos = self._scan_block(text, pos, end, children, tokens, starts)
+    return BlockParseResult(text, tokens, starts)
+
+  def reparse(
+      self,
+      previous: 'BlockParseResult',
+      offset: int,
+      removed: int,
+      inserted: str,
+      inline: str = INLINE_LAZY,
+  ) -> 'BlockParseResult':
+    """Apply a text edit to ``previous`` and re-tokenize only what it touches.
+
+    Scanning restarts one block before the edited one, since that block's
+    match looked ahead into the edit. Once a new block ends past the edit at
+    the (shifted) start of an old block, the old text from there on is
+    unchanged and the remaining old tokens are reused as they are. This
+    assumes rules look no further ahead than the line after their match,
+    which is also how much text past a match is read before it is kept.
+
+    The cost is that of the blocks scanned, not of the document: the new
+    result shares the text, tokens and starts of ``previous`` around them.
+    """
+    length = previous._length
+    if offset < 0 or removed < 0 or offset + removed > length:
+      raise ValueError('edit out of range: {}+{}'.format(offset, removed))
+    delta = len(inserted) - removed
+    edit_end = offset + len(inserted)
+    index = max(previous._index(offset) - 2, 0)
+    begin = previous._start(index) if index < previous._count() else 0
+    children = self._gen_children(inline)
+
+    # the new text from a little before ``begin`` (for lookbehinds) on, read
+    # from ``previous`` as far as the scan needs
+    base = max(begin - _LOOKBEHIND, 0)
+    window = previous._slice(base, offset) + inserted
+    read = offset + removed
+    tokens: List[BlockToken] = []
+    starts: List[int] = []
+    pos = begin
+    resync = None
+    while True:
+      complete = read == length
+      if not complete and len(window) - (pos - base) < _READ_AHEAD:
+        more = min(read + max(len(window), _READ_AHEAD), length)
+        window += previous._slice(read, more)
+        read = more
+        continue
+      end = base + (_content_end(window) if complete else len(window))
+      if pos >= end:
+        break
+      if pos >= edit_end:
+        resync = previous._block_at(pos - delta)
+        if resync is not None:
+          break
+      scanned = len(tokens)
+      after = self._scan_block(window, pos - base, end - base, children, tokens, starts, complete)
+      if after is None:
+        # the match may reach past what has been read
+        del tokens[scanned:]
+        del starts[scanned:]
+        more = min(read + len(window), length)
+        window += previous._slice(read, more)
+        read = more
+        continue
+      pos = base + after
+
+    head, _ = previous._split(index, begin)
+    if resync is None:
+      runs = head + [_Run(window, tokens, starts, 0, len(tokens), base, begin, length + delta)]
+    else:
+      _, tail = previous._split(resync, pos - delta)
+      runs = head + [_Run(window, tokens, starts, 0, len(tokens), base, begin, pos)]
+      runs += [run.moved(run.lo, run.hi, delta, run.begin, run.end) for run in tail]
+    return BlockParseResult._of_runs(runs, length + delta)
+
+  def _scan_block(
+      self,
+      text: str,
+      pos: int,
+      end: int,
+      children: Optional[Callable[[BlockToken], Any]],
+      tokens: List[BlockToken],
+      starts: List[int],
+      complete: bool = True,
+  ) -> Optional[int]:
+    """Tokenize the block at ``pos`` into ``tokens``/``starts``; where it ends.
+
+    Unless ``text`` is ``complete``, ``None`` if the match might change
+    with more text, i.e. if ``text`` ends before the line after it.
+    """
+    found = self._match(text, pos, end)
+    if found is None:
+      if not complete:
+        return None
+      raise RuntimeError('Infinite loop at: %s' % text[pos:end])
+    match, tokenizer = found
+    after = match.end()
+    if not complete:
+      newline = text.find('\n', after)
+      if newline < 0 or text.find('\n', newline + 1) < 0:
+        return None
+    token = tokenizer(match)  # TODO: catch tokenizer failure
+    if token is not None:
+      if children is not None:
+        token.children = children(token)
+      tokens.append(token)
+      starts.append(pos)
+    return after
+
+  def iter_parse(
+      self,
+      stream: Union[str, Iterable[str]],
+      inline: str = INLINE_LAZY,
+  ) -> Iterator[BlockToken]:
+    """Parse a text file or an iterable of lines, yielding blocks as they end.
+
+    Only the lines of the block being scanned are buffered. A block is
+    emitted once its match stops short of the buffered text, i.e. once a
+    following line has been read and left out of it. The buffer is rescanned
+    only after it has doubled, so long blocks are still scanned in linear
+    time and the peak buffer stays within twice the largest block.
+    """
+    if isinstance(stream, str):
+      stream = io.StringIO(stream)
+    lines = iter(stream)
+    children = self._gen_children(inline)
+    buffer = ''
+    pending: List[str] = []
+    pending_size = 0
+    rescan_size = 0
+    eof = False
+
+    while True:
+      if pending_size >= rescan_size or eof:
+        if pending:
+          buffer += ''.join(pending)
+          pending.clear()
+          pending_size = 0
+        if eof:
+          buffer = buffer.rstrip('\n')
+        pos = 0
+        while pos < len(buffer):
+          found = self._match(buffer, pos, len(buffer))
+          if found is None or (found[0].end() == len(buffer) and not eof):
+            break
+          result, tokenizer = found
+          token = tokenizer(result)  # TODO: catch tokenizer failure
+          if token is not None:
+            if children is not None:
+              token.children = children(token)
+            yield token
+          pos = result.end()
+        if eof:
+          if pos < len(buffer):
+            raise RuntimeError('Infinite loop at: %s' % buffer[pos:])
+          return
+        buffer = buffer[pos:]
+        rescan_size = len(buffer)
+
+      line = next(lines, None)
+      if line is None:
+        eof = True
+        continue
+      if not line.endswith('\n'):
+        line += '\n'
+      pending.append(line)
+      pending_size += len(line)
+
+  def _match(
+      self,
+      text: str,
+      pos: int,
+      endpos: int,
+  ) -> Optional[Tuple[Match, BlockTokenizer]]:
+    rules = self.rules.items()
+    if self.dispatch is not None:
+      rules = self.dispatch.candidates(text[pos])
+    for pat, tokenizer in rules:
+      result: Optional[Match] = pat.match(text, pos, endpos)
+      if result is not None:
+        return result, tokenizer
+    return None
 
 
 class InlineParser:
+  """Tokenizes inline markup; text no rule matches becomes ``text`` tokens.
+
+  Rules are looked up by the character at the cursor, and plain text
+  between the characters any rule can start with is skipped in one search.
+  ``compiled`` additionally merges the generated ``:name:`` rules.
+  """
   types: List[InlineType]
   rules: InlineGrammarRules
+  dispatch: DispatchTable
+  grammar: Grammar
 
   def __init__(
       self,
       types: List[InlineType],
       grammar: Grammar = Grammar(),
+      compiled: bool = False,
+      rules: Optional[InlineGrammarRules] = None,
+      firsts: Optional[List[Optional[FrozenSet[str]]]] = None,
   ):
     self.types = types
-    self.rules = self._gen_rules(grammar, types)
+    self.rules = rules if rules is not None else self._gen_rules(grammar, types, compiled)
+    self.dispatch = DispatchTable(self.rules, firsts)
+    self.grammar = grammar
 
   @classmethod
-  def _gen_rules(cls, grammer: Grammar, types: List[InlineType]) -> InlineGrammarRules:
+  def _gen_rules(
+      cls,
+      grammer: Grammar,
+      types: List[InlineType],
+      compiled: bool = False,
+  ) -> InlineGrammarRules:
     rules = OrderedDict()
     for t in types:
       tokenizer = t.get_tokenizer()
       for pattern in t.get_patterns():
-        rules[pattern] = tokenizer
+        rules[unanchor_pattern(pattern)] = tokenizer
 
-    names: Set[str] = set([
+    # first-seen order rather than a set, so the rule order (and anything
+    # derived from it, like cache fingerprints) is the same in every process
+    names: List[str] = list(OrderedDict.fromkeys(
       t.get_name()
       for t in types
-    ])
+    ))
+    if compiled and names:
+      # the generated rules are contiguous and differ only by name, so one
+      # alternation tried in the same order is equivalent to walking them
+      pattern = unanchor_pattern(grammer.gen_inline_pattern(gen_name_alternation(names)))
+      rules[pattern] = cls._gen_named_tokenizer(grammer, names)
+      return rules
     for name in names:
-      pattern = grammer.gen_inline_pattern(name)
+      pattern = unanchor_pattern(grammer.gen_inline_pattern(name))
       rules[pattern] = cls._gen_tokenizer(grammer, name)
     return rules
 
@@ -198,50 +921,368 @@ class InlineParser:
 
     return tokenizer
 
-  def parse(self, text: str) -> List[InlineToken]:
+  @classmethod
+  def _gen_named_tokenizer(cls, grammer, names):
+    tokenizers = {
+      name: cls._gen_tokenizer(grammer, name)
+      for name in names
+    }
+
+    def tokenizer(match: Match):
+      return tokenizers[match['name']](match)
+
+    return tokenizer
+
+  def parse(self, text: str, spans: bool = False) -> List[InlineToken]:
+    """Tokenize ``text``; runs matched by no rule become ``text`` tokens.
+
+    With ``spans``, token values are ``TextSpan``s into ``text``.
+    """
     tokens = []
-    text = text.rstrip('\n')
+    pos = 0
+    end = _content_end(text)
+    candidates_for = self.dispatch.candidates
+    skip = self.dispatch.skip
+    search = skip.search if skip is not None else None
+    text_start = None
 
-    while text:
-      for pat, tokenizer in self.rules.items():
-        result: Optional[Match] = pat.match(text)
+    while pos < end:
+      for pat, tokenizer in candidates_for(text[pos]):
+        result: Optional[Match] = pat.match(text, pos, end)
         if result is None:
           continue
         else:
-          token = tokenizer(result)  # TODO: catch tokenizer failure
+          if text_start is not None:
+            tokens.append(self._gen_text_token(
+              TextSpan(text, text_start, pos) if spans else text[text_start:pos],
+            ))
+            text_start = None
+          token = tokenizer(SpanMatch(result) if spans else result)  # TODO: catch tokenizer failure
           tokens.append(token)
-          text = text[result.end():]
+          pos = result.end()
           break
       else:
-        raise RuntimeError('Infinite loop at: %s' % text)
+        if text_start is None:
+          text_start = pos
+        if search is None:
+          pos += 1
+        else:
+          found = search(text, pos + 1, end)
+          pos = found.start() if found is not None else end
+    if text_start is not None:
+      tokens.append(self._gen_text_token(
+        TextSpan(text, text_start, end) if spans else text[text_start:end],
+      ))
     return tokens
 
+  @staticmethod
+  def _gen_text_token(value: Union[str, TextSpan]) -> InlineToken:
+    return InlineToken(
+      name=TEXT_TOKEN_NAME,
+      value=value,
+      attributes=EMPTY_ATTRIBUTES,
+    )
 
-class Parser:
-  def __init__(self, custom_modules, grammar=Grammar()):
-    self.custom_modules = custom_modules
-    self.grammar = grammar
 
-  def parse(self, text: str):
-    metadata_parser = MetaDataParser()
-    metadata = DocumentMetaData()
-    metadata, body = metadata_parser.parse(metadata, text)
+ParserCacheInfo = namedtuple('ParserCacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class ParserCache:
+  """Bounded LRU cache of built ``BlockParser``/``InlineParser`` pairs.
+
+  Building a parser compiles every rule pattern, so documents that resolve
+  to the same module set should share one. Types are keyed by what their
+  rules are built from, in order: class, name, ``version``, each pattern's
+  source and flags and the tokenizer function. Modules usually hand out
+  fresh instances, so instances are not part of the key.
+  """
+  maxsize: int
+  hits: int
+  misses: int
+
+  def __init__(self, maxsize: int = 32):
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._parsers: 'OrderedDict[Hashable, BlockParser]' = OrderedDict()
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def key(
+      block_types: List[BlockType],
+      inline_types: List[InlineType],
+      grammar: Grammar,
+      compiled: bool = False,
+  ) -> Hashable:
+    return (
+      tuple(ParserCache._type_key(t) for t in block_types),
+      tuple(ParserCache._type_key(t) for t in inline_types),
+      grammar,
+      compiled,
+    )
+
+  @staticmethod
+  def _type_key(t: Union[BlockType, InlineType]) -> Hashable:
+    patterns = list(t.get_patterns())
+    patterns += getattr(t, 'get_fallback_patterns', list)()
+    tokenizer = t.get_tokenizer()
+    return (
+      type(t),
+      t.get_name(),
+      getattr(t, 'version', None),
+      tuple(
+        (type(pattern), pattern.pattern, pattern.flags, getattr(pattern, 'version', None))
+        for pattern in patterns
+      ),
+      getattr(tokenizer, '__func__', tokenizer),
+    )
 
-    block_types, inline_types = load_modules(metadata)  # TODO
+  def get(
+      self,
+      block_types: List[BlockType],
+      inline_types: List[InlineType],
+      grammar: Grammar,
+      compiled: bool = False,
+  ) -> BlockParser:
+    key = self.key(block_types, inline_types, grammar, compiled)
+    with self._lock:
+      block_parser = self._parsers.get(key)
+      if block_parser is not None:
+        self.hits += 1
+        self._parsers.move_to_end(key)
+        return block_parser
+      self.misses += 1
 
     inline_parser = InlineParser(
       types=inline_types,
-      grammar=self.grammar,
+      grammar=grammar,
+      compiled=compiled,
     )
     block_parser = BlockParser(
       block_types=block_types,
       inline_parser=inline_parser,
-      grammar=self.grammar,
+      grammar=grammar,
+      compiled=compiled,
     )
+    with self._lock:
+      self._parsers[key] = block_parser
+      while len(self._parsers) > self.maxsize:
+        self._parsers.popitem(last=False)
+    return block_parser
+
+  def add(self, block_parser: BlockParser):
+    """Keep ``block_parser``, built elsewhere (e.g. from a snapshot)."""
+    key = self.key(
+      block_parser.types,
+      block_parser.inline_parser.types,
+      block_parser.grammar,
+      block_parser.dispatch is not None,
+    )
+    with self._lock:
+      self._parsers[key] = block_parser
+      self._parsers.move_to_end(key)
+      while len(self._parsers) > self.maxsize:
+        self._parsers.popitem(last=False)
+
+  def info(self) -> ParserCacheInfo:
+    with self._lock:
+      return ParserCacheInfo(self.hits, self.misses, self.maxsize, len(self._parsers))
+
+  def clear(self):
+    with self._lock:
+      self._parsers.clear()
+      self.hits = 0
+      self.misses = 0
 
-    block_tokens = block_parser.parse(body)
+
+parser_cache = ParserCache()
+
+
+class Parser:
+  def __init__(
+      self,
+      custom_modules,
+      grammar=Grammar(),
+      compiled=False,
+      cache=parser_cache,
+      parse_cache=None,
+      profile=None,
+      ordering=None,
+      registry=None,
+  ):
+    self.custom_modules = custom_modules
+    self.grammar = grammar
+    self.compiled = compiled
+    self.cache = cache
+    self.parse_cache = parse_cache
+    self.profile = profile
+    self.ordering = ordering
+    self.registry = registry
+
+  def get_block_parser(
+      self,
+      block_types: List[BlockType],
+      inline_types: List[InlineType],
+  ) -> BlockParser:
+    block_parser = self.cache.get(block_types, inline_types, self.grammar, self.compiled)
+    if self.ordering is not None:
+      block_parser = self.ordering.apply(block_parser)
+    if self.profile is not None:
+      block_parser = self.profile.wrap(block_parser)
+    return block_parser
+
+  def load_modules(self, metadata: Optional[DocumentMetaData]) -> Tuple[List[BlockType], List[InlineType]]:
+    """Types of ``custom_modules`` and of the ``::usemodule:`` modules.
+
+    Requested modules come from the ``registry`` and are tried first, since
+    ``custom_modules`` usually end with catch-alls such as paragraphs.
+    Names already among ``custom_modules`` are skipped, as are modules
+    already loaded under another name; without a registry the header is
+    ignored.
+    """
+    block_types = []
+    inline_types = []
+    if self.registry is not None and metadata is not None:
+      loaded = {module.get_name() for module in self.custom_modules}
+      for name in metadata.modules:
+        if name in loaded:
+          continue
+        loaded.add(name)
+        resolved = self.registry.resolve(name)
+        module_name = resolved.module.get_name()
+        if module_name in loaded and module_name != name:
+          continue
+        loaded.add(module_name)
+        block_types.extend(resolved.block_types)
+        inline_types.extend(resolved.inline_types)
+    block_types.extend(
+      t
+      for module in self.custom_modules
+      for t in module.get_block_types()
+    )
+    inline_types.extend(
+      t
+      for module in self.custom_modules
+      for t in module.get_inline_types()
+    )
+    return block_types, inline_types
+
+  def parse(self, text: str, inline: str = INLINE_LAZY, spans: bool = False):
+    """Parse a document; see ``BlockParser.parse`` for ``spans``.
+
+    With a ``parse_cache`` the blocks come from the cache, whose bodies are
+    plain strings, so ``spans`` is ignored.
+    """
+    metadata_parser = MetaDataParser(self.grammar)
+    metadata = DocumentMetaData()
+    metadata, start = metadata_parser.parse_header(metadata, text)
+
+    block_types, inline_types = self.load_modules(metadata)
+    block_parser = self.get_block_parser(block_types, inline_types)
+
+    if self.parse_cache is None:
+      block_tokens = block_parser.parse(text, inline, spans, start)
+    else:
+      block_tokens = self.parse_cache.parse(block_parser, text[start:], inline)
     document = Document(
       metadata=metadata,
       blocks=block_tokens,
     )
     return document
+
+  def parse_file(self, path: str, inline: str = INLINE_LAZY) -> Document:
+    """Parse the UTF-8 file at ``path`` through a read-only memory map.
+
+    Blocks are matched on the mapped bytes and their bodies are
+    ``TextSpan``s into the map, so only the text that is read gets decoded;
+    the map stays open while any token refers to it. When a rule has to
+    see decoded text, or with a ``parse_cache``, the whole file is decoded
+    and parsed like ``parse``.
+    """
+    with open(path, 'rb') as f:
+      if os.fstat(f.fileno()).st_size == 0:
+        return self.parse('', inline)
+      buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    metadata, start = MetaDataParser(self.grammar).parse_header(DocumentMetaData(), buffer)
+    block_types, inline_types = self.load_modules(metadata)
+    block_parser = self.get_block_parser(block_types, inline_types)
+    bytes_parser = block_parser.for_bytes() if self.parse_cache is None else None
+    if bytes_parser is None:
+      with buffer:
+        text = str(buffer, 'utf-8')
+      return self.parse(text, inline)
+
+    return Document(
+      metadata=metadata,
+      blocks=bytes_parser.parse(buffer, inline, True, start),
+    )
+
+  async def aparse(self, text: str, inline: str = INLINE_LAZY, yield_every: int = 64) -> Document:
+    """``parse`` for event loop servers.
+
+    The event loop gets a turn every ``yield_every`` blocks, so a large
+    document does not hold up other requests. Documents found in the
+    ``parse_cache`` are returned without pausing.
+    """
+    metadata_parser = MetaDataParser(self.grammar)
+    metadata = DocumentMetaData()
+    metadata, start = metadata_parser.parse_header(metadata, text)
+
+    block_types, inline_types = self.load_modules(metadata)
+    block_parser = self.get_block_parser(block_types, inline_types)
+
+    if self.parse_cache is not None:
+      blocks = self.parse_cache.parse(block_parser, text[start:], inline)
+    else:
+      blocks = []
+      for token in block_parser.iter_tokens(text, inline, pos=start):
+        blocks.append(token)
+        if len(blocks) % yield_every == 0:
+          await asyncio.sleep(0)
+    return Document(
+      metadata=metadata,
+      blocks=blocks,
+    )
+
+  def read_metadata(self, path_or_text: Union[str, 'os.PathLike', IO[str]]) -> DocumentMetaData:
+    """Read only the header of a document: a path, a text stream or text.
+
+    A ``str`` that is empty, holds a newline or starts with ``::`` is taken
+    as the document text, any other as a path. Reading stops at the first
+    line that is not a header line, so routing a document by its
+    ``::documentclass:`` or ``::usemodule:`` costs a buffer's worth of I/O
+    however long the body is.
+    """
+    metadata_parser = MetaDataParser(self.grammar)
+    source = path_or_text
+    if isinstance(source, str) and (not source or '\n' in source or source.startswith('::')):
+      source = io.StringIO(source)
+    if hasattr(source, 'readline'):
+      metadata, _ = metadata_parser.parse_lines(DocumentMetaData(), source)
+      return metadata
+    with open(source, encoding='utf-8', buffering=_HEADER_BUFFER) as f:
+      metadata, _ = metadata_parser.parse_lines(DocumentMetaData(), f)
+    return metadata
+
+  def iter_parse(
+      self,
+      stream: Union[str, Iterable[str]],
+      metadata: Optional[DocumentMetaData] = None,
+      inline: str = INLINE_LAZY,
+  ) -> Iterator[BlockToken]:
+    """Streaming ``parse``: yield the document's blocks as they are read.
+
+    The header is registered into ``metadata`` before the first block is
+    yielded.
+    """
+    if isinstance(stream, str):
+      stream = io.StringIO(stream)
+    if metadata is None:
+      metadata = DocumentMetaData()
+    metadata_parser = MetaDataParser(self.grammar)
+    metadata, lines = metadata_parser.parse_lines(metadata, stream)
+
+    block_types, inline_types = self.load_modules(metadata)
+    block_parser = self.get_block_parser(block_types, inline_types)
+    yield from block_parser.iter_parse(lines, inline)
@@ -0,0 +1,184 @@
+from typing import Any, Callable, Dict, List, Optional, Pattern, Tuple
+
+import copy
+import time
+import weakref
+from collections import OrderedDict
+
+from .dispatch import DispatchTable
+from .parser import BlockParser, InlineParser, unanchor_pattern
+
+SORT_KEYS = ('total_seconds', 'match_seconds', 'tokenize_seconds', 'attempts', 'hits', 'misses')
+
+
+class RuleStats:
+  """Counters for one rule, summed over every parser it was profiled in."""
+  __slots__ = ('kind', 'owner', 'pattern', 'attempts', 'hits', 'match_seconds', 'tokenize_seconds')
+
+  def __init__(self, kind: str, owner: str, pattern: str):
+    self.kind = kind
+    self.owner = owner
+    self.pattern = pattern
+    self.attempts = 0
+    self.hits = 0
+    self.match_seconds = 0.0
+    self.tokenize_seconds = 0.0
+
+  @property
+  def misses(self) -> int:
+    return self.attempts - self.hits
+
+  @property
+  def total_seconds(self) -> float:
+    return self.match_seconds + self.tokenize_seconds
+
+  def __repr__(self):
+    return '<RuleStats {} {} attempts={} hits={}>'.format(self.kind, self.owner, self.attempts, self.hits)
+
+
+class ProfiledPattern:
+  """Stands in for a rule pattern and counts its ``match`` calls."""
+  __slots__ = ('wrapped', 'stats', 'pattern', 'flags', 'version', 'matches_bytes')
+
+  def __init__(self, wrapped: Pattern, stats: RuleStats):
+    self.wrapped = wrapped
+    self.stats = stats
+    self.pattern = wrapped.pattern
+    self.flags = wrapped.flags
+    self.version = getattr(wrapped, 'version', None)
+    self.matches_bytes = getattr(wrapped, 'matches_bytes', False)
+
+  def match(self, *args):
+    stats = self.stats
+    start = time.perf_counter()
+    result = self.wrapped.match(*args)
+    stats.match_seconds += time.perf_counter() - start
+    stats.attempts += 1
+    if result is not None:
+      stats.hits += 1
+    return result
+
+
+def _profiled_tokenizer(tokenizer: Callable, stats: RuleStats) -> Callable:
+  def profiled(match):
+    start = time.perf_counter()
+    try:
+      return tokenizer(match)
+    finally:
+      stats.tokenize_seconds += time.perf_counter() - start
+
+  return profiled
+
+
+def _owner(t) -> str:
+  return '{}.{}'.format(type(t).__module__, type(t).__qualname__)
+
+
+def rule_owners(
+    rules: Dict[Pattern, Callable],
+    types: List[Any],
+    gen_pattern: Callable[[str], Pattern],
+    kind: str,
+) -> List[str]:
+  """Name the type (or grammar rule) each of ``rules`` came from."""
+  by_pattern: Dict[Pattern, str] = {}
+  by_tokenizer: List[Tuple[Callable, str]] = []
+  for t in types:
+    for pattern in t.get_patterns():
+      by_pattern.setdefault(unanchor_pattern(pattern), _owner(t))
+    by_tokenizer.append((t.get_tokenizer(), _owner(t)))
+  for t in types:
+    generated = unanchor_pattern(gen_pattern(t.get_name()))
+    by_pattern.setdefault(generated, 'Grammar.gen_{}_pattern({!r})'.format(kind, t.get_name()))
+
+  owners = []
+  for pattern, tokenizer in rules.items():
+    owner = by_pattern.get(pattern)
+    if owner is None:
+      owner = next((name for t, name in by_tokenizer if t == tokenizer), None)
+    if owner is None:
+      # the merged name alternation of a compiled parser
+      owner = 'Grammar.gen_{}_pattern(*)'.format(kind)
+    owners.append(owner)
+  return owners
+
+
+class ParseProfile:
+  """Opt-in per-rule statistics for ``BlockParser``/``InlineParser``.
+
+  ``wrap`` returns a copy of a parser whose rules count match attempts and
+  time regexes and tokenizers; the parser passed in is left untouched, so
+  parsing without a profile runs exactly the same loops as before.
+  Statistics of rules with the same owner and pattern are summed.
+  """
+  stats: 'OrderedDict[Tuple[str, str, str], RuleStats]'
+
+  def __init__(self):
+    self.stats = OrderedDict()
+    # keyed weakly, so parsers evicted from a ``ParserCache`` can go
+    self._wrapped: 'weakref.WeakKeyDictionary[Any, Any]' = weakref.WeakKeyDictionary()
+
+  def _rule_stats(self, kind: str, owner: str, pattern) -> RuleStats:
+    key = (kind, owner, str(pattern.pattern))
+    stats = self.stats.get(key)
+    if stats is None:
+      stats = self.stats[key] = RuleStats(*key)
+    return stats
+
+  def _wrap_rules(self, rules, types, gen_pattern, kind: str):
+    owners = rule_owners(rules, types, gen_pattern, kind)
+    wrapped = OrderedDict()
+    for (pattern, tokenizer), owner in zip(rules.items(), owners):
+      stats = self._rule_stats(kind, owner, pattern)
+      wrapped[ProfiledPattern(pattern, stats)] = _profiled_tokenizer(tokenizer, stats)
+    return wrapped
+
+  def wrap_inline_parser(self, inline_parser: InlineParser) -> InlineParser:
+    cached = self._wrapped.get(inline_parser)
+    if cached is not None:
+      return cached
+    profiled = copy.copy(inline_parser)
+    profiled.rules = self._wrap_rules(
+      inline_parser.rules, inline_parser.types, inline_parser.grammar.gen_inline_pattern, 'inline',
+    )
+    profiled.dispatch = DispatchTable(profiled.rules)
+    self._wrapped[inline_parser] = profiled
+    return profiled
+
+  def wrap(self, block_parser: BlockParser) -> BlockParser:
+    cached = self._wrapped.get(block_parser)
+    if cached is not None:
+      return cached
+    profiled = copy.copy(block_parser)
+    profiled.rules = self._wrap_rules(
+      block_parser.rules, block_parser.types, block_parser.grammar.gen_block_pattern, 'block',
+    )
+    profiled.dispatch = DispatchTable(profiled.rules) if block_parser.dispatch is not None else None
+    if block_parser.inline_parser is not None:
+      profiled.inline_parser = self.wrap_inline_parser(block_parser.inline_parser)
+    # cache entries stay shared with the unprofiled parser
+    profiled._fingerprint = block_parser.fingerprint()
+    self._wrapped[block_parser] = profiled
+    return profiled
+
+  def report(self, sort: str = 'total_seconds', kind: Optional[str] = None) -> List[RuleStats]:
+    """Rule statistics, largest ``sort`` first."""
+    if sort not in SORT_KEYS:
+      raise ValueError('unknown sort key: {}'.format(repr(sort)))
+    stats = [s for s in self.stats.values() if kind is None or s.kind == kind]
+    return sorted(stats, key=lambda s: getattr(s, sort), reverse=True)
+
+  def format(self, sort: str = 'total_seconds', limit: Optional[int] = None) -> str:
+    lines = ['{:6}  {:>9}  {:>9}  {:>9}  {:>10}  {:>10}  {}'.format(
+      'kind', 'attempts', 'hits', 'misses', 'match ms', 'token ms', 'rule',
+    )]
+    for s in self.report(sort)[:limit]:
+      lines.append('{:6}  {:9d}  {:9d}  {:9d}  {:10.3f}  {:10.3f}  {}'.format(
+        s.kind, s.attempts, s.hits, s.misses, s.match_seconds * 1e3, s.tokenize_seconds * 1e3, s.owner,
+      ))
+    return '\n'.join(lines)
+
+  def clear(self):
+    for stats in self.stats.values():
+      stats.attempts = stats.hits = 0
+      stats.match_seconds = stats.tokenize_seconds = 0.0
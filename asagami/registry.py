@@ -0,0 +1,99 @@
+from typing import Callable, Dict, List, Optional, Union
+
+import importlib
+import threading
+
+from .module import BlockRenderer, BlockType, InlineRenderer, InlineType, Module
+
+ModuleFactory = Callable[[], Module]
+
+ENTRY_POINT_GROUP = 'asagami.modules'
+
+BUILTIN_MODULES = {
+  'code': 'asagami.modules.code:CodeModule',
+  'bold': 'asagami.modules.core:BoldModule',
+  'italic': 'asagami.modules.core:ItalicModule',
+  'underline': 'asagami.modules.core:UnderlineModule',
+  'link': 'asagami.modules.core:LinkModule',
+  'paragraph': 'asagami.modules.paragraph:ParagraphModule',
+  # names used by the spec; the code module has both the block and inline
+  'CodeBlockModule': 'asagami.modules.code:CodeModule',
+  'CodeInlineModule': 'asagami.modules.code:CodeModule',
+}
+
+
+class ResolvedModule:
+  """A module instance with its types and renderers, built once."""
+  __slots__ = ('module', 'block_types', 'inline_types', 'block_renderers', 'inline_renderers')
+
+  def __init__(self, module: Module):
+    self.module = module
+    self.block_types: List[BlockType] = list(module.get_block_types())
+    self.inline_types: List[InlineType] = list(module.get_inline_types())
+    self.block_renderers: List[BlockRenderer] = list(module.get_block_renderer())
+    self.inline_renderers: List[InlineRenderer] = list(module.get_inline_renderer())
+
+
+def import_factory(spec: str) -> ModuleFactory:
+  """The class or factory named by ``package.module:attribute``."""
+  module_name, _, attribute = spec.partition(':')
+  if not attribute:
+    raise ValueError('expected package.module:attribute, got {!r}'.format(spec))
+  return getattr(importlib.import_module(module_name), attribute)
+
+
+class ModuleRegistry:
+  """Maps ``::usemodule:`` names to modules, importing them on first use.
+
+  Names are registered as ``package.module:attribute`` specs or as
+  factories; nothing is imported until a document asks for the name, and a
+  resolved module is kept for every later document. Names not registered
+  are looked up in the ``asagami.modules`` entry points of installed
+  packages, which are only read on such a miss.
+  """
+
+  def __init__(self, modules: Optional[Dict[str, Union[str, ModuleFactory]]] = None):
+    self._targets: Dict[str, Union[str, ModuleFactory]] = dict(modules or {})
+    self._resolved: Dict[str, ResolvedModule] = {}
+    self._entry_points: Optional[Dict[str, str]] = None
+    self._lock = threading.Lock()
+
+  def register(self, name: str, target: Union[str, ModuleFactory]):
+    with self._lock:
+      self._targets[name] = target
+      self._resolved.pop(name, None)
+
+  def __contains__(self, name: str) -> bool:
+    return name in self._targets or name in self._installed()
+
+  def resolved(self) -> List[str]:
+    """Names imported so far."""
+    return list(self._resolved)
+
+  def resolve(self, name: str) -> ResolvedModule:
+    resolved = self._resolved.get(name)
+    if resolved is not None:
+      return resolved
+    with self._lock:
+      resolved = self._resolved.get(name)
+      if resolved is None:
+        target = self._targets.get(name) or self._installed().get(name)
+        if target is None:
+          raise LookupError('unknown module: {!r}'.format(name))
+        factory = import_factory(target) if isinstance(target, str) else target
+        resolved = self._resolved[name] = ResolvedModule(factory())
+    return resolved
+
+  def _installed(self) -> Dict[str, str]:
+    if self._entry_points is None:
+      from importlib.metadata import entry_points
+      try:
+        found = entry_points(group=ENTRY_POINT_GROUP)
+      except TypeError:  # python < 3.10
+        found = entry_points().get(ENTRY_POINT_GROUP, [])
+      self._entry_points = {entry_point.name: entry_point.value for entry_point in found}
+    return self._entry_points
+
+
+def default_registry() -> ModuleRegistry:
+  return ModuleRegistry(BUILTIN_MODULES)
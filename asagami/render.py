@@ -0,0 +1,235 @@
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+import asyncio
+import hashlib
+import html
+
+from .digest import signature
+from .document import Document, DocumentEnvironment, DocumentMetaData
+from .module import BlockRenderer, InlineRenderer, Module
+from .token import TEXT_TOKEN_NAME, BlockToken, InlineToken
+
+if TYPE_CHECKING:
+  from .cache import RenderCache
+  from .registry import ModuleRegistry
+
+Sink = Callable[[str], Any]
+
+
+class TextInlineRenderer(InlineRenderer):
+  def get_name(self):
+    return TEXT_TOKEN_NAME
+
+  def render_html(self, token: InlineToken, env: DocumentEnvironment):
+    return html.escape(token.value, quote=False)
+
+
+class HtmlWriter:
+  """Where renderers write their output while a document is rendered."""
+  __slots__ = ('engine', 'env', 'write', 'context')
+
+  def __init__(
+      self,
+      engine: 'HtmlRenderEngine',
+      env: DocumentEnvironment,
+      write: Sink,
+      context: Optional[bytes] = None,
+  ):
+    self.engine = engine
+    self.env = env
+    self.write = write
+    # what render cache keys of this document's blocks start with
+    self.context = context
+
+  def write_inline(self, tokens: Iterable[InlineToken]):
+    """Render inline tokens, e.g. a block's ``children``, in place."""
+    self.engine.write_inline(tokens, self)
+
+
+class HtmlRenderEngine:
+  """Renders documents to HTML by writing chunks straight to a sink.
+
+  Renderers are looked up by token name in tables built from the modules'
+  ``get_block_renderer``/``get_inline_renderer``; later modules override
+  earlier ones. With a ``registry``, the renderers of a document's
+  ``::usemodule:`` modules are added the first time one is rendered,
+  without replacing any already there.
+
+  With a ``cache``, the HTML of blocks whose renderer is ``cacheable`` is
+  kept in a ``RenderCache`` and reused for equal blocks in any document.
+  Children are not part of the key, so documents are assumed to be parsed
+  with the modules given here and their ``::usemodule:`` ones.
+  """
+  block_renderers: Dict[str, BlockRenderer]
+  inline_renderers: Dict[str, InlineRenderer]
+
+  def __init__(
+      self,
+      modules: List[Module],
+      registry: Optional['ModuleRegistry'] = None,
+      cache: Optional['RenderCache'] = None,
+  ):
+    self.block_renderers = {}
+    self.inline_renderers = {TEXT_TOKEN_NAME: TextInlineRenderer()}
+    for module in modules:
+      for renderer in module.get_block_renderer():
+        self.block_renderers[renderer.get_name()] = renderer
+      for renderer in module.get_inline_renderer():
+        self.inline_renderers[renderer.get_name()] = renderer
+    self.registry = registry
+    self.cache = cache
+    self._loaded = {module.get_name() for module in modules}
+    self._signature: Optional[bytes] = None
+
+  def load_modules(self, metadata: Optional[DocumentMetaData]):
+    """Add the renderers of the ``::usemodule:`` modules not loaded yet."""
+    if self.registry is None or metadata is None:
+      return
+    for name in metadata.modules:
+      if name in self._loaded:
+        continue
+      resolved = self.registry.resolve(name)
+      for renderer in resolved.block_renderers:
+        self.block_renderers.setdefault(renderer.get_name(), renderer)
+      for renderer in resolved.inline_renderers:
+        self.inline_renderers.setdefault(renderer.get_name(), renderer)
+      self._loaded.add(name)
+      self._signature = None
+
+  def _context(self, metadata: Optional[DocumentMetaData]) -> bytes:
+    """Digest of the renderers and the document's modules."""
+    if self._signature is None:
+      self._signature = repr([
+        [[name, signature(renderer)] for name, renderer in sorted(self.block_renderers.items())],
+        [[name, signature(renderer)] for name, renderer in sorted(self.inline_renderers.items())],
+      ]).encode('utf-8')
+    digest = hashlib.sha256(self._signature)
+    digest.update(repr(metadata.modules if metadata is not None else []).encode('utf-8'))
+    return digest.digest()
+
+  def _writer(self, document: Document, env: Optional[DocumentEnvironment], write: Sink) -> HtmlWriter:
+    self.load_modules(document.metadata)
+    context = self._context(document.metadata) if self.cache is not None else None
+    return HtmlWriter(self, env if env is not None else DocumentEnvironment(), write, context)
+
+  def write_block(self, token: BlockToken, out: HtmlWriter):
+    renderer = self.block_renderers.get(token.name)
+    if renderer is None:
+      raise RuntimeError('no renderer for block: {}'.format(token.name))
+    if out.context is None or not renderer.cacheable:
+      renderer.write_html(token, out.env, out)
+      return
+    key = self.cache.key(out.context, token)
+    cached = self.cache.get(key)
+    if cached is None:
+      chunks: List[str] = []
+      renderer.write_html(token, out.env, HtmlWriter(self, out.env, chunks.append, out.context))
+      cached = ''.join(chunks)
+      self.cache.put(key, cached)
+    out.write(cached)
+
+  def write_inline(self, tokens: Iterable[InlineToken], out: HtmlWriter):
+    renderers = self.inline_renderers
+    for token in tokens:
+      renderer = renderers.get(token.name)
+      if renderer is None:
+        raise RuntimeError('no renderer for inline: {}'.format(token.name))
+      renderer.write_html(token, out.env, out)
+
+  def render(
+      self,
+      document: Document,
+      sink: Union[Sink, Any],
+      env: Optional[DocumentEnvironment] = None,
+  ):
+    """Write ``document`` to ``sink``, a file-like object or a callable.
+
+    Blocks are rendered one by one as ``document.blocks`` is iterated, so a
+    document from ``Parser.iter_parse`` is rendered while it is read.
+    """
+    write = getattr(sink, 'write', sink)
+    out = self._writer(document, env, write)
+    for token in document.blocks:
+      self.write_block(token, out)
+      write('\n')
+
+  def iter_render(
+      self,
+      document: Document,
+      env: Optional[DocumentEnvironment] = None,
+      chunk_size: int = 8192,
+      encoding: Optional[str] = None,
+  ) -> Iterator[Union[str, bytes]]:
+    """Render ``document`` as an iterator of chunks, e.g. a WSGI body.
+
+    Output is grouped into chunks of about ``chunk_size`` characters, cut
+    between blocks; with ``encoding`` the chunks are encoded to bytes.
+    """
+    yield from self._iter_render(document, env, chunk_size, encoding)
+
+  async def aiter_render(
+      self,
+      document: Document,
+      env: Optional[DocumentEnvironment] = None,
+      chunk_size: int = 8192,
+      encoding: Optional[str] = None,
+      yield_every: int = 64,
+  ) -> AsyncIterator[Union[str, bytes]]:
+    """``iter_render`` as an async iterator for event loop servers.
+
+    The event loop gets a turn after every chunk and at least every
+    ``yield_every`` blocks, so other requests are served while a large
+    document renders.
+    """
+    for chunk in self._iter_render(document, env, chunk_size, encoding, yield_every):
+      if chunk is not None:
+        yield chunk
+      await asyncio.sleep(0)
+
+  def _iter_render(
+      self,
+      document: Document,
+      env: Optional[DocumentEnvironment],
+      chunk_size: int,
+      encoding: Optional[str],
+      yield_every: int = 0,
+  ) -> Iterator[Union[str, bytes, None]]:
+    # ``None`` marks a pause every ``yield_every`` blocks without a chunk
+    chunks: List[str] = []
+    size = 0
+
+    def write(chunk: str):
+      nonlocal size
+      chunks.append(chunk)
+      size += len(chunk)
+
+    out = self._writer(document, env, write)
+    pending = 0
+    for token in document.blocks:
+      self.write_block(token, out)
+      write('\n')
+      pending += 1
+      if size >= chunk_size:
+        yield self._flush(chunks, encoding)
+        size = 0
+        pending = 0
+      elif pending == yield_every:
+        yield None
+        pending = 0
+    if chunks:
+      yield self._flush(chunks, encoding)
+
+  @staticmethod
+  def _flush(chunks: List[str], encoding: Optional[str]) -> Union[str, bytes]:
+    chunk = ''.join(chunks)
+    chunks.clear()
+    if encoding is not None:
+      return chunk.encode(encoding)
+    return chunk
+
+  def render_to_string(
+      self,
+      document: Document,
+      env: Optional[DocumentEnvironment] = None,
+  ) -> str:
+    return ''.join(self.iter_render(document, env))
@@ -0,0 +1,224 @@
+from typing import Any, Callable, Dict, List, Optional, Pattern, Tuple
+
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+from collections import OrderedDict
+
+import _sre
+
+try:
+  from re import _compiler as sre_compile, _parser as sre_parse
+except ImportError:  # python < 3.11
+  import sre_compile
+  import sre_parse
+
+from .digest import signature
+from .dispatch import first_chars
+from .module import BlockType, InlineType
+from .parser import (
+  BlockParser,
+  Grammar,
+  InlineParser,
+  Parser,
+  gen_name_alternation,
+  unanchor_pattern,
+)
+
+VERSION = 1
+
+# compiled pattern programs are only valid for the engine that made them
+ENGINE = [sys.implementation.name, list(sys.version_info[:2]), _sre.MAGIC, _sre.CODESIZE]
+
+
+def snapshot_key(
+    block_types: List[BlockType],
+    inline_types: List[InlineType],
+    grammar: Grammar,
+    compiled: bool,
+) -> str:
+  """What a snapshot is valid for.
+
+  Covers the engine, the grammar and every type: its class, its ``version``
+  attribute and the code of its methods. Bump ``version`` when a type's
+  patterns change through code outside its class, e.g. a module-level regex.
+  """
+  return hashlib.sha256(json.dumps([
+    VERSION,
+    ENGINE,
+    signature(grammar),
+    compiled,
+    [signature(t) + [t.get_name()] for t in block_types],
+    [signature(t) + [t.get_name()] for t in inline_types],
+  ]).encode('utf-8')).hexdigest()
+
+
+def _dump_pattern(pattern: Pattern) -> Optional[list]:
+  if not isinstance(pattern, re.Pattern) or not isinstance(pattern.pattern, str):
+    return None
+  parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+  code = sre_compile._code(parsed, pattern.flags)
+  return [pattern.pattern, pattern.flags | parsed.state.flags, code, parsed.state.groups, parsed.state.groupdict]
+
+
+def _load_pattern(data: list) -> Pattern:
+  source, flags, code, groups, groupindex = data
+  indexgroup = [None] * groups
+  for name, index in groupindex.items():
+    indexgroup[index] = name
+  return _sre.compile(source, flags, code, groups - 1, groupindex, tuple(indexgroup))
+
+
+def _origin_key(pattern: Any) -> Any:
+  # matchers like ``FenceMatcher`` are new objects on every ``get_patterns``
+  if isinstance(pattern, re.Pattern):
+    return pattern
+  return type(pattern), getattr(pattern, 'pattern', None)
+
+
+def _dump_rules(rules: Dict[Pattern, Callable], types: List[Any], gen_pattern: Callable[[str], Pattern]) -> list:
+  origins: Dict[Any, list] = {}
+  for i, t in enumerate(types):
+    for j, pattern in enumerate(t.get_patterns()):
+      origins.setdefault(_origin_key(unanchor_pattern(pattern)), ['type', i, j])
+    for j, pattern in enumerate(getattr(t, 'get_fallback_patterns', list)()):
+      origins.setdefault(_origin_key(unanchor_pattern(pattern)), ['fallback', i, j])
+  names = list(OrderedDict.fromkeys(t.get_name() for t in types))
+  for name in names:
+    origins.setdefault(unanchor_pattern(gen_pattern(name)), ['name', name])
+  if names:
+    origins.setdefault(unanchor_pattern(gen_pattern(gen_name_alternation(names))), ['names'])
+
+  dumped = []
+  for pattern in rules:
+    origin = origins.get(_origin_key(pattern))
+    if origin is None:
+      raise ValueError('rule not built from its types: {!r}'.format(getattr(pattern, 'pattern', pattern)))
+    firsts = first_chars(pattern)
+    dumped.append([origin, _dump_pattern(pattern), sorted(firsts) if firsts is not None else None])
+  return dumped
+
+
+def _load_rules(
+    data: list,
+    types: List[Any],
+    grammar: Grammar,
+    parser_class: type,
+) -> Tuple['OrderedDict[Pattern, Callable]', list]:
+  rules = OrderedDict()
+  firsts = []
+  tokenizers: Dict[int, Callable] = {}
+  patterns: Dict[Tuple[str, int], list] = {}
+  for origin, pattern_data, chars in data:
+    kind = origin[0]
+    if kind in ('type', 'fallback'):
+      i, j = origin[1:]
+      if i not in tokenizers:
+        tokenizers[i] = types[i].get_tokenizer()
+      tokenizer = tokenizers[i]
+    elif kind == 'name':
+      tokenizer = parser_class._gen_tokenizer(grammar, origin[1])
+    else:
+      names = list(OrderedDict.fromkeys(t.get_name() for t in types))
+      tokenizer = parser_class._gen_named_tokenizer(grammar, names)
+    if pattern_data is not None:
+      pattern = _load_pattern(pattern_data)
+    else:
+      # not a regex, so only a type's own patterns get here: ask it again
+      if (kind, i) not in patterns:
+        t = types[i]
+        patterns[kind, i] = t.get_patterns() if kind == 'type' else t.get_fallback_patterns()
+      pattern = unanchor_pattern(patterns[kind, i][j])
+    rules[pattern] = tokenizer
+    firsts.append(frozenset(chars) if chars is not None else None)
+  return rules, firsts
+
+
+class GrammarSnapshot:
+  """A built ``BlockParser``/``InlineParser`` pair frozen to a file.
+
+  Keeps the rules in order with their compiled pattern programs and first
+  characters, and where each tokenizer comes from. ``build`` turns it back
+  into parsers without generating, parsing or compiling any pattern, as
+  long as the types, grammar and Python match ``key``.
+  """
+
+  def __init__(self, key: str, compiled: bool, block_rules: list, inline_rules: list):
+    self.key = key
+    self.compiled = compiled
+    self.block_rules = block_rules
+    self.inline_rules = inline_rules
+
+  @classmethod
+  def capture(cls, block_parser: BlockParser) -> 'GrammarSnapshot':
+    grammar = block_parser.grammar
+    inline_parser = block_parser.inline_parser
+    compiled = block_parser.dispatch is not None
+    return cls(
+      snapshot_key(block_parser.types, inline_parser.types, grammar, compiled),
+      compiled,
+      _dump_rules(block_parser.rules, block_parser.types, grammar.gen_block_pattern),
+      _dump_rules(inline_parser.rules, inline_parser.types, grammar.gen_inline_pattern),
+    )
+
+  def build(
+      self,
+      block_types: List[BlockType],
+      inline_types: List[InlineType],
+      grammar: Grammar,
+  ) -> Optional[BlockParser]:
+    """Parsers for these types, or ``None`` if the snapshot is stale."""
+    if snapshot_key(block_types, inline_types, grammar, self.compiled) != self.key:
+      return None
+    rules, firsts = _load_rules(self.inline_rules, inline_types, grammar, InlineParser)
+    inline_parser = InlineParser(inline_types, grammar, self.compiled, rules, firsts)
+    rules, firsts = _load_rules(self.block_rules, block_types, grammar, BlockParser)
+    return BlockParser(block_types, inline_parser, grammar, self.compiled, rules, firsts)
+
+  @classmethod
+  def of(cls, parser: Parser) -> 'GrammarSnapshot':
+    """Snapshot of the parsers ``parser`` uses for documents with no header."""
+    block_types, inline_types = parser.load_modules(None)
+    return cls.capture(parser.cache.get(block_types, inline_types, parser.grammar, parser.compiled))
+
+  def install(self, parser: Parser) -> bool:
+    """Put the parsers built by ``build`` into ``parser.cache``.
+
+    Returns ``False``, changing nothing, if the snapshot is stale or was
+    taken with another ``compiled`` setting.
+    """
+    if self.compiled != parser.compiled:
+      return False
+    block_parser = self.build(*parser.load_modules(None), parser.grammar)
+    if block_parser is None:
+      return False
+    parser.cache.add(block_parser)
+    return True
+
+  @classmethod
+  def load(cls, path: str) -> 'GrammarSnapshot':
+    with open(path, encoding='utf-8') as f:
+      data = json.load(f)
+    if data.get('version') != VERSION:
+      raise ValueError('unsupported grammar snapshot version: {}'.format(repr(data.get('version'))))
+    return cls(data['key'], data['compiled'], data['block'], data['inline'])
+
+  def save(self, path: str):
+    data = {
+      'version': VERSION,
+      'key': self.key,
+      'compiled': self.compiled,
+      'block': self.block_rules,
+      'inline': self.inline_rules,
+    }
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+      os.replace(tmp, path)
+    except BaseException:
+      os.remove(tmp)
+      raise
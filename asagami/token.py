@@ -1,24 +1,142 @@
-from typing import Dict, List, Union
+from typing import Callable, List, Mapping, Optional, Tuple, Union
 
-TokenAttributes = Dict[str, Union[str, List[str]]]
+import sys
+from types import MappingProxyType
+
+TokenAttributes = Mapping[str, Union[str, Tuple[str, ...]]]
+Buffer = Union[bytes, bytearray, memoryview]
+
+TEXT_TOKEN_NAME = 'text'
+
+# Shared by every token without attributes; read-only so that one token
+# cannot leak attributes into the others.
+EMPTY_ATTRIBUTES: TokenAttributes = MappingProxyType({})
+
+
+# token text groups that span-mode parsing hands to tokenizers as
+# ``TextSpan``s instead of copies
+SPAN_GROUPS = frozenset(['body', 'value', 'code'])
+
+
+def _attributes(attributes: TokenAttributes) -> TokenAttributes:
+  return attributes if attributes else EMPTY_ATTRIBUTES
+
+
+class TextSpan:
+  """``source[start:end]``, copied out only when converted with ``str()``.
+
+  ``source`` is the ``str`` that was parsed, or a bytes-like buffer of UTF-8
+  (``bytes``, ``memoryview``, ``mmap``) whose byte offsets ``start`` and
+  ``end`` are; such spans are decoded on conversion.
+  """
+  __slots__ = ('source', 'start', 'end')
+
+  def __init__(self, source: Union[str, Buffer], start: int, end: int):
+    self.source = source
+    self.start = start
+    self.end = end
+
+  def __str__(self) -> str:
+    source = self.source
+    if isinstance(source, str):
+      return source[self.start:self.end]
+    return str(memoryview(source)[self.start:self.end], 'utf-8')
+
+  def __len__(self) -> int:
+    return self.end - self.start
+
+  def __eq__(self, other):
+    if isinstance(other, (str, TextSpan)):
+      return str(self) == str(other)
+    return NotImplemented
+
+  def __hash__(self):
+    return hash(str(self))
+
+  def __repr__(self):
+    return '<TextSpan {}:{}>'.format(self.start, self.end)
+
+
+TokenText = Union[str, TextSpan]
 
 
 class BlockToken:
-  def __init__(self, name: str, body: str, attributes: TokenAttributes):
-    self.name = name
-    self.attributes = attributes
-    self.body = body
+  __slots__ = ('name', 'attributes', '_body', '_children')
+
+  def __init__(self, name: str, body: TokenText, attributes: TokenAttributes):
+    self.name = sys.intern(name)
+    self.attributes = _attributes(attributes)
+    self._body = body
+    self._children = None
+
+  @property
+  def body(self) -> str:
+    """The body text; a ``TextSpan`` body is sliced again on every access."""
+    body = self._body
+    return str(body) if body.__class__ is TextSpan else body
+
+  @body.setter
+  def body(self, body: TokenText):
+    self._body = body
+
+  @property
+  def span(self) -> Optional[TextSpan]:
+    """Where the body lies in the source, if it was parsed with spans."""
+    body = self._body
+    return body if body.__class__ is TextSpan else None
+
+  @property
+  def children(self) -> Optional[List['InlineToken']]:
+    """Inline tokens of the body, or ``None`` if it was not inline-parsed.
+
+    The children may be set to a callable taking this token, which is called
+    on first access and replaced by its result.
+    """
+    children = self._children
+    if callable(children):
+      children = self._children = children(self)
+    return children
+
+  @children.setter
+  def children(
+      self,
+      children: Union[None, List['InlineToken'], Callable[['BlockToken'], Optional[List['InlineToken']]]],
+  ):
+    self._children = children
+
+  @property
+  def has_children(self) -> bool:
+    """Whether ``children`` is set or pending, without building pending ones."""
+    return self._children is not None
 
 
 class InlineToken:
-  def __init__(self, name: str, value: str, attributes: TokenAttributes):
-    self.name = name
-    self.attributes = attributes
-    self.value = value
+  __slots__ = ('name', 'attributes', '_value')
+
+  def __init__(self, name: str, value: TokenText, attributes: TokenAttributes):
+    self.name = sys.intern(name)
+    self.attributes = _attributes(attributes)
+    self._value = value
+
+  @property
+  def value(self) -> str:
+    value = self._value
+    return str(value) if value.__class__ is TextSpan else value
+
+  @value.setter
+  def value(self, value: TokenText):
+    self._value = value
+
+  @property
+  def span(self) -> Optional[TextSpan]:
+    value = self._value
+    return value if value.__class__ is TextSpan else None
 
 
 class ParagraphToken:
+  __slots__ = ('name', 'attributes', 'children')
+
   def __init__(self, name: str, children: List[InlineToken], attributes: TokenAttributes):
-    self.name = name
-    self.attributes = attributes
+    self.name = sys.intern(name)
+    self.attributes = _attributes(attributes)
     self.children = children
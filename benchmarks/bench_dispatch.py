@@ -0,0 +1,119 @@
+"""Compare the linear rule walk with the compiled dispatch table.
+
+Run with ``python -m benchmarks.bench_dispatch``. For a growing number of
+registered modules, both modes parse the same block and inline inputs; the
+linear walk gets slower with every module while the compiled mode should
+stay roughly flat. ``InlineParser`` always dispatches on the first character,
+so for inline input the comparison is down to merging the ``:name:`` rules.
+"""
+from typing import List
+
+import argparse
+import random
+import re
+import sys
+import time
+
+from asagami.module import BlockType, InlineType
+from asagami.parser import BlockParser, InlineParser
+
+MODULE_COUNTS = [1, 5, 10, 25, 50, 100]
+
+
+class SyntheticBlockType(BlockType):
+  def __init__(self, index: int):
+    self.name = 'block{:03d}'.format(index)
+    self.fence = chr(ord('!') + index % 15) * 3
+
+  def get_name(self):
+    return self.name
+
+  def get_patterns(self):
+    return [re.compile(re.escape(self.fence) + r'(?P<body>[^\n]*)\n')]
+
+  @staticmethod
+  def tokenizer(match):
+    pass
+
+
+class SyntheticInlineType(InlineType):
+  def __init__(self, index: int):
+    self.name = 'inline{:03d}'.format(index)
+    self.sentinel = chr(ord('!') + index % 15)
+
+  def get_name(self):
+    return self.name
+
+  def get_patterns(self):
+    sentinel = re.escape(self.sentinel * 2)
+    return [re.compile(sentinel + r'(?P<value>[^\n]+?)' + sentinel)]
+
+  @staticmethod
+  def tokenizer(match):
+    pass
+
+
+def gen_block_text(names: List[str], count: int, rng: random.Random) -> str:
+  return ''.join(
+    '.. {}\n    .. lang: python\n    body line\n'.format(rng.choice(names))
+    for _ in range(count)
+  )
+
+
+def gen_inline_text(names: List[str], count: int, rng: random.Random) -> str:
+  return ''.join(
+    ':{}:{{value}}'.format(rng.choice(names))
+    for _ in range(count)
+  )
+
+
+def timeit(parse, text: str, repeat: int) -> float:
+  best = float('inf')
+  for _ in range(repeat):
+    start = time.perf_counter()
+    parse(text)
+    best = min(best, time.perf_counter() - start)
+  return best
+
+
+def main(argv=None):
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument('--tokens', type=int, default=5000)
+  arg_parser.add_argument('--repeat', type=int, default=3)
+  arg_parser.add_argument('--seed', type=int, default=0)
+  args = arg_parser.parse_args(argv)
+
+  print('{:>7} {:>6} {:>12} {:>12} {:>8}'.format('modules', 'kind', 'linear s', 'compiled s', 'speedup'))
+  for count in MODULE_COUNTS:
+    rng = random.Random(args.seed)
+    block_types = [SyntheticBlockType(i) for i in range(count)]
+    inline_types = [SyntheticInlineType(i) for i in range(count)]
+
+    block_text = gen_block_text([t.get_name() for t in block_types], args.tokens, rng)
+    inline_text = gen_inline_text([t.get_name() for t in inline_types], args.tokens, rng)
+
+    cases = [
+      (
+        'block',
+        BlockParser(block_types, None),
+        BlockParser(block_types, None, compiled=True),
+        block_text,
+      ),
+      (
+        'inline',
+        InlineParser(inline_types),
+        InlineParser(inline_types, compiled=True),
+        inline_text,
+      ),
+    ]
+    for kind, linear, compiled, text in cases:
+      linear_time = timeit(linear.parse, text, args.repeat)
+      compiled_time = timeit(compiled.parse, text, args.repeat)
+      print('{:>7} {:>6} {:>12.4f} {:>12.4f} {:>7.1f}x'.format(
+        count, kind, linear_time, compiled_time, linear_time / compiled_time,
+      ))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
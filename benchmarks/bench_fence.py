@@ -0,0 +1,51 @@
+"""Pathological inputs for the fenced code matcher.
+
+Run with ``python -m benchmarks.bench_fence``. Each case is matched with
+the former backtracking regex and with ``FenceMatcher``; the new matcher
+should scale linearly with the input size. ``CASES`` is shared with the
+time-bound tests in ``tests/test_code.py``.
+"""
+import argparse
+import re
+import sys
+import time
+
+from asagami.modules.code import FenceMatcher
+
+LEGACY_PATTERN = re.compile(r"```(?P<lang>[^\n]*)(?=\n)(?P<code>(\n.*(?!```))*)\n```")
+
+CASES = {
+  'unterminated': lambda n: '```python\n' + 'x = "`` `"\n' * n,
+  'nested backticks': lambda n: '```\n' + '```x\n`` ``\n' * n + '```',
+  'long line': lambda n: '```\n' + '`' * (n * 10),
+  'backtick line': lambda n: '`' * (n * 10),
+  'almost closed': lambda n: '```\n' + '\n```x' * n,
+  'many fences': lambda n: '```\nx\n```\n' * n,
+}
+
+SIZES = [1000, 10000, 100000]
+
+
+def timeit(func, text: str) -> float:
+  start = time.perf_counter()
+  func(text)
+  return time.perf_counter() - start
+
+
+def main(argv=None):
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument('--legacy-max', type=int, default=SIZES[-1])
+  args = arg_parser.parse_args(argv)
+
+  matcher = FenceMatcher()
+  print('{:<18} {:>8} {:>12} {:>12}'.format('case', 'lines', 'legacy s', 'matcher s'))
+  for name, gen in CASES.items():
+    for size in SIZES:
+      text = gen(size)
+      legacy = timeit(LEGACY_PATTERN.match, text) if size <= args.legacy_max else float('nan')
+      print('{:<18} {:>8} {:>12.4f} {:>12.4f}'.format(name, size, legacy, timeit(matcher.match, text)))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
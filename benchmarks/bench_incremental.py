@@ -0,0 +1,58 @@
+"""Keystroke latency of ``BlockParser.reparse`` against a full parse.
+
+Run with ``python -m benchmarks.bench_incremental``. A character is typed
+into the middle block of documents of growing length; ``reparse`` should
+stay flat while the full parse grows with the block count. ``--check``
+fails the run when it does not.
+"""
+import argparse
+import sys
+import time
+
+from asagami.parser import BlockParser
+
+from .bench_scanning import BLOCK_UNIT, NoteBlockType
+
+BLOCK_COUNTS = [100, 1000, 10000, 100000]
+
+
+def best_of(func, repeat: int) -> float:
+  best = float('inf')
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    best = min(best, time.perf_counter() - start)
+  return best
+
+
+def main(argv=None):
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument('--repeat', type=int, default=5)
+  arg_parser.add_argument(
+    '--check', type=float, default=None, metavar='RATIO',
+    help='exit with status 1 if reparse on the largest document takes more '
+         'than this many times as long as on the smallest',
+  )
+  args = arg_parser.parse_args(argv)
+
+  parser = BlockParser([NoteBlockType()], None)
+  print('{:>8} {:>12} {:>12}'.format('blocks', 'full ms', 'reparse ms'))
+  latencies = []
+  for count in BLOCK_COUNTS:
+    text = BLOCK_UNIT * count
+    previous = parser.parse_blocks(text)
+    offset = previous.starts[count // 2] + BLOCK_UNIT.index('ninja')
+
+    full = best_of(lambda: parser.parse_blocks(text[:offset] + 'x' + text[offset:]), args.repeat)
+    incremental = best_of(lambda: parser.reparse(previous, offset, 0, 'x'), args.repeat)
+    print('{:>8} {:>12.3f} {:>12.3f}'.format(count, full * 1e3, incremental * 1e3))
+    latencies.append(incremental)
+  ratio = latencies[-1] / latencies[0]
+  print('reparse growth: {:.1f}x over {}x the blocks'.format(ratio, BLOCK_COUNTS[-1] // BLOCK_COUNTS[0]))
+  if args.check is not None and ratio > args.check:
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
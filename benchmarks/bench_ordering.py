@@ -0,0 +1,110 @@
+"""Measure how adaptive rule ordering cuts failed match attempts.
+
+Run with ``python -m benchmarks.bench_ordering``. Hit counts are collected
+from a warm-up corpus with ``ParseProfile`` and applied with
+``RuleOrdering`` to parse a second corpus of the same mix. The report
+lists failed ``pat.match`` attempts per block and the parse time, with the
+registered rule order and with the adapted one.
+"""
+from typing import List
+
+import argparse
+import random
+import sys
+import time
+
+from asagami.module import BlockType, Module
+from asagami.modules.code import CodeModule
+from asagami.modules.paragraph import ParagraphModule
+from asagami.ordering import RuleOrdering
+from asagami.parser import INLINE_NONE, Parser, ParserCache
+from asagami.profiling import ParseProfile
+
+
+class NamedBlockType(BlockType):
+  def __init__(self, name: str):
+    self.name = name
+
+  def get_name(self):
+    return self.name
+
+  def get_patterns(self):
+    return []
+
+  @staticmethod
+  def tokenizer(match):
+    pass
+
+
+class NamedModule(Module):
+  def __init__(self, names: List[str]):
+    self.names = names
+
+  def get_name(self):
+    return 'named'
+
+  def get_block_types(self):
+    return [NamedBlockType(name) for name in self.names]
+
+
+def gen_modules(count: int) -> List[Module]:
+  names = ['note{:02d}'.format(i) for i in range(count)]
+  return [NamedModule(names), CodeModule(), ParagraphModule()]
+
+
+def gen_corpus(count: int, names: List[str], rng: random.Random) -> str:
+  blocks = []
+  for _ in range(count):
+    roll = rng.random()
+    if roll < 0.6:
+      blocks.append('some plain words\nand a second line\n\n')
+    elif roll < 0.9:
+      blocks.append('.. code\n    x = 1\n\n')
+    else:
+      blocks.append('.. {}\n    body\n\n'.format(rng.choice(names)))
+  return ''.join(blocks)
+
+
+def run(parser: Parser, text: str, repeat: int):
+  best = float('inf')
+  for _ in range(repeat):
+    start = time.perf_counter()
+    document = parser.parse(text, INLINE_NONE)
+    best = min(best, time.perf_counter() - start)
+  return best, len(document.blocks)
+
+
+def failed_per_block(modules: List[Module], ordering, text: str) -> float:
+  profile = ParseProfile()
+  parser = Parser(modules, cache=ParserCache(), profile=profile, ordering=ordering)
+  blocks = len(parser.parse(text, INLINE_NONE).blocks)
+  return sum(s.misses for s in profile.report(kind='block')) / blocks
+
+
+def main(argv=None):
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument('--blocks', type=int, default=5000)
+  arg_parser.add_argument('--types', type=int, default=20)
+  arg_parser.add_argument('--repeat', type=int, default=3)
+  arg_parser.add_argument('--seed', type=int, default=0)
+  args = arg_parser.parse_args(argv)
+
+  modules = gen_modules(args.types)
+  names = [t.get_name() for t in modules[0].get_block_types()]
+  warmup = gen_corpus(args.blocks, names, random.Random(args.seed))
+  text = gen_corpus(args.blocks, names, random.Random(args.seed + 1))
+
+  profile = ParseProfile()
+  Parser(modules, cache=ParserCache(), profile=profile).parse(warmup, INLINE_NONE)
+  ordering = RuleOrdering.from_profile(profile)
+
+  print('{:>10} {:>14} {:>10}'.format('order', 'failed/block', 'parse s'))
+  for label, current in (('registered', None), ('adaptive', ordering)):
+    failed = failed_per_block(modules, current, text)
+    seconds, _ = run(Parser(modules, cache=ParserCache(), ordering=current), text, args.repeat)
+    print('{:>10} {:>14.2f} {:>10.4f}'.format(label, failed, seconds))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
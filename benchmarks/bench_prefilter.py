@@ -0,0 +1,77 @@
+"""Compare inline parsing of sparse markup with a bare character search.
+
+Run with ``python -m benchmarks.bench_prefilter``. Long paragraphs with one
+markup span every ``--gap`` characters are parsed by ``InlineParser`` with
+the default modules, by the same parser stepping one character at a time
+(the behaviour before the prefilter), and scanned by a single ``re``
+search for the sentinel characters, which is the floor.
+"""
+import argparse
+import sys
+import time
+
+from asagami.batch import default_modules
+from asagami.parser import InlineParser
+
+GAPS = [16, 64, 256, 1024, 4096]
+MARKUP = [':code:{x}', '*bold*', '/italic/', '_under_', '`code`']
+
+
+def gen_text(size: int, gap: int) -> str:
+  filler = 'lorem ipsum dolor sit amet, consectetur adipiscing elit '
+  chunks = []
+  length = 0
+  index = 0
+  while length < size:
+    chunk = (filler * (gap // len(filler) + 1))[:gap] + MARKUP[index % len(MARKUP)]
+    chunks.append(chunk)
+    length += len(chunk)
+    index += 1
+  return ''.join(chunks)
+
+
+def timeit(func, repeat: int) -> float:
+  best = float('inf')
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    best = min(best, time.perf_counter() - start)
+  return best
+
+
+def main(argv=None):
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument('--size', type=int, default=1 << 20)
+  arg_parser.add_argument('--repeat', type=int, default=3)
+  args = arg_parser.parse_args(argv)
+
+  inline_types = [t for module in default_modules() for t in module.get_inline_types()]
+  parser = InlineParser(inline_types)
+  stepping = InlineParser(inline_types)
+  stepping.dispatch.skip = None
+  sentinels = parser.dispatch.skip
+
+  def scan(text):
+    pos = 0
+    while True:
+      found = sentinels.search(text, pos)
+      if found is None:
+        return
+      pos = found.end()
+
+  print('{:>6} {:>12} {:>12} {:>12} {:>8}'.format('gap', 'search MB/s', 'skip MB/s', 'step MB/s', 'speedup'))
+  for gap in GAPS:
+    text = gen_text(args.size, gap)
+    assert [t.value for t in parser.parse(text)] == [t.value for t in stepping.parse(text)]
+    megabytes = len(text) / 1e6
+    search_time = timeit(lambda: scan(text), args.repeat)
+    skip_time = timeit(lambda: parser.parse(text), args.repeat)
+    step_time = timeit(lambda: stepping.parse(text), args.repeat)
+    print('{:>6} {:>12.1f} {:>12.1f} {:>12.1f} {:>7.1f}x'.format(
+      gap, megabytes / search_time, megabytes / skip_time, megabytes / step_time, step_time / skip_time,
+    ))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,72 @@
+"""Time to first byte and peak memory of the streaming render pipeline.
+
+Run with ``python -m benchmarks.bench_render``. Blocks are parsed from a
+generated line stream and rendered through ``HtmlRenderEngine.iter_render``
+into a discarding sink; both the time to the first chunk and the peak
+memory should stay flat as the document grows.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+from asagami.document import Document
+from asagami.module import BlockRenderer, Module
+from asagami.modules.core import BoldInlineType, BoldModule
+from asagami.parser import BlockParser, InlineParser
+from asagami.render import HtmlRenderEngine
+
+from .bench_scanning import NoteBlockType
+from .bench_streaming import gen_lines
+
+BLOCK_COUNTS = [1000, 10000, 100000]
+
+
+class NoteRenderer(BlockRenderer):
+  def get_name(self):
+    return 'note'
+
+  def write_html(self, token, env, out):
+    out.write('<div class="note">')
+    out.write_inline(token.children)
+    out.write('</div>')
+
+
+class NoteModule(Module):
+  def get_name(self):
+    return 'note'
+
+  def get_block_renderer(self):
+    return [NoteRenderer()]
+
+
+def main(argv=None):
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument('--max-blocks', type=int, default=BLOCK_COUNTS[-1])
+  args = arg_parser.parse_args(argv)
+
+  parser = BlockParser([NoteBlockType()], InlineParser([BoldInlineType()]))
+  engine = HtmlRenderEngine([BoldModule(), NoteModule()])
+  print('{:>8} {:>10} {:>10} {:>14}'.format('blocks', 'ttfb ms', 'total s', 'peak bytes'))
+  for count in BLOCK_COUNTS:
+    if count > args.max_blocks:
+      break
+    document = Document(None, parser.iter_parse(gen_lines(count)))
+    tracemalloc.start()
+    try:
+      start = time.perf_counter()
+      chunks = engine.iter_render(document, encoding='utf-8')
+      next(chunks)
+      ttfb = time.perf_counter() - start
+      for _ in chunks:
+        pass
+      total = time.perf_counter() - start
+      _, peak = tracemalloc.get_traced_memory()
+    finally:
+      tracemalloc.stop()
+    print('{:>8} {:>10.3f} {:>10.3f} {:>14}'.format(count, ttfb * 1e3, total, peak))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
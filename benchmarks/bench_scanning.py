@@ -0,0 +1,98 @@
+"""Scaling benchmark for the block and inline scanners.
+
+Run with ``python -m benchmarks.bench_scanning``. Each parser is fed inputs
+from 10 KB to 10 MB; with offset-based scanning the time per KB should stay
+flat, so the fitted log-log slope should be close to 1.
+"""
+from typing import Callable, List, Tuple
+
+import argparse
+import math
+import sys
+import time
+
+from asagami.module import BlockType
+from asagami.modules.core import BoldInlineType, ItalicInlineType, UnderlineInlineType
+from asagami.parser import BlockParser, Grammar, InlineParser
+
+SIZES = [10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+
+BLOCK_UNIT = (
+  '.. note\n'
+  '    .. lang: python\n'
+  '    def youjo():\n'
+  '        return "ninja"\n'
+)
+
+INLINE_UNIT = '*bold*/italic/_underline_:bold:{hoge}'
+
+
+class NoteBlockType(BlockType):
+  def get_name(self):
+    return 'note'
+
+  def get_patterns(self):
+    return []
+
+  @staticmethod
+  def tokenizer(match):
+    pass
+
+
+def gen_text(unit: str, size: int) -> str:
+  return unit * max(1, size // len(unit))
+
+
+def measure(parse: Callable[[str], list], text: str) -> Tuple[float, int]:
+  start = time.perf_counter()
+  tokens = parse(text)
+  return time.perf_counter() - start, len(tokens)
+
+
+def slope(results: List[Tuple[int, float]]) -> float:
+  (x0, y0), (x1, y1) = results[0], results[-1]
+  return math.log(y1 / y0) / math.log(x1 / x0)
+
+
+def run(name: str, parse: Callable[[str], list], unit: str, sizes: List[int]) -> float:
+  results = []
+  for size in sizes:
+    text = gen_text(unit, size)
+    elapsed, count = measure(parse, text)
+    results.append((len(text), elapsed))
+    print('{:<8} {:>10} bytes {:>9} tokens {:>9.4f} s {:>8.2f} MB/s'.format(
+      name, len(text), count, elapsed, len(text) / elapsed / 1e6,
+    ))
+  exponent = slope(results)
+  print('{:<8} scaling exponent: {:.2f}'.format(name, exponent))
+  return exponent
+
+
+def main(argv=None):
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument('--max-size', type=int, default=SIZES[-1])
+  arg_parser.add_argument(
+    '--check', type=float, default=None, metavar='EXPONENT',
+    help='exit with status 1 if any scaling exponent exceeds this value',
+  )
+  args = arg_parser.parse_args(argv)
+  sizes = [size for size in SIZES if size <= args.max_size]
+
+  grammar = Grammar()
+  inline_parser = InlineParser(
+    [BoldInlineType(), ItalicInlineType(), UnderlineInlineType()],
+    grammar,
+  )
+  block_parser = BlockParser([NoteBlockType()], inline_parser, grammar)
+
+  exponents = [
+    run('block', block_parser.parse, BLOCK_UNIT, sizes),
+    run('inline', inline_parser.parse, INLINE_UNIT, sizes),
+  ]
+  if args.check is not None and max(exponents) > args.check:
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
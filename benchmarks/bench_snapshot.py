@@ -0,0 +1,83 @@
+"""Compare building parsers from modules with loading a grammar snapshot.
+
+Run with ``python -m benchmarks.bench_snapshot``. For a growing number of
+registered modules, times what a fresh worker pays before its first parse:
+generating and compiling every rule, or loading and installing a
+``GrammarSnapshot`` saved beforehand. ``re``'s own pattern cache and the
+class digests are cleared before each run, as they would be
+empty in a new process.
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from asagami.module import Module
+from asagami.parser import Parser, ParserCache
+from asagami import digest
+from asagami.snapshot import GrammarSnapshot
+
+from .bench_dispatch import MODULE_COUNTS, SyntheticBlockType, SyntheticInlineType
+
+
+class SyntheticModule(Module):
+  def __init__(self, index: int):
+    self.index = index
+
+  def get_name(self):
+    return 'module{:03d}'.format(self.index)
+
+  def get_block_types(self):
+    return [SyntheticBlockType(self.index)]
+
+  def get_inline_types(self):
+    return [SyntheticInlineType(self.index)]
+
+
+def timeit(prepare, count: int, repeat: int) -> float:
+  best = float('inf')
+  for _ in range(repeat):
+    re.purge()
+    digest._class_digests.clear()
+    parser = Parser([SyntheticModule(i) for i in range(count)], cache=ParserCache(), compiled=True)
+    start = time.perf_counter()
+    prepare(parser)
+    parser.get_block_parser(*parser.load_modules(None))
+    best = min(best, time.perf_counter() - start)
+  return best
+
+
+def main(argv=None):
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument('--repeat', type=int, default=5)
+  args = arg_parser.parse_args(argv)
+
+  root = tempfile.mkdtemp()
+  try:
+    print('{:>7} {:>10} {:>10} {:>8}'.format('modules', 'build ms', 'load ms', 'speedup'))
+    for count in MODULE_COUNTS:
+      path = os.path.join(root, 'grammar{}.json'.format(count))
+      modules = [SyntheticModule(i) for i in range(count)]
+      GrammarSnapshot.of(Parser(modules, cache=ParserCache(), compiled=True)).save(path)
+
+      def build(parser):
+        pass
+
+      def load(parser):
+        assert GrammarSnapshot.load(path).install(parser)
+
+      build_time = timeit(build, count, args.repeat)
+      load_time = timeit(load, count, args.repeat)
+      print('{:>7} {:>10.2f} {:>10.2f} {:>7.1f}x'.format(
+        count, build_time * 1e3, load_time * 1e3, build_time / load_time,
+      ))
+  finally:
+    shutil.rmtree(root)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,64 @@
+"""Peak memory of ``BlockParser.iter_parse`` against ``BlockParser.parse``.
+
+Run with ``python -m benchmarks.bench_streaming``. Lines are generated on
+the fly, so the streaming peak should stay flat as the document grows while
+``parse`` grows with the document.
+"""
+from typing import Iterator
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+from asagami.parser import BlockParser
+
+from .bench_scanning import BLOCK_UNIT, NoteBlockType
+
+BLOCK_COUNTS = [1000, 10000, 100000]
+
+
+def gen_lines(count: int) -> Iterator[str]:
+  lines = BLOCK_UNIT.splitlines(keepends=True)
+  for _ in range(count):
+    yield from lines
+
+
+def measure(func):
+  tracemalloc.start()
+  start = time.perf_counter()
+  try:
+    count = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  return count, elapsed, peak
+
+
+def main(argv=None):
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument('--max-blocks', type=int, default=BLOCK_COUNTS[-1])
+  args = arg_parser.parse_args(argv)
+
+  parser = BlockParser([NoteBlockType()], None)
+  print('{:>8} {:>10} {:>10} {:>14}'.format('blocks', 'mode', 'seconds', 'peak bytes'))
+  for count in BLOCK_COUNTS:
+    if count > args.max_blocks:
+      break
+
+    def stream():
+      return sum(1 for _ in parser.iter_parse(gen_lines(count)))
+
+    def whole():
+      return len(parser.parse(''.join(gen_lines(count))))
+
+    for mode, func in (('iter_parse', stream), ('parse', whole)):
+      tokens, elapsed, peak = measure(func)
+      assert tokens == count
+      print('{:>8} {:>10} {:>10.3f} {:>14}'.format(count, mode, elapsed, peak))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,61 @@
+"""Memory per token of the slotted tokens against the former plain classes.
+
+Run with ``python -m benchmarks.bench_tokens``. Both variants build the
+same number of inline tokens the way the parsers do (the generated
+tokenizers used to hand every token a fresh ``OrderedDict``) and report the
+tracemalloc bytes per token.
+"""
+import argparse
+import sys
+import tracemalloc
+from collections import OrderedDict
+
+from asagami.token import InlineToken
+
+
+class LegacyInlineToken:
+  def __init__(self, name, value, attributes):
+    self.name = name
+    self.attributes = attributes
+    self.value = value
+
+
+def legacy_tokens(count: int):
+  return [
+    LegacyInlineToken(name='bold', value=str(i), attributes=OrderedDict())
+    for i in range(count)
+  ]
+
+
+def slotted_tokens(count: int):
+  return [
+    InlineToken(name='bold', value=str(i), attributes=OrderedDict())
+    for i in range(count)
+  ]
+
+
+def bytes_per_token(build, count: int) -> float:
+  tracemalloc.start()
+  try:
+    tokens = build(count)
+    current, _ = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  assert len(tokens) == count
+  return current / count
+
+
+def main(argv=None):
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument('--tokens', type=int, default=200000)
+  args = arg_parser.parse_args(argv)
+
+  before = bytes_per_token(legacy_tokens, args.tokens)
+  after = bytes_per_token(slotted_tokens, args.tokens)
+  print('before: {:8.1f} bytes/token'.format(before))
+  print('after:  {:8.1f} bytes/token ({:.0%})'.format(after, after / before))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
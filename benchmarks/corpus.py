@@ -0,0 +1,106 @@
+"""Seeded generator of realistic ``.ag`` documents for the benchmark suite.
+
+Documents mix a metadata header, ``.. module`` blocks with attributes,
+fenced code and paragraphs dense with inline markup, in ASCII and Japanese.
+The same seed and size always give the same text, so results from
+different runs and machines measure the same input.
+"""
+from typing import Callable, Dict, List
+
+import random
+
+SIZES: Dict[str, int] = {
+  'small': 2 * 1024,
+  'medium': 64 * 1024,
+  'large': 1024 * 1024,
+}
+
+WORDS = [
+  'asagami', 'parser', 'token', 'block', 'inline', 'render', 'module', 'grammar',
+  'cache', 'stream', 'offset', 'pattern', 'youjo', 'ninja', 'hoge', 'piyo',
+  '朝', '紙', '解析', '字句', '構文', 'ようじょ', 'テスト', '文書',
+]
+LANGS = ['python', 'haskell', 'c', 'shell', 'ruby']
+SCHEMES = ['molokai', 'monokai', 'solarized']
+MODULES = ['code', 'bold', 'italic', 'underline']
+CODE_LINES = [
+  'def main(argv=None):',
+  '  return parse(argv)',
+  'for i in range(10):',
+  '  total += i * 2',
+  'main = putStrLn "hello"',
+  'int x = f(a, b);',
+  'echo "$HOME" | wc -c',
+  '# コメント',
+]
+
+
+def _words(rng: random.Random, count: int) -> str:
+  return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def gen_inline(rng: random.Random) -> str:
+  """One run of inline markup or plain words."""
+  roll = rng.random()
+  if roll < 0.45:
+    return _words(rng, rng.randint(2, 8))
+  if roll < 0.6:
+    return '*{}*'.format(_words(rng, rng.randint(1, 3)))
+  if roll < 0.7:
+    return '/{}/'.format(_words(rng, rng.randint(1, 3)))
+  if roll < 0.8:
+    return '_{}_'.format(_words(rng, rng.randint(1, 2)))
+  if roll < 0.9:
+    return '`{}`'.format(rng.choice(CODE_LINES).strip())
+  if roll < 0.95:
+    return ':code:{{{}}}'.format(rng.choice(WORDS))
+  return ':code{{lang={}}}:{{{}}}'.format(rng.choice(LANGS), rng.choice(WORDS))
+
+
+def gen_paragraph(rng: random.Random) -> str:
+  lines = [
+    ' '.join(gen_inline(rng) for _ in range(rng.randint(2, 6)))
+    for _ in range(rng.randint(1, 4))
+  ]
+  return '\n'.join(lines) + '\n\n'
+
+
+def gen_module_block(rng: random.Random) -> str:
+  lines = ['.. code']
+  if rng.random() < 0.7:
+    lines.append('    .. lang: {}'.format(rng.choice(LANGS)))
+  if rng.random() < 0.3:
+    lines.append('    .. scheme: {}'.format(rng.choice(SCHEMES)))
+  lines.extend('    ' + rng.choice(CODE_LINES) for _ in range(rng.randint(1, 12)))
+  return '\n'.join(lines) + '\n\n'
+
+
+def gen_fence(rng: random.Random) -> str:
+  code = '\n'.join(rng.choice(CODE_LINES) for _ in range(rng.randint(1, 20)))
+  return '```{}\n{}\n```\n\n'.format(rng.choice(LANGS), code)
+
+
+BLOCKS: List[Callable[[random.Random], str]] = [gen_paragraph] * 6 + [gen_module_block] * 2 + [gen_fence] * 2
+
+
+def gen_header(rng: random.Random) -> str:
+  lines = ['::documentclass: article']
+  lines.extend('::usemodule: {}'.format(name) for name in rng.sample(MODULES, rng.randint(1, len(MODULES))))
+  return '\n'.join(lines) + '\n\n'
+
+
+def gen_document(size: int, seed: int = 0) -> str:
+  """A document of at least ``size`` characters."""
+  rng = random.Random(seed)
+  parts = [gen_header(rng)]
+  length = len(parts[0])
+  while length < size:
+    part = rng.choice(BLOCKS)(rng)
+    parts.append(part)
+    length += len(part)
+  return ''.join(parts)
+
+
+def gen_corpus(size: int, count: int, seed: int = 0) -> List[str]:
+  """``count`` documents of about ``size`` characters, each with its own seed."""
+  return [gen_document(size, seed * 1000003 + i) for i in range(count)]
@@ -0,0 +1,183 @@
+"""End-to-end benchmark suite with a stored baseline.
+
+Run with ``python -m benchmarks.suite``. Every scenario runs over a seeded
+corpus from ``benchmarks.corpus`` at each requested size:
+
+- ``parse``: ``Parser.parse`` with inline tokens built eagerly;
+- ``render``: ``HtmlRenderEngine.render_to_string`` of parsed documents;
+- ``end_to_end``: parse and render, as ``asagami build`` does.
+
+Reported are the best time of ``--repeat`` samples, input MB/s, tokens/s
+(block and inline tokens) and the tracemalloc peak of a separate run. ``--save``
+writes the results as JSON; ``--baseline`` compares against such a file and
+exits with 1 if throughput fell or peak memory grew by more than
+``--tolerance``. Baselines are only comparable on the same machine.
+"""
+from typing import Callable, Dict, List, Tuple
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from asagami.batch import default_modules
+from asagami.document import Document
+from asagami.parser import INLINE_EAGER, Parser, ParserCache
+from asagami.render import HtmlRenderEngine
+
+from .corpus import SIZES, gen_corpus
+
+SCENARIOS = ['parse', 'render', 'end_to_end']
+METRICS = {
+  # name: (higher is better, format)
+  'mb_per_s': (True, '{:>9.2f}'),
+  'tokens_per_s': (True, '{:>11.0f}'),
+  'peak_kib': (False, '{:>9.0f}'),
+}
+
+
+def count_tokens(documents: List[Document]) -> int:
+  return sum(
+    1 + len(token.children or [])
+    for document in documents
+    for token in document.blocks
+  )
+
+
+def scenario(name: str, corpus: List[str]) -> Tuple[Callable[[], object], int]:
+  """The function to time for ``name`` and the tokens one call handles."""
+  modules = default_modules()
+  parser = Parser(modules, cache=ParserCache())
+  engine = HtmlRenderEngine(modules)
+  parsed = [parser.parse(text, INLINE_EAGER) for text in corpus]
+  tokens = count_tokens(parsed)
+
+  if name == 'parse':
+    return lambda: [parser.parse(text, INLINE_EAGER) for text in corpus], tokens
+  if name == 'render':
+    return lambda: [engine.render_to_string(document) for document in parsed], tokens
+  if name == 'end_to_end':
+    return lambda: [engine.render_to_string(parser.parse(text)) for text in corpus], tokens
+  raise ValueError('unknown scenario: {}'.format(name))
+
+
+def measure(run: Callable[[], object], repeat: int, min_time: float = 0.2) -> Tuple[float, int]:
+  """Best seconds per call, each sample looping for at least ``min_time``."""
+  start = time.perf_counter()
+  run()  # warm up caches and lazy imports
+  loops = max(1, int(min_time / max(time.perf_counter() - start, 1e-9)))
+  best = float('inf')
+  for _ in range(repeat):
+    start = time.perf_counter()
+    for _ in range(loops):
+      run()
+    best = min(best, (time.perf_counter() - start) / loops)
+  tracemalloc.start()
+  try:
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  return best, peak
+
+
+def run_suite(
+    scenarios: List[str],
+    sizes: List[str],
+    documents: int,
+    repeat: int,
+    seed: int,
+) -> Dict[str, Dict[str, float]]:
+  results = {}
+  for size in sizes:
+    corpus = gen_corpus(SIZES[size], documents, seed)
+    size_bytes = sum(len(text.encode('utf-8')) for text in corpus)
+    for name in scenarios:
+      run, tokens = scenario(name, corpus)
+      seconds, peak = measure(run, repeat)
+      results['{}/{}'.format(name, size)] = {
+        'seconds': seconds,
+        'mb_per_s': size_bytes / seconds / 1e6,
+        'tokens_per_s': tokens / seconds,
+        'peak_kib': peak / 1024,
+      }
+  return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+  """Describe every metric that is worse than ``baseline`` by more than ``tolerance``."""
+  regressions = []
+  for key, metrics in results.items():
+    base = baseline.get(key)
+    if base is None:
+      continue
+    for metric, (higher_is_better, _) in METRICS.items():
+      if metric not in base or not base[metric]:
+        continue
+      change = metrics[metric] / base[metric] - 1
+      if (change < -tolerance) if higher_is_better else (change > tolerance):
+        regressions.append('{} {}: {:.4g} -> {:.4g} ({:+.1%})'.format(
+          key, metric, base[metric], metrics[metric], change,
+        ))
+  return regressions
+
+
+def main(argv=None):
+  arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  arg_parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='default: all')
+  arg_parser.add_argument('--size', action='append', choices=list(SIZES), help='default: all')
+  arg_parser.add_argument('--documents', type=int, default=8, help='documents per corpus')
+  arg_parser.add_argument('--repeat', type=int, default=3)
+  arg_parser.add_argument('--seed', type=int, default=0)
+  arg_parser.add_argument('--save', metavar='FILE', help='write the results as JSON')
+  arg_parser.add_argument('--baseline', metavar='FILE', help='compare with results saved earlier')
+  arg_parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+  args = arg_parser.parse_args(argv)
+
+  results = run_suite(
+    args.scenario or SCENARIOS,
+    args.size or list(SIZES),
+    args.documents,
+    args.repeat,
+    args.seed,
+  )
+
+  print('{:<20} {:>9} {:>11} {:>9}'.format('scenario', 'MB/s', 'tokens/s', 'peak KiB'))
+  for key, metrics in results.items():
+    print('{:<20} '.format(key) + ' '.join(fmt.format(metrics[m]) for m, (_, fmt) in METRICS.items()))
+
+  if args.save:
+    with open(args.save, 'w', encoding='utf-8') as f:
+      json.dump({
+        'environment': {
+          'python': platform.python_version(),
+          'implementation': platform.python_implementation(),
+          'machine': platform.machine(),
+        },
+        'seed': args.seed,
+        'documents': args.documents,
+        'results': results,
+      }, f, indent=2, sort_keys=True)
+      f.write('\n')
+
+  if args.baseline:
+    with open(args.baseline, encoding='utf-8') as f:
+      baseline = json.load(f)
+    if (baseline.get('seed'), baseline.get('documents')) != (args.seed, args.documents):
+      print('baseline was run with another corpus', file=sys.stderr)
+      return 2
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for regression in regressions:
+      print('regression: ' + regression)
+    return 1 if regressions else 0
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
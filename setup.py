@@ -3,7 +3,12 @@ from setuptools import setup
 setup(
   name='asagami',
   version='',
-  packages=['asagami'],
+  packages=['asagami', 'asagami.modules'],
+  entry_points={
+    'console_scripts': [
+      'asagami=asagami.cli:main',
+    ],
+  },
   test_suite='tests',
   tests_require=[
     'nose',
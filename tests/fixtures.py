@@ -0,0 +1,41 @@
+"""Block types shared by the parser, dispatch and cache tests."""
+import re
+
+from asagami.module import BlockType
+from asagami.parser import BlockParser, Grammar
+from asagami.token import BlockToken
+
+
+class NamedBlockType(BlockType):
+  """``.. name`` blocks; a match of one of ``patterns`` is a ``fence``."""
+
+  def __init__(self, name, patterns=()):
+    self.name = name
+    self.patterns = list(patterns)
+
+  def get_name(self):
+    return self.name
+
+  def get_patterns(self):
+    return self.patterns
+
+  @staticmethod
+  def tokenizer(match):
+    return BlockToken(name='fence', body=match['body'], attributes={})
+
+
+class FenceBlockType(BlockType):
+  """Backtick fences, tokenized like a ``.. fence`` block."""
+
+  def get_name(self):
+    return 'fence'
+
+  def get_patterns(self):
+    return [re.compile(r'```(?P<attributes>)(?P<body>(\n[^`\n]*)*)\n```\n?')]
+
+  def get_tokenizer(self):
+    return BlockParser._gen_tokenizer(Grammar(), 'fence')
+
+  @staticmethod
+  def tokenizer(match):
+    pass
@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+import asyncio
+
+from nose.tools import eq_, ok_
+
+from asagami.batch import default_modules
+from asagami.parser import INLINE_EAGER, Parser, ParserCache
+from asagami.render import HtmlRenderEngine
+
+TEXT = 'a *b*\n\n.. code\n    c\n```\nd\n```\n\n' * 50
+
+
+def _dump(document):
+  return [
+    (t.name, t.body, [(c.name, c.value) for c in t.children or []])
+    for t in document.blocks
+  ]
+
+
+class TestAsync(TestCase):
+  def setUp(self):
+    self.modules = default_modules()
+    self.parser = Parser(self.modules, cache=ParserCache())
+
+  def test_aparse(self):
+    document = asyncio.run(self.parser.aparse(TEXT, INLINE_EAGER))
+    eq_(_dump(document), _dump(self.parser.parse(TEXT, INLINE_EAGER)))
+
+  def test_aiter_render(self):
+    engine = HtmlRenderEngine(self.modules)
+    document = self.parser.parse(TEXT)
+
+    async def render():
+      return [chunk async for chunk in engine.aiter_render(document, chunk_size=256, encoding='utf-8')]
+
+    eq_(b''.join(asyncio.run(render())), engine.render_to_string(document).encode('utf-8'))
+
+  def test_yields_to_loop(self):
+    ticks = []
+
+    async def tick():
+      while True:
+        ticks.append(None)
+        await asyncio.sleep(0)
+
+    async def main():
+      ticker = asyncio.ensure_future(tick())
+      await asyncio.sleep(0)
+      before = len(ticks)
+      await self.parser.aparse(TEXT, yield_every=10)
+      ticker.cancel()
+      return len(ticks) - before
+
+    ok_(asyncio.run(main()) >= 10)
@@ -0,0 +1,126 @@
+from unittest import TestCase
+
+import math
+import os
+import re
+
+from nose.tools import eq_, ok_
+
+from asagami.audit import (
+  adversarial_inputs, audit_modules, audit_pattern, collect_patterns, growth_exponent, measure,
+)
+from asagami.module import InlineType, Module
+from asagami.parser import Grammar, unanchor_pattern
+from asagami.token import InlineToken
+
+SIZES = [8, 12, 16, 20, 24, 32, 64, 128, 256, 512]
+
+
+class BacktrackingInlineType(InlineType):
+  def get_name(self):
+    return 'slow'
+
+  def get_patterns(self):
+    return [re.compile(r'^%(?P<value>(a|a)+)%')]
+
+  @staticmethod
+  def tokenizer(match):
+    return InlineToken('slow', match['value'], {})
+
+
+class BacktrackingModule(Module):
+  def get_name(self):
+    return 'slow'
+
+  def get_inline_types(self):
+    return [BacktrackingInlineType()]
+
+
+class BytesInlineType(BacktrackingInlineType):
+  def get_name(self):
+    return 'bytes'
+
+  def get_patterns(self):
+    return [re.compile(b'x+')]
+
+
+class ExitingPattern:
+  """Stands in for a pattern and ends the process that matches it."""
+  pattern = 'x+'
+  flags = 0
+
+  def match(self, *args):
+    os._exit(3)
+
+  search = match
+
+
+class ExitingInlineType(BacktrackingInlineType):
+  def get_name(self):
+    return 'exiting'
+
+  def get_patterns(self):
+    return [ExitingPattern()]
+
+
+class BrokenModule(Module):
+  def get_name(self):
+    return 'broken'
+
+  def get_inline_types(self):
+    return [BytesInlineType(), ExitingInlineType()]
+
+
+class TestAudit(TestCase):
+  def test_adversarial_inputs(self):
+    inputs = adversarial_inputs(re.compile(r':bold(\{[^\}]*\})?:\{[^\}]*\}'))
+    eq_(inputs["':bold:{'*n"](14), ':bold:{:bold:{')
+    eq_(inputs["'}'*n"](3), '}}}')
+    eq_(inputs["':{'*n"](4), ':{:{')
+
+  def test_growth_exponent(self):
+    eq_(growth_exponent([(n, 1e-6) for n in SIZES]), 0.0)
+    eq_(growth_exponent([(n, n * 1e-6) for n in SIZES[:6]] + [(1024, 1.0)]), 0.0)  # too few points
+    ok_(abs(growth_exponent([(n, n * 1e-6) for n in SIZES]) - 1) < 1e-9)
+    ok_(abs(growth_exponent([(n, n * n * 1e-6) for n in SIZES]) - 2) < 1e-9)
+
+  def test_linear(self):
+    report = audit_pattern(re.compile(r'\*(?P<value>[^\*]+)\*'), 'bold', 'block', SIZES)
+    ok_(not report.is_superlinear())
+
+  def test_quadratic_scan(self):
+    report = audit_pattern(re.compile(r'\{[^\}]*\}'), 'brace', 'inline')
+    ok_(report.is_superlinear())
+    eq_(report.mode, 'scan')
+
+  def test_generated_inline_scan(self):
+    pattern = unanchor_pattern(Grammar().gen_inline_pattern('bold'))
+    samples = measure(pattern, adversarial_inputs(pattern)["':bold:{'*n"], 'scan')
+    ok_(growth_exponent(samples) < 1.5)
+
+  def test_catastrophic(self):
+    report = audit_pattern(re.compile(r'%(a|a)+%'), 'slow', 'block', SIZES, budget=0.01)
+    ok_(report.is_superlinear())
+    eq_(report.exponent, math.inf)
+
+  def test_collect_patterns(self):
+    eq_(
+      [(pattern.pattern, owner) for pattern, owner, _ in collect_patterns([BacktrackingModule()])],
+      [
+        ('%(?P<value>(a|a)+)%', '{}.BacktrackingInlineType'.format(__name__)),
+        (r":slow(?P<attributes>(\{[^{}]*\})?):\{(?P<value>[^{}]*)\}", "Grammar.gen_inline_pattern('slow')"),
+      ],
+    )
+
+  def test_timeout(self):
+    reports = audit_modules([BacktrackingModule()], sizes=[8, 16, 32, 64], budget=60, timeout=0.5)
+    eq_(reports[0].owner, '{}.BacktrackingInlineType'.format(__name__))
+    ok_(reports[0].timed_out)
+
+  def test_errors(self):
+    reports = audit_modules([BrokenModule()], sizes=[8, 16, 32, 64], budget=0.01, timeout=10)
+    by_source = {r.source: r for r in reports}
+    eq_(len(reports), 4)
+    ok_(by_source["b'x+'"].error.startswith('TypeError'))
+    eq_(by_source['x+'].error, 'audit process exited with code 3')
+    ok_(all(r.error is None for r in reports if r.owner.startswith('Grammar.')))
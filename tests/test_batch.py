@@ -0,0 +1,92 @@
+from unittest import TestCase
+
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_
+
+from asagami.batch import compile_files, find_sources, output_path
+
+
+def _paragraphs():
+  from asagami.modules.paragraph import ParagraphModule
+  return [ParagraphModule()]
+
+
+class TestBatch(TestCase):
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.source = os.path.join(self.root, 'src')
+    os.makedirs(os.path.join(self.source, 'sub'))
+    self._write('b.ag', '```python\nprint(1)\n```')
+    self._write('a.ag', '.. code\n    import youjo\n')
+    # not UTF-8, so it fails
+    with open(os.path.join(self.source, 'sub/c.ag'), 'wb') as f:
+      f.write(b'text\n\xff\n')
+    self._write('ignored.txt', '')
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def _write(self, name, text):
+    with open(os.path.join(self.source, name), 'w') as f:
+      f.write(text)
+
+  def test_find_sources(self):
+    eq_(
+      [relative for _, relative in find_sources([self.source])],
+      ['a.ag', 'b.ag', os.path.join('sub', 'c.ag')],
+    )
+
+  def test_output_path(self):
+    eq_(output_path(None, 'doc/a.ag', 'a.ag'), 'doc/a.html')
+    eq_(output_path('out', 'doc/sub/a.ag', 'sub/a.ag'), 'out/sub/a.html')
+
+  def _check(self, workers):
+    output = os.path.join(self.root, 'out')
+    result = compile_files([self.source], output, workers=workers)
+    eq_(
+      [os.path.relpath(d.source, self.source) for d in result.documents],
+      ['a.ag', 'b.ag', os.path.join('sub', 'c.ag')],
+    )
+    eq_([d.source for d in result.failures], [os.path.join(self.source, 'sub', 'c.ag')])
+    self.assertTrue(result.failures[0].error.startswith('UnicodeDecodeError'))
+    with open(os.path.join(output, 'a.html')) as f:
+      eq_(f.read(), '<code>\n    import youjo</code>\n')
+    with open(os.path.join(output, 'b.html')) as f:
+      eq_(f.read(), '<code class="language-python">\n<span class="builtin">print</span>(<span class="number">1</span>)</code>\n')
+    self.assertFalse(os.path.exists(os.path.join(output, 'sub', 'c.html')))
+    self.assertGreater(result.docs_per_second, 0)
+    eq_(len(result.slowest(2)), 2)
+
+  def test_usemodule(self):
+    self._write('a.ag', '::usemodule: bold\na *b*\n')
+    output = os.path.join(self.root, 'out')
+    compile_files([os.path.join(self.source, 'a.ag')], output, workers=1, modules_factory=_paragraphs)
+    with open(os.path.join(output, 'a.html')) as f:
+      eq_(f.read(), '<p>a <b>b</b></p>\n')
+
+  def test_in_process(self):
+    self._check(workers=1)
+
+  def test_cache_dir(self):
+    from asagami import batch
+    from asagami.modules import code
+    highlight_cache = code.highlight_cache
+    cache_dir = os.path.join(self.root, 'cache')
+    output = os.path.join(self.root, 'out')
+    compile_files([self.source], output, workers=1, cache_dir=cache_dir)
+    self.assertIs(code.highlight_cache, highlight_cache)
+    self.assertIsNone(batch._worker)
+    self.assertTrue(os.listdir(os.path.join(cache_dir, 'highlight')))
+    self.assertTrue(os.path.exists(os.path.join(cache_dir, 'render.agr')))
+    with open(os.path.join(output, 'b.html')) as f:
+      expected = f.read()
+    os.remove(os.path.join(output, 'b.html'))
+    compile_files([self.source], output, workers=2, cache_dir=cache_dir)
+    with open(os.path.join(output, 'b.html')) as f:
+      eq_(f.read(), expected)
+
+  def test_process_pool(self):
+    self._check(workers=2)
@@ -0,0 +1,190 @@
+from unittest import TestCase, mock
+
+import os
+import re
+import shutil
+import tempfile
+
+from nose.tools import eq_
+
+import asagami.parser
+from asagami.cache import ParseCache, RenderCache, dump_blocks, load_blocks
+from asagami.module import Module
+from asagami.token import EMPTY_ATTRIBUTES, BlockToken
+
+from tests.fixtures import NamedBlockType
+
+
+class YoujoModule(Module):
+  def get_name(self):
+    return 'youjo'
+
+  def get_block_types(self):
+    return [NamedBlockType('youjo')]
+
+
+TEXT = (
+  '.. youjo\n'
+  '    .. lang: python\n'
+  '    hoge\n'
+  '.. youjo\n'
+  '    piyo\n'
+)
+
+
+class TestSerialize(TestCase):
+  def test_roundtrip(self):
+    tokens = [
+      BlockToken(name='youjo', body='\n    ほげ\ud800', attributes={'lang': 'python', 'tags': ('a', 'b')}),
+      BlockToken(name='ninja', body='', attributes={}),
+    ]
+    loaded = load_blocks(dump_blocks(tokens))
+    eq_(
+      [(t.name, t.body, dict(t.attributes)) for t in loaded],
+      [(t.name, t.body, dict(t.attributes)) for t in tokens],
+    )
+    self.assertIs(loaded[1].attributes, EMPTY_ATTRIBUTES)
+
+  def test_invalid(self):
+    with self.assertRaises(ValueError):
+      load_blocks(b'pickle')
+
+
+class TestParseCache(TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.cache = ParseCache(self.directory)
+    self.block_parser = asagami.parser.BlockParser([NamedBlockType('youjo')], None)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_hit(self):
+    first = self.cache.parse(self.block_parser, TEXT)
+    with mock.patch.object(self.block_parser, 'parse') as parse:
+      second = self.cache.parse(self.block_parser, TEXT)
+      parse.assert_not_called()
+    eq_([t.body for t in second], [t.body for t in first])
+    eq_(second[0].attributes, {'lang': 'python'})
+    eq_((self.cache.hits, self.cache.misses), (1, 1))
+
+  def test_text_changed(self):
+    self.cache.parse(self.block_parser, TEXT)
+    self.cache.parse(self.block_parser, TEXT + '.. youjo\n')
+    eq_((self.cache.hits, self.cache.misses), (0, 2))
+
+  def test_pattern_changed(self):
+    other = asagami.parser.BlockParser(
+      [NamedBlockType('youjo', [re.compile(r'```(?P<body>[^`]*)```')])],
+      None,
+    )
+    self.assertNotEqual(other.fingerprint(), self.block_parser.fingerprint())
+    self.cache.parse(self.block_parser, TEXT)
+    self.cache.parse(other, TEXT)
+    eq_(self.cache.misses, 2)
+
+  def test_pattern_version_changed(self):
+    class Matcher:
+      pattern = '```'
+      flags = 0
+      version = 1
+
+      def match(self, text, pos=0, endpos=None):
+        return None
+
+    class NewMatcher(Matcher):
+      version = 2
+
+    old = asagami.parser.BlockParser([NamedBlockType('youjo', [Matcher()])], None)
+    new = asagami.parser.BlockParser([NamedBlockType('youjo', [NewMatcher()])], None)
+    self.assertNotEqual(new.fingerprint(), old.fingerprint())
+
+  def test_fingerprint_stable(self):
+    other = asagami.parser.BlockParser([NamedBlockType('youjo')], None)
+    eq_(other.fingerprint(), self.block_parser.fingerprint())
+
+  def test_corrupt_entry(self):
+    key = ParseCache.key(self.block_parser, TEXT)
+    self.cache.parse(self.block_parser, TEXT)
+    with open(self.cache._path(key), 'wb') as f:
+      f.write(b'AGC\x01garbage')
+    self.assertIsNone(self.cache.get(key))
+    self.assertFalse(os.path.exists(self.cache._path(key)))
+
+  def test_evict(self):
+    tokens = self.block_parser.parse(TEXT)
+    self.cache.put('aa' * 32, tokens)
+    os.utime(self.cache._path('aa' * 32), (0, 0))
+    self.cache.max_bytes = os.path.getsize(self.cache._path('aa' * 32)) * 3 // 2
+    self.cache.put('bb' * 32, tokens)
+    self.assertFalse(os.path.exists(self.cache._path('aa' * 32)))
+    self.assertTrue(os.path.exists(self.cache._path('bb' * 32)))
+    self.cache.clear()
+    self.assertIsNone(self.cache.get('bb' * 32))
+
+  def test_size_on_overwrite(self):
+    tokens = self.block_parser.parse(TEXT)
+    self.cache.put('aa' * 32, [])
+    self.cache.put('aa' * 32, tokens)
+    self.cache.put('aa' * 32, tokens)
+    eq_(self.cache._size, os.path.getsize(self.cache._path('aa' * 32)))
+
+  def test_children(self):
+    self.cache.parse(self.block_parser, TEXT)
+    with mock.patch.object(self.block_parser, 'attach_children') as attach_children:
+      tokens = self.cache.parse(self.block_parser, TEXT, inline='eager')
+      attach_children.assert_called_once_with(tokens, 'eager')
+
+
+class TestParserParseCache(TestCase):
+  def test_parse(self):
+    directory = tempfile.mkdtemp()
+    try:
+      cache = ParseCache(directory)
+      parser = asagami.parser.Parser([YoujoModule()], parse_cache=cache)
+      parser.parse(TEXT)
+      document = parser.parse(TEXT)
+      eq_(len(document.blocks), 2)
+      eq_((cache.hits, cache.misses), (1, 1))
+    finally:
+      shutil.rmtree(directory)
+
+
+class TestRenderCache(TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'render.agr')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_lru(self):
+    cache = RenderCache(maxsize=2)
+    cache.put('a', '<p>a</p>')
+    cache.put('b', '<p>b</p>')
+    eq_(cache.get('a'), '<p>a</p>')
+    cache.put('c', '<p>c</p>')
+    self.assertIsNone(cache.get('b'))
+    eq_((cache.hits, cache.misses), (1, 1))
+    eq_(dict(cache.drain()), {'b': '<p>b</p>', 'c': '<p>c</p>'})  # at most maxsize
+    eq_(cache.drain(), {})
+
+  def test_save_load(self):
+    cache = RenderCache()
+    cache.update({'a': '<p>ようじょ\ud800</p>', 'b': '<p>b</p>'})
+    cache.save(self.path)
+    loaded = RenderCache(maxsize=2)
+    loaded.put('c', '<p>c</p>')
+    loaded.load(self.path)
+    eq_(len(loaded), 2)
+    eq_(loaded.get('b'), '<p>b</p>')
+    eq_(loaded.get('c'), '<p>c</p>')
+    self.assertIsNone(loaded.get('a'))
+
+  def test_load_missing_or_invalid(self):
+    cache = RenderCache()
+    cache.load(self.path)
+    with open(self.path, 'wb') as f:
+      f.write(b'pickle')
+    cache.load(self.path)
+    eq_(len(cache), 0)
@@ -0,0 +1,166 @@
+from unittest import TestCase
+
+import io
+import os
+import tempfile
+import time
+
+from nose.tools import eq_
+
+from asagami.modules.code import (
+  CodeBlockRenderer,
+  CodeBlockType,
+  CodeInlineRenderer,
+  FenceMatcher,
+  HighlightCache,
+  highlight,
+)
+from asagami.token import BlockToken, InlineToken
+from asagami.parser import BlockParser
+from benchmarks.bench_fence import CASES
+
+
+class TestFenceMatcher(TestCase):
+  def setUp(self):
+    self.matcher = FenceMatcher()
+
+  def test_it(self):
+    result = self.matcher.match('```python\nprint(1)\n\nprint(2)\n```\nrest')
+    eq_(result['lang'], 'python')
+    eq_(result['code'], '\nprint(1)\n\nprint(2)')
+    eq_(result.group(), '```python\nprint(1)\n\nprint(2)\n```\n')
+
+  def test_first_closing_fence(self):
+    result = self.matcher.match('```\na\n```\n```\nb\n```')
+    eq_(result['code'], '\na')
+    eq_(result.end(), len('```\na\n```\n'))
+
+  def test_closing_fence_line(self):
+    eq_(self.matcher.match('```\n```x\n``` \n')['code'], '\n```x')
+    eq_(self.matcher.match('````\n```\n`````')['code'], '\n```')
+
+  def test_no_match(self):
+    self.assertIsNone(self.matcher.match('``\n``'))
+    self.assertIsNone(self.matcher.match('```python'))
+    self.assertIsNone(self.matcher.match('```\nunterminated\n'))
+
+  def test_pos_endpos(self):
+    text = 'xx```\na\n```\nyy'
+    eq_(self.matcher.match(text, 2).span(), (2, 12))
+    self.assertIsNone(self.matcher.match(text, 2, 9))
+
+  def test_block_parser(self):
+    parser = BlockParser([CodeBlockType()], None, compiled=True)
+    tokens = parser.parse('```python\na\n```\n.. code\n    b\n```\nc\n```')
+    eq_(
+      [(t.name, t.body, dict(t.attributes)) for t in tokens],
+      [
+        ('code', '\na', {'lang': 'python'}),
+        ('code', '\n    b', {}),
+        ('code', '\nc', {'lang': ''}),
+      ],
+    )
+
+
+class TestFenceMatcherPathological(TestCase):
+  """Time bounds on inputs that made the former regex backtrack."""
+  size = 100000
+  bound = 0.5  # seconds; the matcher takes a few milliseconds here
+
+  def test_cases(self):
+    matcher = FenceMatcher()
+    for name, gen in CASES.items():
+      text = gen(self.size)
+      start = time.perf_counter()
+      matcher.match(text)
+      elapsed = time.perf_counter() - start
+      self.assertLess(elapsed, self.bound, name)
+
+
+class TestHighlightPathological(TestCase):
+  """Time bounds on code with openers that are never closed."""
+  lines = 8000
+  bound = 0.5  # seconds; rescanning to the end per opener took 3 s for C
+
+  cases = [
+    ('c', '/*x\n'),
+    ('javascript', '/*x\n'),
+    ('javascript', '`x\\\n'),
+    ('haskell', '{-x\n'),
+    ('python', '"""x\\\n'),
+    ('python', "'''x\n"),
+  ]
+
+  def test_cases(self):
+    for lang, line in self.cases:
+      code = line * self.lines
+      start = time.perf_counter()
+      highlight(code, lang)
+      elapsed = time.perf_counter() - start
+      self.assertLess(elapsed, self.bound, (lang, line))
+
+  def test_unterminated(self):
+    eq_(highlight('x /* y', 'c'), 'x <span class="comment">/* y</span>')
+    eq_(highlight('{- a --} b {- c', 'haskell'), '<span class="comment">{- a --}</span> b <span class="comment">{- c</span>')
+    eq_(highlight('`a\\', 'javascript'), '<span class="string">`a\\</span>')
+
+
+class TestHighlight(TestCase):
+  def test_classes(self):
+    eq_(
+      highlight('def f(x):\n  return "<a>"  # hi', 'py'),
+      '<span class="keyword">def</span> f(x):\n'
+      '  <span class="keyword">return</span> <span class="string">"&lt;a&gt;"</span>'
+      '  <span class="comment"># hi</span>',
+    )
+
+  def test_scheme(self):
+    eq_(highlight('1', 'c', 'molokai'), '<span style="color:#ae81ff">1</span>')
+    eq_(highlight('1', 'c', 'unknown'), '<span class="number">1</span>')
+
+  def test_unknown_lang(self):
+    self.assertIsNone(highlight('x', 'brainfuck'))
+    self.assertIsNone(highlight('x', ''))
+
+  def test_renderers(self):
+    block = BlockToken(name='code', body='\nx = 1', attributes={'lang': 'python', 'scheme': 'molokai'})
+    eq_(
+      CodeBlockRenderer(HighlightCache()).render_html(block, None),
+      '<code class="language-python">\nx = <span style="color:#ae81ff">1</span></code>',
+    )
+    inline = InlineToken(name='code', value='<b>', attributes={})
+    eq_(CodeInlineRenderer(HighlightCache()).render_html(inline, None), '<code>&lt;b&gt;</code>')
+
+  def test_unhighlighted_escaped(self):
+    block = BlockToken(name='code', body='\nif a < b && c:', attributes={})
+    renderer = CodeBlockRenderer(HighlightCache())
+    eq_(renderer.render_html(block, None), '<code>\nif a &lt; b &amp;&amp; c:</code>')
+    out = io.StringIO()
+    renderer.write_html(block, None, out)
+    eq_(out.getvalue(), renderer.render_html(block, None))
+
+
+class TestHighlightCache(TestCase):
+  def test_memory(self):
+    cache = HighlightCache(maxsize=1)
+    first = cache.highlight('x = 1', 'python')
+    self.assertIs(cache.highlight('x = 1', 'py'), first)
+    eq_((cache.hits, cache.misses), (1, 1))
+    cache.highlight('y = 2', 'python')
+    cache.highlight('x = 1', 'python')
+    eq_((cache.hits, cache.misses), (1, 3))
+    self.assertIsNone(cache.highlight('x', 'brainfuck'))
+
+  def test_key(self):
+    key = HighlightCache.key
+    self.assertNotEqual(key('x', 'python'), key('x', 'ruby'))
+    self.assertNotEqual(key('x', 'python'), key('x', 'python', 'molokai'))
+    self.assertNotEqual(key('x', 'python'), key('y', 'python'))
+
+  def test_directory(self):
+    with tempfile.TemporaryDirectory() as directory:
+      expected = HighlightCache(directory=directory).highlight('x = 1', 'python', 'monokai')
+      cache = HighlightCache(directory=directory)
+      eq_(cache.highlight('x = 1', 'python', 'monokai'), expected)
+      eq_((cache.hits, cache.misses), (1, 0))
+      eq_(len(os.listdir(directory)), 1)
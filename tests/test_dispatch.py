@@ -0,0 +1,167 @@
+from unittest import TestCase
+
+import re
+
+from nose.tools import eq_
+
+import asagami.parser
+from asagami.dispatch import DispatchTable, bytes_pattern, first_chars
+from asagami.token import InlineToken
+
+from tests.fixtures import FenceBlockType, NamedBlockType
+
+
+class TestFirstChars(TestCase):
+  def test_literal(self):
+    eq_(first_chars(re.compile(r'\*(?P<value>[^\*]+)\*')), {'*'})
+
+  def test_anchor(self):
+    eq_(first_chars(re.compile(r'^\.\. *youjo')), {'.'})
+
+  def test_class(self):
+    eq_(first_chars(re.compile(r'[a-c]x')), {'a', 'b', 'c'})
+
+  def test_branch(self):
+    eq_(first_chars(re.compile(r'(?:ab|c)d')), {'a', 'c'})
+
+  def test_optional_prefix(self):
+    eq_(first_chars(re.compile(r'a?b')), {'a', 'b'})
+
+  def test_unknown(self):
+    self.assertIsNone(first_chars(re.compile(r'.x')))
+    self.assertIsNone(first_chars(re.compile(r'[^a]x')))
+    self.assertIsNone(first_chars(re.compile(r'a*')))
+    self.assertIsNone(first_chars(re.compile(r'a', re.IGNORECASE)))
+
+
+class TestDispatchTable(TestCase):
+  def test_priority(self):
+    first = re.compile('ab')
+    unknown = re.compile('.b')
+    second = re.compile('a')
+    other = re.compile('b')
+    table = DispatchTable({first: 1, unknown: 2, second: 3, other: 4})
+    eq_([p for p, _ in table.candidates('a')], [first, unknown, second])
+    eq_([p for p, _ in table.candidates('b')], [unknown, other])
+    eq_([p for p, _ in table.candidates('z')], [unknown])
+
+  def test_skip(self):
+    table = DispatchTable({re.compile(r'\*[^*]+\*'): 1, re.compile('[-^]x'): 2})
+    eq_(table.skip.search('abc-d').start(), 3)
+    eq_(table.skip.search('ab^*').start(), 2)
+    self.assertIsNone(table.skip.search('abc]'))
+    self.assertIsNone(DispatchTable({re.compile('.b'): 1}).skip)
+    self.assertIsNone(DispatchTable({}).skip.search('abc'))
+
+
+class TestBytesPattern(TestCase):
+  def test_encoded(self):
+    pattern = bytes_pattern(asagami.parser.Grammar().gen_block_pattern('code'))
+    match = pattern.match('.. code\n    ようじょ\n'.encode('utf-8'))
+    eq_(match['body'].decode('utf-8'), '\n    ようじょ')
+    eq_(bytes_pattern(re.compile('[^x]+y', re.MULTILINE)).flags & re.MULTILINE, re.MULTILINE)
+
+  def test_decoded_only(self):
+    for source in (r'\w+', 'a.b', '[^x]{2,}', '(?<=a)b', r'\bx', 'é', '(?i)a'):
+      self.assertIsNone(bytes_pattern(re.compile(source)), source)
+
+  def test_other_objects(self):
+    from asagami.modules.code import FenceMatcher
+    from asagami.profiling import ProfiledPattern, RuleStats
+    stats = RuleStats('block', 'code', '```')
+    fence = ProfiledPattern(FenceMatcher(), stats)
+    self.assertIs(bytes_pattern(fence), fence)
+    self.assertIsNone(bytes_pattern(ProfiledPattern(re.compile('ab'), stats)))
+
+  def test_encode_table(self):
+    first, second = re.compile('ab'), re.compile('.b')
+    encoded = {first: re.compile(b'ab'), second: re.compile(b'.b')}
+    table = DispatchTable({first: 1, second: 2}).encode(encoded)
+    eq_([p for p, _ in table.candidates(b'a'[0])], [encoded[first], encoded[second]])
+    eq_([p for p, _ in table.candidates(b'z'[0])], [encoded[second]])
+
+
+def _types():
+  from asagami.module import InlineType
+
+  class DollarInlineType(InlineType):
+    def get_name(self):
+      return 'math'
+
+    def get_patterns(self):
+      return [re.compile(r'^\$(?P<value>[^\$]+)\$')]
+
+    def get_tokenizer(self):
+      return lambda match: InlineToken('math', match['value'], {})
+
+    @staticmethod
+    def tokenizer(match):
+      pass
+
+  class NamedInlineType(InlineType):
+    def __init__(self, name):
+      self.name = name
+
+    def get_name(self):
+      return self.name
+
+    def get_patterns(self):
+      return []
+
+    @staticmethod
+    def tokenizer(match):
+      pass
+
+  block_types = [FenceBlockType(), NamedBlockType('youjo'), NamedBlockType('ninja')]
+  inline_types = [DollarInlineType(), NamedInlineType('youjo'), NamedInlineType('ninja')]
+  return block_types, inline_types
+
+
+def _dump(tokens):
+  return [
+    (t.name, getattr(t, 'body', None), getattr(t, 'value', None), dict(t.attributes))
+    for t in tokens
+  ]
+
+
+class TestCompiledParser(TestCase):
+  def test_block_same_tokens(self):
+    block_types, _ = _types()
+    text = (
+      '.. youjo\n'
+      '    .. lang: python\n'
+      '    hoge\n'
+      '```\n'
+      'code\n'
+      '```\n'
+      '.. ninja\n'
+      '    piyo\n'
+    )
+    linear = asagami.parser.BlockParser(block_types, None)
+    compiled = asagami.parser.BlockParser(block_types, None, compiled=True)
+    eq_(len(compiled.rules), 2)
+    eq_(_dump(compiled.parse(text)), _dump(linear.parse(text)))
+
+  def test_inline_same_tokens(self):
+    _, inline_types = _types()
+    text = ':youjo{a=b}:{hoge}$x$:ninja:{piyo}'
+    linear = asagami.parser.InlineParser(inline_types)
+    compiled = asagami.parser.InlineParser(inline_types, compiled=True)
+    eq_(_dump(compiled.parse(text)), _dump(linear.parse(text)))
+
+  def test_text(self):
+    _, inline_types = _types()
+    text = 'plain :youjo:{hoge} $x$ plain'
+    linear = asagami.parser.InlineParser(inline_types)
+    compiled = asagami.parser.InlineParser(inline_types, compiled=True)
+    eq_(_dump(compiled.parse(text)), _dump(linear.parse(text)))
+    eq_([t.name for t in compiled.parse(text)], ['text', 'youjo', 'text', 'math', 'text'])
+
+  def test_skip_text(self):
+    _, inline_types = _types()
+    parser = asagami.parser.InlineParser(inline_types)
+    stepping = asagami.parser.InlineParser(inline_types)
+    stepping.dispatch.skip = None
+    for text in ['plain: $ :youjo:{a}$b$ x$', '$$$', ':', 'no markup at all', '$x$']:
+      eq_(_dump(parser.parse(text)), _dump(stepping.parse(text)))
+    eq_([t.value for t in parser.parse('a:b $c$ d: e')], ['a:b ', 'c', ' d: e'])
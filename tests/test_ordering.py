@@ -0,0 +1,114 @@
+from unittest import TestCase
+
+import gc
+import os
+import re
+import shutil
+import tempfile
+
+from nose.tools import eq_, ok_
+
+from asagami.batch import default_modules
+from asagami.ordering import RuleOrdering, may_overlap, order_rules
+from asagami.parser import INLINE_EAGER, Grammar, Parser, ParserCache
+from asagami.profiling import ParseProfile
+
+TEXT = 'plain\n\n.. code\n    a\n```\nb\n```\n.. code\n    c :code:{d} *e*\n.. code\n    f\n.. code\n    g\nplain\n'
+
+
+def _dump(document):
+  return [
+    (t.name, t.body, [(c.name, c.value) for c in t.children or []])
+    for t in document.blocks
+  ]
+
+
+class TestRuleOrdering(TestCase):
+  def setUp(self):
+    self.modules = default_modules()
+    profile = ParseProfile()
+    Parser(self.modules, cache=ParserCache(), profile=profile).parse(TEXT * 3, INLINE_EAGER)
+    self.ordering = RuleOrdering.from_profile(profile)
+
+  def test_same_result(self):
+    for compiled in (False, True):
+      ordered = Parser(self.modules, compiled=compiled, cache=ParserCache(), ordering=self.ordering)
+      plain = Parser(self.modules, compiled=compiled, cache=ParserCache())
+      eq_(_dump(ordered.parse(TEXT, INLINE_EAGER)), _dump(plain.parse(TEXT, INLINE_EAGER)))
+
+  def test_fewer_failed_attempts(self):
+    def failed(ordering):
+      profile = ParseProfile()
+      Parser(self.modules, cache=ParserCache(), profile=profile, ordering=ordering).parse(TEXT, INLINE_EAGER)
+      return sum(s.misses for s in profile.report(kind='block'))
+
+    ok_(failed(self.ordering) < failed(None))
+
+  def test_apply(self):
+    parser = Parser(self.modules, cache=ParserCache())
+    block_parser = parser.get_block_parser(*parser.load_modules(None))
+    ordered = self.ordering.apply(block_parser)
+    ok_(self.ordering.apply(block_parser) is ordered)
+    eq_(ordered.fingerprint(), block_parser.fingerprint())
+    eq_(set(ordered.rules), set(block_parser.rules))
+    ok_(list(ordered.rules) != list(block_parser.rules))
+
+  def test_evicted_parsers_released(self):
+    cache = ParserCache()
+    Parser(self.modules, cache=cache, ordering=self.ordering).parse(TEXT)
+    eq_(len(self.ordering._applied), 2)
+    cache.clear()
+    gc.collect()
+    eq_(len(self.ordering._applied), 0)
+
+  def test_save_load(self):
+    root = tempfile.mkdtemp()
+    try:
+      path = os.path.join(root, 'order.json')
+      self.ordering.save(path)
+      loaded = RuleOrdering.load(path)
+      eq_(loaded.block_hits, self.ordering.block_hits)
+      eq_(loaded.inline_hits, self.ordering.inline_hits)
+      with open(path, 'w') as f:
+        f.write('{"version": 0}')
+      with self.assertRaises(ValueError):
+        RuleOrdering.load(path)
+    finally:
+      shutil.rmtree(root)
+
+
+class TestMayOverlap(TestCase):
+  def test_disjoint(self):
+    grammar = Grammar()
+    self.assertFalse(may_overlap(re.compile('a+b'), re.compile('a+c')))
+    self.assertFalse(may_overlap(re.compile('[^x]y'), re.compile('xy')))
+    self.assertFalse(may_overlap(grammar.gen_block_pattern('code'), grammar.gen_block_pattern('note')))
+    self.assertFalse(may_overlap(grammar.gen_inline_pattern('bold'), grammar.gen_inline_pattern('bolder')))
+
+  def test_overlap(self):
+    grammar = Grammar()
+    self.assertTrue(may_overlap(re.compile('a+b'), re.compile('a*')))
+    self.assertTrue(may_overlap(re.compile('[^x]y'), re.compile('zy')))
+    # `..code` also matches the start of `..codex`
+    self.assertTrue(may_overlap(grammar.gen_block_pattern('code'), grammar.gen_block_pattern('codex')))
+
+  def test_unknown(self):
+    self.assertTrue(may_overlap(re.compile('(?i)a'), re.compile('b')))
+    self.assertTrue(may_overlap(re.compile(r'\w'), re.compile('b')))
+
+  def test_negative_lookahead(self):
+    self.assertFalse(may_overlap(re.compile('(?!ab)a.'), re.compile('ab')))
+    self.assertTrue(may_overlap(re.compile('(?!ab)a.'), re.compile('a[bc]')))
+
+
+class TestOrderRules(TestCase):
+  def test_order(self):
+    a, b, c, d = [re.compile(p) for p in ('x', 'y+', 'y', 'z')]
+    rules = {a: 1, b: 2, c: 3, d: 4}
+    eq_(list(order_rules(rules, {'z': 10, 'y': 5})), [d, b, c, a])
+    eq_(list(order_rules(rules, {})), [a, b, c, d])
+
+  def test_pull_forward(self):
+    # `y` cannot pass `y+`, but together they beat `z`
+    a, b, c = [re.compile(p) for p in ('y+', 'z', 'y')]
+    eq_(list(order_rules({a: 1, b: 2, c: 3}, {'y': 10, 'z': 4})), [a, c, b])
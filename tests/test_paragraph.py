@@ -0,0 +1,80 @@
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from asagami.batch import default_modules
+from asagami.modules.paragraph import ParagraphBlockRenderer
+from asagami.parser import INLINE_NONE, Parser, ParserCache
+from asagami.render import HtmlRenderEngine
+
+TEXT = (
+  '\n'
+  'first *line*\n'
+  'second line\n'
+  '\n'
+  '\n'
+  '.. code\n'
+  '    x\n'
+  '```\n'
+  'y\n'
+  '```\n'
+  '\n'
+  'last\n'
+)
+
+
+class TestParagraph(TestCase):
+  def setUp(self):
+    self.modules = default_modules()
+    self.parser = Parser(self.modules, cache=ParserCache())
+
+  def test_parse(self):
+    document = self.parser.parse(TEXT)
+    eq_(
+      [(t.name, t.body) for t in document.blocks],
+      [
+        ('paragraph', 'first *line*\nsecond line'),
+        ('code', '\n    x'),
+        ('code', '\ny'),
+        ('paragraph', 'last'),
+      ],
+    )
+    eq_([t.name for t in document.blocks[0].children], ['text', 'bold', 'text'])
+
+  def test_fence_after_text(self):
+    eq_(
+      [(t.name, t.body) for t in self.parser.parse('text\n```py\ny\n```\nmore\n').blocks],
+      [('paragraph', 'text'), ('code', '\ny'), ('paragraph', 'more')],
+    )
+
+  def test_lines_no_rule_takes(self):
+    eq_(
+      [(t.name, t.body) for t in self.parser.parse('hello\n...and more\n').blocks],
+      [('paragraph', 'hello'), ('paragraph', '...and more')],
+    )
+    eq_(
+      [(t.name, t.body) for t in self.parser.parse('a\n.. note\n    x\n').blocks],
+      [('paragraph', 'a'), ('paragraph', '.. note'), ('paragraph', '    x')],
+    )
+    eq_(
+      [(t.name, t.body) for t in self.parser.parse('```\nunterminated\n').blocks],
+      [('paragraph', '```'), ('paragraph', 'unterminated')],
+    )
+
+  def test_iter_parse(self):
+    eq_(
+      [(t.name, t.body) for t in self.parser.iter_parse(TEXT)],
+      [(t.name, t.body) for t in self.parser.parse(TEXT).blocks],
+    )
+
+  def test_render(self):
+    engine = HtmlRenderEngine(self.modules)
+    eq_(
+      engine.render_to_string(self.parser.parse('a *b* <c>\n\n.. paragraph\n    d\n')),
+      '<p>a <b>b</b> &lt;c&gt;</p>\n<p>d</p>\n',
+    )
+    eq_(engine.render_to_string(self.parser.parse('a<\n', INLINE_NONE)), '<p>a&lt;</p>\n')
+
+  def test_render_html(self):
+    block = self.parser.parse('a *b* <c>\n').blocks[0]
+    eq_(ParagraphBlockRenderer().render_html(block, None), '<p>a <b>b</b> &lt;c&gt;</p>')
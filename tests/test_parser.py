@@ -4,6 +4,8 @@ from nose.tools import eq_
 
 import asagami.parser
 
+from tests.fixtures import FenceBlockType, NamedBlockType
+
 
 class TestGrammerGenInlinePattern(TestCase):
   def setUp(self):
@@ -16,6 +18,24 @@ class TestGrammerGenInlinePattern(TestCase):
     self.assertIsNone(pattern.match(':youo:{hoge}'))
 
 
+class TestUnanchorPattern(TestCase):
+  def test_strip_caret(self):
+    import re
+    pattern = asagami.parser.unanchor_pattern(re.compile(r'^\$(?P<value>[^\$]+)\$'))
+    eq_(pattern.pattern, r'\$(?P<value>[^\$]+)\$')
+    eq_(pattern.match('ab$c$', 2)['value'], 'c')
+
+  def test_keep_flags(self):
+    import re
+    pattern = asagami.parser.unanchor_pattern(re.compile('^a.b', re.DOTALL))
+    self.assertIsNotNone(pattern.match('xa\nb', 1))
+
+  def test_no_caret(self):
+    import re
+    pattern = re.compile('a')
+    self.assertIs(asagami.parser.unanchor_pattern(pattern), pattern)
+
+
 class TestGrammarParseBlockAttributes(TestCase):
   def setUp(self):
     self.grammar = asagami.parser.Grammar()
@@ -32,6 +52,21 @@ class TestGrammarParseBlockAttributes(TestCase):
     eq_(result['piyo'], 'youjo')
     eq_(result['bad_ninja'], 'good_ninja')
 
+  def test_list(self):
+    result = self.grammar.parse_block_attributes(
+      '\n'
+      '    .. tags: [youjo, "ninja, hoge",  piyo ]\n'
+      '    .. empty: []\n'
+      "    .. title: 'quoted'\n"
+    )
+    eq_(result['tags'], ('youjo', 'ninja, hoge', 'piyo'))
+    eq_(result['empty'], ())
+    eq_(result['title'], 'quoted')
+
+  def test_invalid(self):
+    with self.assertRaises(RuntimeError):
+      self.grammar.parse_block_attributes('\n    hoge: ninja\n')
+
 
 class TestGrammarParseInlineAttributes(TestCase):
   def setUp(self):
@@ -44,7 +79,29 @@ class TestGrammarParseInlineAttributes(TestCase):
     eq_(len(result), 3)
     eq_(result['hoge'], 'piyo')
     eq_(result['youjo'], 'ninja')
-    eq_(result['href'], '"http://dakko.site/"')
+    eq_(result['href'], 'http://dakko.site/')
+
+  def test_quoted_comma(self):
+    result = self.grammar.parse_inline_attributes('{title="a, b",lang = python, tags=[x, "y, z"]}')
+    eq_(dict(result), {'title': 'a, b', 'lang': 'python', 'tags': ('x', 'y, z')})
+
+  def test_colon(self):
+    eq_(dict(self.grammar.parse_inline_attributes('{lang:python}')), {'lang': 'python'})
+
+  def test_quote_inside_value(self):
+    result = self.grammar.parse_inline_attributes('{title=it\'s, note=say "hi", index=a[1], tags=[it\'s, b]}')
+    eq_(dict(result), {'title': "it's", 'note': 'say "hi"', 'index': 'a[1]', 'tags': ("it's", 'b')})
+
+  def test_shared(self):
+    first = self.grammar.parse_inline_attributes(''.join(['{lang=python,', 'scheme=molokai}']))
+    second = self.grammar.parse_inline_attributes('{lang=python,scheme=molokai}')
+    self.assertIs(first, second)
+    with self.assertRaises(TypeError):
+      first['lang'] = 'c'
+
+  def test_invalid(self):
+    with self.assertRaises(RuntimeError):
+      self.grammar.parse_inline_attributes('{title="a, b}')
 
 
 class TestBlockParser(TestCase):
@@ -301,3 +358,458 @@ class TestInlineParser(TestCase):
 
     tokenizer.assert_called_once()
     eq_(tokenizer.call_args[0][0]['value'], '\mathcal{A}(\mathcal{D})')
+
+
+class TestParserCache(TestCase):
+  def _types(self, *names):
+    return [NamedBlockType(name) for name in names]
+
+  def test_hit(self):
+    cache = asagami.parser.ParserCache()
+    grammar = asagami.parser.Grammar()
+    first = cache.get(self._types('youjo'), [], grammar)
+    second = cache.get(self._types('youjo'), [], grammar)
+    self.assertIs(first, second)
+    eq_(cache.info(), (1, 1, 32, 1))
+
+  def test_miss(self):
+    cache = asagami.parser.ParserCache()
+    grammar = asagami.parser.Grammar()
+    first = cache.get(self._types('youjo'), [], grammar)
+    self.assertIsNot(first, cache.get(self._types('ninja'), [], grammar))
+    self.assertIsNot(first, cache.get(self._types('youjo'), [], asagami.parser.Grammar()))
+    self.assertIsNot(first, cache.get(self._types('youjo'), [], grammar, compiled=True))
+    eq_(cache.info().misses, 4)
+
+  def test_configured_instances(self):
+    import re
+    cache = asagami.parser.ParserCache()
+    grammar = asagami.parser.Grammar()
+    fence = cache.get([NamedBlockType('youjo', [re.compile(r'```(?P<body>[^`]*)```')])], [], grammar)
+    tilde = cache.get([NamedBlockType('youjo', [re.compile(r'~~~(?P<body>[^~]*)~~~')])], [], grammar)
+    self.assertIsNot(fence, tilde)
+    eq_([p.pattern for p in tilde.rules][0], r'~~~(?P<body>[^~]*)~~~')
+    self.assertIs(fence, cache.get([NamedBlockType('youjo', [re.compile(r'```(?P<body>[^`]*)```')])], [], grammar))
+
+  def test_evict(self):
+    cache = asagami.parser.ParserCache(maxsize=2)
+    grammar = asagami.parser.Grammar()
+    youjo = cache.get(self._types('youjo'), [], grammar)
+    cache.get(self._types('ninja'), [], grammar)
+    cache.get(self._types('youjo'), [], grammar)
+    cache.get(self._types('hoge'), [], grammar)  # evicts ninja
+    self.assertIs(youjo, cache.get(self._types('youjo'), [], grammar))
+    cache.get(self._types('ninja'), [], grammar)
+    eq_(cache.info(), (2, 4, 2, 2))
+
+  def test_clear(self):
+    cache = asagami.parser.ParserCache()
+    cache.get(self._types('youjo'), [], asagami.parser.Grammar())
+    cache.clear()
+    eq_(cache.info(), (0, 0, 32, 0))
+
+
+class TestBlockParserIterParse(TestCase):
+  def setUp(self):
+    self.parser = asagami.parser.BlockParser(
+      [FenceBlockType(), NamedBlockType('youjo'), NamedBlockType('ninja')],
+      None,
+    )
+    self.text = (
+      '.. youjo\n'
+      '    .. youjo: ninja\n'
+      '    hoge\n'
+      '    \n'
+      '    piyo\n'
+      '```\n'
+      'code\n'
+      '```\n'
+      '.. ninja\n'
+      '.. youjo\n'
+      '    last\n'
+      '\n'
+    )
+
+  def _dump(self, tokens):
+    return [(t.name, t.body, dict(t.attributes)) for t in tokens]
+
+  def test_same_as_parse(self):
+    expected = self._dump(self.parser.parse(self.text))
+    eq_(len(expected), 4)
+    eq_(self._dump(self.parser.iter_parse(self.text)), expected)
+    lines = self.text.splitlines(keepends=True)
+    eq_(self._dump(self.parser.iter_parse(lines)), expected)
+    eq_(self._dump(self.parser.iter_parse(self.text.splitlines())), expected)
+
+  def test_lazy(self):
+    read = []
+
+    def lines():
+      for line in self.text.splitlines(keepends=True):
+        read.append(line)
+        yield line
+
+    tokens = self.parser.iter_parse(lines())
+    eq_(next(tokens).body, '\n    hoge\n    \n    piyo')
+    self.assertGreaterEqual(len(read), 6)  # the block and the line that ends it
+    self.assertLess(len(read), len(self.text.splitlines()))
+
+  def test_invalid(self):
+    tokens = self.parser.iter_parse('.. youjo\nplain\n')
+    with self.assertRaises(RuntimeError):
+      list(tokens)
+
+
+class TestMetaDataParserParseLines(TestCase):
+  def test_body(self):
+    metadata = mock.MagicMock()
+    parser = asagami.parser.MetaDataParser()
+    parser.grammar = mock.MagicMock()
+    parser.grammar.metadata_pattern.match.side_effect = [
+      {'name': 'documentclass', 'value': 'none'},
+      None,
+    ]
+    metadata, lines = parser.parse_lines(metadata, ['\n', '::documentclass: none\n', '  .. code\n', 'rest\n'])
+    metadata.register.assert_called_once_with('documentclass', 'none')
+    eq_(list(lines), ['.. code\n', 'rest\n'])
+
+
+class TestMetaData(TestCase):
+  HEADER = '\n::documentclass: none\n::usemodule: [code, bold]\n\n'
+
+  def setUp(self):
+    from asagami.batch import default_modules
+    self.parser = asagami.parser.Parser(default_modules(), cache=asagami.parser.ParserCache())
+
+  def test_parse(self):
+    document = self.parser.parse(self.HEADER + 'body\n')
+    eq_(document.metadata.get('documentclass'), ['none'])
+    eq_(document.metadata.modules, ['code', 'bold'])
+    eq_([(t.name, t.body) for t in document.blocks], [('paragraph', 'body')])
+
+  def test_read_metadata(self):
+    import io
+
+    class Lines(io.StringIO):
+      read_lines = 0
+
+      def __next__(self):
+        self.read_lines += 1
+        return super().__next__()
+
+    stream = Lines(self.HEADER + 'body\n' * 1000)
+    metadata = self.parser.read_metadata(stream)
+    eq_(metadata.values, {'documentclass': ['none'], 'usemodule': ['[code, bold]']})
+    eq_(stream.read_lines, 5)
+
+  def test_read_metadata_text(self):
+    metadata = self.parser.read_metadata(self.HEADER + 'body\n')
+    eq_(metadata.values, {'documentclass': ['none'], 'usemodule': ['[code, bold]']})
+    eq_(self.parser.read_metadata('::documentclass: none').get('documentclass'), ['none'])
+    eq_(self.parser.read_metadata('').values, {})
+
+  def test_read_metadata_path(self):
+    import os
+    import tempfile
+    f = tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.ag', delete=False)
+    with f:
+      f.write(self.HEADER + 'body\n')
+    try:
+      eq_(self.parser.read_metadata(f.name).get('documentclass'), ['none'])
+    finally:
+      os.remove(f.name)
+
+
+class TestInlineParserText(TestCase):
+  def test_text(self):
+    from asagami.modules.core import BoldInlineType
+    parser = asagami.parser.InlineParser([BoldInlineType()])
+    tokens = parser.parse('start *hoge* mid:bold:{piyo}end\n')
+    eq_(
+      [(t.name, t.value) for t in tokens],
+      [
+        ('text', 'start '),
+        ('bold', 'hoge'),
+        ('text', ' mid'),
+        ('bold', 'piyo'),
+        ('text', 'end'),
+      ],
+    )
+
+
+class TestBlockParserInline(TestCase):
+  def setUp(self):
+    from asagami.module import BlockType
+    from asagami.modules.core import BoldInlineType
+
+    class YoujoModule(BlockType):
+      def get_name(self):
+        return 'youjo'
+
+      def get_patterns(self):
+        return []
+
+      @staticmethod
+      def tokenizer(match):
+        pass
+
+    class RawModule(YoujoModule):
+      def get_name(self):
+        return 'raw'
+
+      def get_inline_body(self, token):
+        return None
+
+    self.inline_parser = asagami.parser.InlineParser([BoldInlineType()])
+    self.parser = asagami.parser.BlockParser(
+      [YoujoModule(), RawModule()],
+      self.inline_parser,
+    )
+    self.text = (
+      '.. youjo\n'
+      '    .. lang: ja\n'
+      '    hello *youjo*\n'
+      '    \n'
+      '    bye\n'
+      '.. raw\n'
+      '    *not bold*\n'
+    )
+
+  def test_lazy(self):
+    with mock.patch.object(self.inline_parser, 'parse', wraps=self.inline_parser.parse) as parse:
+      tokens = self.parser.parse(self.text)
+      parse.assert_not_called()
+      children = tokens[0].children
+      self.assertIs(tokens[0].children, children)
+      parse.assert_called_once_with('hello *youjo*\n\nbye')
+    eq_(
+      [(t.name, t.value) for t in children],
+      [('text', 'hello '), ('bold', 'youjo'), ('text', '\n\nbye')],
+    )
+    self.assertIsNone(tokens[1].children)
+
+  def test_eager(self):
+    with mock.patch.object(self.inline_parser, 'parse', wraps=self.inline_parser.parse) as parse:
+      tokens = self.parser.parse(self.text, inline='eager')
+      parse.assert_called_once()
+    eq_(len(tokens[0].children), 3)
+
+  def test_none(self):
+    tokens = self.parser.parse(self.text, inline='none')
+    self.assertIsNone(tokens[0].children)
+
+  def test_iter_parse(self):
+    tokens = list(self.parser.iter_parse(self.text, inline='eager'))
+    eq_(len(tokens[0].children), 3)
+
+  def test_unknown_mode(self):
+    with self.assertRaises(ValueError):
+      self.parser.parse(self.text, inline='sometimes')
+
+
+class TestBlockParserReparse(TestCase):
+  def setUp(self):
+    self.parser = asagami.parser.BlockParser(
+      [NamedBlockType('youjo'), NamedBlockType('ninja')],
+      None,
+    )
+    self.text = ''.join(
+      '.. {}\n    .. n: {}\n    line {}\n    more\n'.format(name, i, i)
+      for i, name in enumerate(['youjo', 'ninja'] * 10)
+    )
+
+  def _dump(self, result):
+    return [(t.name, t.body, dict(t.attributes)) for t in result.tokens], result.starts
+
+  def _full(self, text):
+    try:
+      return self._dump(self.parser.parse_blocks(text))
+    except RuntimeError:
+      return RuntimeError
+
+  def _incremental(self, previous, offset, removed, inserted):
+    try:
+      return self._dump(self.parser.reparse(previous, offset, removed, inserted))
+    except RuntimeError:
+      return RuntimeError
+
+  def test_starts(self):
+    result = self.parser.parse_blocks(self.text)
+    eq_(len(result.tokens), 20)
+    eq_(result.starts[1], self.text.index('.. ninja'))
+    eq_(result.span(0), (0, result.starts[1]))
+    eq_(result.span(19)[1], len(self.text) - 1)
+
+  def test_reuse(self):
+    previous = self.parser.parse_blocks(self.text)
+    offset = self.text.index('line 10') + len('line 10')
+    result = self.parser.reparse(previous, offset, 0, '0')
+    eq_(result.tokens[10].body, '\n    line 100\n    more')
+    self.assertIs(result.tokens[8], previous.tokens[8])
+    self.assertIsNot(result.tokens[10], previous.tokens[10])
+    for old, new in zip(previous.tokens[11:], result.tokens[11:]):
+      self.assertIs(old, new)
+    eq_(result.starts[11:], [start + 1 for start in previous.starts[11:]])
+
+  def test_random_edits(self):
+    import random
+    rng = random.Random(0)
+    pieces = ['\n', '    ', 'x', '.. youjo\n', '    .. a: b\n', '.. ninja', '\n    body']
+    previous = self.parser.parse_blocks(self.text)
+    for _ in range(300):
+      offset = rng.randrange(len(previous.text) + 1)
+      removed = rng.randrange(min(20, len(previous.text) - offset) + 1)
+      inserted = ''.join(rng.choice(pieces) for _ in range(rng.randrange(3)))
+      text = previous.text[:offset] + inserted + previous.text[offset + removed:]
+      expected = self._full(text)
+      eq_(self._incremental(previous, offset, removed, inserted), expected)
+      if expected is not RuntimeError:
+        previous = self.parser.reparse(previous, offset, removed, inserted)
+
+  def test_edit_chain(self):
+    # a short read-ahead makes scans extend what they read; results are
+    # not read between edits, so they stay split into runs
+    import random
+    rng = random.Random(1)
+    pieces = ['\n', '    ', 'x', '.. youjo\n', '    .. a: b\n', '.. ninja', '\n    body']
+    text = self.text * 5
+    previous = self.parser.parse_blocks(text)
+    with mock.patch.object(asagami.parser, '_READ_AHEAD', 8):
+      for i in range(300):
+        offset = rng.randrange(len(text) + 1)
+        removed = rng.randrange(min(20, len(text) - offset) + 1)
+        inserted = ''.join(rng.choice(pieces) for _ in range(rng.randrange(3)))
+        edited = text[:offset] + inserted + text[offset + removed:]
+        expected = self._full(edited)
+        if expected is RuntimeError:
+          continue
+        previous = self.parser.reparse(previous, offset, removed, inserted)
+        text = edited
+        if i % 20 == 19:
+          eq_(previous.text, text)
+          eq_(self._dump(previous), expected)
+    eq_(self._dump(previous), self._full(text))
+
+  def test_unchanged_runs_shared(self):
+    text = self.text * 50
+    previous = self.parser.parse_blocks(text)
+    offset = previous.starts[500] + len('.. youjo\n    .. n: 0\n    line')
+    result = self.parser.reparse(previous, offset, 0, 'x')
+    eq_(len(result._runs), 3)
+    self.assertIs(result._runs[0].tokens, previous.tokens)
+    self.assertIs(result._runs[2].tokens, previous.tokens)
+    eq_(result.text, text[:offset] + 'x' + text[offset:])
+
+  def test_out_of_range(self):
+    previous = self.parser.parse_blocks(self.text)
+    with self.assertRaises(ValueError):
+      self.parser.reparse(previous, len(self.text), 1, '')
+
+
+class TestSpanParse(TestCase):
+  def test_same_tokens(self):
+    from asagami.batch import default_modules
+    from asagami.token import TextSpan
+    text = '::usemodule: code\n\n.. code\n    x *y*\n```\nz\n```\nplain :code:{w} text\n\n\n'
+    parser = asagami.parser.Parser(default_modules(), cache=asagami.parser.ParserCache())
+    plain = parser.parse(text, asagami.parser.INLINE_EAGER)
+    spans = parser.parse(text, asagami.parser.INLINE_EAGER, spans=True)
+    eq_(
+      [(t.name, t.body, [(c.name, c.value) for c in t.children or []]) for t in spans.blocks],
+      [(t.name, t.body, [(c.name, c.value) for c in t.children or []]) for t in plain.blocks],
+    )
+    for token in spans.blocks:
+      self.assertIsInstance(token.span, TextSpan)
+      self.assertIs(token.span.source, text)
+      eq_(text[token.span.start:token.span.end], token.body)
+
+  def test_inline(self):
+    from asagami.batch import default_modules
+    parser = asagami.parser.Parser(default_modules(), cache=asagami.parser.ParserCache())
+    inline_parser = parser.get_block_parser(*parser.load_modules(None)).inline_parser
+    tokens = inline_parser.parse('a *b* c\n\n', spans=True)
+    eq_([(t.name, t.value) for t in tokens], [('text', 'a '), ('bold', 'b'), ('text', ' c')])
+    eq_([(t.span.start, t.span.end) for t in tokens], [(0, 2), (3, 4), (5, 7)])
+
+
+class TestParseFile(TestCase):
+  TEXT = (
+    'こんにちは *世界*\n'
+    '.. code\n'
+    '    .. lang: python\n'
+    '    ようじょ :code:{x}\n'
+    '```py\n'
+    'コード\n'
+    '```\n'
+    '\n'
+  )
+
+  def setUp(self):
+    import tempfile
+    from asagami.batch import default_modules
+    self.modules = default_modules()
+    f = tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.ag', delete=False)
+    with f:
+      f.write(self.TEXT)
+    self.path = f.name
+
+  def tearDown(self):
+    import os
+    os.remove(self.path)
+
+  def _dump(self, document):
+    return [
+      (t.name, t.body, dict(t.attributes), [(c.name, c.value) for c in t.children or []])
+      for t in document.blocks
+    ]
+
+  def test_same_tokens(self):
+    for compiled in (False, True):
+      parser = asagami.parser.Parser(self.modules, compiled=compiled, cache=asagami.parser.ParserCache())
+      document = parser.parse_file(self.path, asagami.parser.INLINE_EAGER)
+      eq_(self._dump(document), self._dump(parser.parse(self.TEXT, asagami.parser.INLINE_EAGER)))
+      self.assertNotIsInstance(document.blocks[0].span.source, str)
+
+  def test_profiled(self):
+    from asagami.profiling import ParseProfile
+    parser = asagami.parser.Parser(self.modules, profile=ParseProfile())
+    document = parser.parse_file(self.path, asagami.parser.INLINE_EAGER)
+    eq_(self._dump(document), self._dump(parser.parse(self.TEXT, asagami.parser.INLINE_EAGER)))
+
+  def test_decoded_fallback(self):
+    import re
+    from asagami.module import BlockType, Module
+    from asagami.token import BlockToken
+
+    class WordBlockType(BlockType):
+      def get_name(self):
+        return 'word'
+
+      def get_patterns(self):
+        return [re.compile(r'!(?P<body>\w+)\n?')]
+
+      @staticmethod
+      def tokenizer(match):
+        return BlockToken('word', match['body'], {})
+
+    class WordModule(Module):
+      def get_name(self):
+        return 'word'
+
+      def get_block_types(self):
+        return [WordBlockType()]
+
+      def get_inline_types(self):
+        return []
+
+    with open(self.path, 'w', encoding='utf-8') as f:
+      f.write('!ようじょ\n')
+    parser = asagami.parser.Parser([WordModule()], cache=asagami.parser.ParserCache())
+    document = parser.parse_file(self.path)
+    eq_([(t.name, t.body) for t in document.blocks], [('word', 'ようじょ')])
+    self.assertIsNone(document.blocks[0].span)
+
+  def test_empty(self):
+    open(self.path, 'w').close()
+    parser = asagami.parser.Parser(self.modules, cache=asagami.parser.ParserCache())
+    eq_(parser.parse_file(self.path).blocks, [])
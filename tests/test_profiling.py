@@ -0,0 +1,94 @@
+from unittest import TestCase
+
+import gc
+
+from nose.tools import eq_, ok_
+
+from asagami.module import BlockType, Module
+from asagami.modules.code import CodeModule
+from asagami.modules.core import BoldModule
+from asagami.parser import INLINE_EAGER, Parser, ParserCache
+from asagami.profiling import ParseProfile
+
+TEXT = '```py\nx\n```\n.. note\n    a *b* c\n.. code\n    d\n'
+
+
+class NoteBlockType(BlockType):
+  def get_name(self):
+    return 'note'
+
+  def get_patterns(self):
+    return []
+
+  @staticmethod
+  def tokenizer(match):
+    pass
+
+
+class NoteModule(Module):
+  def get_name(self):
+    return 'note'
+
+  def get_block_types(self):
+    return [NoteBlockType()]
+
+
+class TestParseProfile(TestCase):
+  def _parse(self, compiled):
+    profile = ParseProfile()
+    modules = [CodeModule(), NoteModule(), BoldModule()]
+    parser = Parser(modules, compiled=compiled, cache=ParserCache(), profile=profile)
+    document = parser.parse(TEXT, INLINE_EAGER)
+    plain = Parser(modules, compiled=compiled, cache=ParserCache()).parse(TEXT, INLINE_EAGER)
+    eq_(
+      [(t.name, t.body, [c.value for c in t.children or []]) for t in document.blocks],
+      [(t.name, t.body, [c.value for c in t.children or []]) for t in plain.blocks],
+    )
+    return profile
+
+  def test_counts(self):
+    profile = self._parse(compiled=False)
+    stats = {(s.kind, s.owner): s for s in profile.report()}
+    fence = stats['block', 'asagami.modules.code.CodeBlockType']
+    eq_((fence.attempts, fence.hits, fence.misses), (3, 1, 2))
+    eq_(stats['block', "Grammar.gen_block_pattern('code')"].hits, 1)
+    eq_(stats['block', "Grammar.gen_block_pattern('note')"].hits, 1)
+    eq_(stats['inline', 'asagami.modules.core.BoldInlineType'].hits, 1)
+    ok_(fence.match_seconds > 0)
+    ok_(fence.tokenize_seconds > 0)
+
+  def test_compiled(self):
+    profile = self._parse(compiled=True)
+    stats = {(s.kind, s.owner): s for s in profile.report()}
+    eq_(stats['block', 'Grammar.gen_block_pattern(*)'].hits, 2)
+    eq_(stats['block', 'asagami.modules.code.CodeBlockType'].attempts, 1)
+
+  def test_report(self):
+    profile = self._parse(compiled=False)
+    attempts = [s.attempts for s in profile.report('attempts')]
+    eq_(attempts, sorted(attempts, reverse=True))
+    eq_({s.kind for s in profile.report(kind='inline')}, {'inline'})
+    with self.assertRaises(ValueError):
+      profile.report('name')
+    eq_(len(profile.format(limit=2).splitlines()), 3)
+
+  def test_original_untouched(self):
+    profile = ParseProfile()
+    cache = ParserCache()
+    parser = Parser([CodeModule()], cache=cache)
+    block_parser = parser.get_block_parser(*parser.load_modules(None))
+    profiled = profile.wrap(block_parser)
+    ok_(profile.wrap(block_parser) is profiled)
+    block_parser.parse(TEXT.replace('note', 'code'))
+    eq_(sum(s.attempts for s in profile.report()), 0)
+    eq_(profiled.fingerprint(), block_parser.fingerprint())
+
+  def test_evicted_parsers_released(self):
+    profile = ParseProfile()
+    cache = ParserCache(maxsize=1)
+    parser = Parser([CodeModule()], cache=cache, profile=profile)
+    parser.parse('.. code\n    x\n')
+    eq_(len(profile._wrapped), 2)  # block and inline parser
+    cache.clear()
+    gc.collect()
+    eq_(len(profile._wrapped), 0)
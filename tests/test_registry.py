@@ -0,0 +1,86 @@
+from unittest import TestCase
+
+import os
+import sys
+
+from nose.tools import eq_, ok_
+
+from asagami.document import Document, DocumentMetaData
+from asagami.modules.paragraph import ParagraphModule
+from asagami.parser import Parser, ParserCache
+from asagami.registry import ModuleRegistry, default_registry
+from asagami.render import HtmlRenderEngine
+
+
+def _metadata(*modules):
+  metadata = DocumentMetaData()
+  for value in modules:
+    metadata.register('usemodule', value)
+  return metadata
+
+
+class TestDocumentMetaData(TestCase):
+  def test_modules(self):
+    eq_(_metadata('code', '[bold, italic]', ' link ').modules, ['code', 'bold', 'italic', 'link'])
+    eq_(_metadata('code, bold', '["link"]').modules, ['code', 'bold', 'link'])
+    eq_(DocumentMetaData().modules, [])
+
+
+class TestModuleRegistry(TestCase):
+  def test_lazy(self):
+    created = []
+
+    def factory():
+      from asagami.modules.core import BoldModule
+      created.append(None)
+      return BoldModule()
+
+    registry = ModuleRegistry({'bold': factory})
+    eq_(registry.resolved(), [])
+    resolved = registry.resolve('bold')
+    ok_(registry.resolve('bold') is resolved)
+    eq_(len(created), 1)
+    eq_([t.get_name() for t in resolved.inline_types], ['bold'])
+
+  def test_spec(self):
+    original = sys.modules.pop('asagami.modules.code', None)
+    try:
+      registry = default_registry()
+      ok_('asagami.modules.code' not in sys.modules)
+      eq_([t.get_name() for t in registry.resolve('code').block_types], ['code'])
+      ok_('asagami.modules.code' in sys.modules)
+    finally:
+      if original is not None:
+        sys.modules['asagami.modules.code'] = original
+
+  def test_unknown(self):
+    registry = ModuleRegistry()
+    ok_('youjo' not in registry)
+    with self.assertRaises(LookupError):
+      registry.resolve('youjo')
+
+
+class TestParserRegistry(TestCase):
+  def test_load_modules(self):
+    parser = Parser([ParagraphModule()], cache=ParserCache(), registry=default_registry())
+    block_types, inline_types = parser.load_modules(_metadata('[code, bold]', 'paragraph'))
+    eq_([t.get_name() for t in block_types], ['code', 'paragraph'])
+    eq_([t.get_name() for t in inline_types], ['code', 'bold'])
+    eq_([t.get_name() for t in Parser([ParagraphModule()]).load_modules(_metadata('code'))[0]], ['paragraph'])
+
+  def test_spec_names(self):
+    parser = Parser([ParagraphModule()], cache=ParserCache(), registry=default_registry())
+    block_types, inline_types = parser.load_modules(_metadata('CodeInlineModule', 'CodeBlockModule', 'code'))
+    eq_([t.get_name() for t in block_types], ['code', 'paragraph'])
+    eq_([t.get_name() for t in inline_types], ['code'])
+    with open(os.path.join(os.path.dirname(__file__), '..', 'test.ag')) as f:
+      ok_(list(parser.parse(f.read()).blocks))
+
+  def test_render(self):
+    registry = default_registry()
+    parser = Parser([ParagraphModule()], cache=ParserCache(), registry=registry)
+    metadata = _metadata('bold')
+    block_parser = parser.get_block_parser(*parser.load_modules(metadata))
+    document = Document(metadata, block_parser.parse('a *b*\n'))
+    engine = HtmlRenderEngine([ParagraphModule()], registry)
+    eq_(engine.render_to_string(document), '<p>a <b>b</b></p>\n')
@@ -0,0 +1,147 @@
+from unittest import TestCase
+
+import io
+
+from nose.tools import eq_
+
+from asagami.cache import RenderCache
+from asagami.document import Document
+from asagami.module import BlockRenderer, Module
+from asagami.modules.code import CodeModule
+from asagami.modules.core import BoldModule, ItalicModule, LinkModule, UnderlineModule
+from asagami.render import HtmlRenderEngine
+from asagami.token import BlockToken, InlineToken
+
+
+class ParagraphRenderer(BlockRenderer):
+  def get_name(self):
+    return 'paragraph'
+
+  def write_html(self, token, env, out):
+    out.write('<p>')
+    out.write_inline(token.children)
+    out.write('</p>')
+
+
+class ParagraphModule(Module):
+  def get_name(self):
+    return 'paragraph'
+
+  def get_block_renderer(self):
+    return [ParagraphRenderer()]
+
+
+def _paragraph(*children):
+  token = BlockToken(name='paragraph', body='', attributes={})
+  token.children = list(children)
+  return token
+
+
+class TestHtmlRenderEngine(TestCase):
+  def setUp(self):
+    self.engine = HtmlRenderEngine([CodeModule(), BoldModule(), ParagraphModule()])
+    self.document = Document(
+      metadata=None,
+      blocks=[
+        BlockToken(name='code', body='print(1)', attributes={'lang': 'python'}),
+        _paragraph(
+          InlineToken(name='text', value='a < b ', attributes={}),
+          InlineToken(name='bold', value='youjo', attributes={}),
+        ),
+      ],
+    )
+    self.expected = (
+      '<code class="language-python"><span class="builtin">print</span>(<span class="number">1</span>)</code>\n'
+      '<p>a &lt; b <b>youjo</b></p>\n'
+    )
+
+  def test_escape_inline(self):
+    engine = HtmlRenderEngine([BoldModule(), ItalicModule(), UnderlineModule(), LinkModule(), ParagraphModule()])
+    document = Document(
+      metadata=None,
+      blocks=[
+        _paragraph(
+          InlineToken(name='bold', value='<script>x</script>', attributes={}),
+          InlineToken(name='italic', value='a & b', attributes={}),
+          InlineToken(name='underline', value='<u>', attributes={}),
+          InlineToken(name='link', value='<i>', attributes={'href': 'http://a/"><script>'}),
+        ),
+      ],
+    )
+    eq_(
+      engine.render_to_string(document),
+      '<p><b>&lt;script&gt;x&lt;/script&gt;</b><i>a &amp; b</i><u>&lt;u&gt;</u>'
+      '<a href="http://a/&quot;&gt;&lt;script&gt;">&lt;i&gt;</a></p>\n',
+    )
+
+  def test_render_file(self):
+    sink = io.StringIO()
+    self.engine.render(self.document, sink)
+    eq_(sink.getvalue(), self.expected)
+
+  def test_render_callable(self):
+    chunks = []
+    self.engine.render(self.document, chunks.append)
+    eq_(''.join(chunks), self.expected)
+
+  def test_iter_render(self):
+    chunks = list(self.engine.iter_render(self.document, chunk_size=1, encoding='utf-8'))
+    eq_(len(chunks), 2)
+    eq_(b''.join(chunks), self.expected.encode('utf-8'))
+    eq_(self.engine.render_to_string(self.document), self.expected)
+
+  def test_lazy_blocks(self):
+    rendered = []
+
+    def blocks():
+      for token in self.document.blocks:
+        rendered.append(token)
+        yield token
+
+    chunks = self.engine.iter_render(Document(None, blocks()), chunk_size=1)
+    eq_(next(chunks), '<code class="language-python"><span class="builtin">print</span>(<span class="number">1</span>)</code>\n')
+    eq_(len(rendered), 1)
+
+  def test_missing_renderer(self):
+    document = Document(None, [BlockToken(name='youjo', body='', attributes={})])
+    with self.assertRaises(RuntimeError):
+      self.engine.render_to_string(document)
+
+
+class UncachedParagraphRenderer(ParagraphRenderer):
+  cacheable = False
+
+
+class TestRenderCache(TestCase):
+  def setUp(self):
+    self.cache = RenderCache()
+    self.engine = HtmlRenderEngine([CodeModule(), BoldModule(), ParagraphModule()], cache=self.cache)
+
+  def _document(self, code):
+    return Document(None, [
+      BlockToken(name='code', body=code, attributes={'lang': 'python'}),
+      _paragraph(InlineToken(name='bold', value='youjo', attributes={})),
+    ])
+
+  def test_reuse(self):
+    expected = HtmlRenderEngine([CodeModule(), BoldModule(), ParagraphModule()]).render_to_string(self._document('a'))
+    eq_(self.engine.render_to_string(self._document('a')), expected)
+    eq_(self.engine.render_to_string(self._document('a')), expected)
+    eq_((self.cache.hits, self.cache.misses), (2, 2))
+    self.engine.render_to_string(self._document('b'))
+    eq_((self.cache.hits, self.cache.misses), (3, 3))
+
+  def test_key(self):
+    context = b'context'
+    token = BlockToken(name='code', body='a', attributes={'lang': 'python'})
+    key = RenderCache.key(context, token)
+    self.assertNotEqual(key, RenderCache.key(b'other', token))
+    self.assertNotEqual(key, RenderCache.key(context, BlockToken(name='code', body='a', attributes={})))
+    self.assertNotEqual(key, RenderCache.key(context, BlockToken(name='code', body='b', attributes={'lang': 'python'})))
+    token.children = []
+    self.assertNotEqual(key, RenderCache.key(context, token))
+
+  def test_not_cacheable(self):
+    self.engine.block_renderers['paragraph'] = UncachedParagraphRenderer()
+    self.engine.render_to_string(self._document('a'))
+    eq_(len(self.cache), 1)
@@ -0,0 +1,70 @@
+from unittest import TestCase
+
+import os
+import re
+import shutil
+import tempfile
+
+from nose.tools import eq_, ok_
+
+from asagami.batch import default_modules
+from asagami.modules.core import BoldInlineType, BoldModule
+from asagami.parser import INLINE_EAGER, Parser, ParserCache
+from asagami.snapshot import GrammarSnapshot
+
+TEXT = 'a *b* :code:{c}\n\n.. code\n    .. lang: python\n    d\n```py\ne\n```\n'
+
+
+def _dump(document):
+  return [
+    (t.name, t.body, dict(t.attributes), [(c.name, c.value) for c in t.children or []])
+    for t in document.blocks
+  ]
+
+
+class VersionedBoldInlineType(BoldInlineType):
+  version = 2
+
+
+class VersionedBoldModule(BoldModule):
+  def get_inline_types(self):
+    return [VersionedBoldInlineType()]
+
+
+class TestGrammarSnapshot(TestCase):
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.path = os.path.join(self.root, 'grammar.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def test_same_tokens(self):
+    for compiled in (False, True):
+      built = Parser(default_modules(), compiled=compiled, cache=ParserCache())
+      GrammarSnapshot.of(built).save(self.path)
+      loaded = Parser(default_modules(), compiled=compiled, cache=ParserCache())
+      ok_(GrammarSnapshot.load(self.path).install(loaded))
+      eq_(_dump(loaded.parse(TEXT, INLINE_EAGER)), _dump(built.parse(TEXT, INLINE_EAGER)))
+      eq_(loaded.cache.info().misses, 0)
+
+  def test_patterns(self):
+    parser = Parser(default_modules(), cache=ParserCache())
+    block_parser = GrammarSnapshot.of(parser).build(*parser.load_modules(None), parser.grammar)
+    for pattern in block_parser.inline_parser.rules:
+      eq_(pattern, re.compile(pattern.pattern, pattern.flags))
+      self.assertIsNot(pattern, re.compile(pattern.pattern, pattern.flags))
+
+  def test_stale(self):
+    GrammarSnapshot.of(Parser([BoldModule()], cache=ParserCache())).save(self.path)
+    snapshot = GrammarSnapshot.load(self.path)
+    ok_(not snapshot.install(Parser([VersionedBoldModule()], cache=ParserCache())))
+    ok_(not snapshot.install(Parser([BoldModule()], compiled=True, cache=ParserCache())))
+    ok_(not snapshot.install(Parser([BoldModule(), BoldModule()], cache=ParserCache())))
+    ok_(snapshot.install(Parser([BoldModule()], cache=ParserCache())))
+
+  def test_bad_version(self):
+    with open(self.path, 'w') as f:
+      f.write('{"version": 0}')
+    with self.assertRaises(ValueError):
+      GrammarSnapshot.load(self.path)
@@ -0,0 +1,60 @@
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from asagami.token import EMPTY_ATTRIBUTES, BlockToken, InlineToken, ParagraphToken, TextSpan
+
+
+class TestToken(TestCase):
+  def test_empty_attributes_shared(self):
+    first = InlineToken(name='bold', value='a', attributes={})
+    second = BlockToken(name='code', body='b', attributes={})
+    self.assertIs(first.attributes, EMPTY_ATTRIBUTES)
+    self.assertIs(second.attributes, EMPTY_ATTRIBUTES)
+    eq_(first.attributes, {})
+
+  def test_empty_attributes_read_only(self):
+    with self.assertRaises(TypeError):
+      EMPTY_ATTRIBUTES['lang'] = 'python'
+
+  def test_attributes_kept(self):
+    attributes = {'lang': 'python'}
+    token = BlockToken(name='code', body='', attributes=attributes)
+    self.assertIs(token.attributes, attributes)
+
+  def test_name_interned(self):
+    name = ''.join(['yo', 'ujo'])
+    token = InlineToken(name=name, value='', attributes={})
+    self.assertIs(token.name, 'youjo')
+
+  def test_slots(self):
+    for token in (
+        BlockToken(name='code', body='', attributes={}),
+        InlineToken(name='code', value='', attributes={}),
+        ParagraphToken(name='paragraph', children=[], attributes={}),
+    ):
+      self.assertFalse(hasattr(token, '__dict__'))
+
+  def test_span_body(self):
+    source = 'abc hoge def'
+    token = BlockToken(name='code', body=TextSpan(source, 4, 8), attributes={})
+    eq_(token.body, 'hoge')
+    eq_(token.span, TextSpan(source, 4, 8))
+    token.body = 'piyo'
+    eq_(token.body, 'piyo')
+    self.assertIsNone(token.span)
+
+
+class TestTextSpan(TestCase):
+  def test_str(self):
+    span = TextSpan('abc hoge', 4, 8)
+    eq_(str(span), 'hoge')
+    eq_(len(span), 4)
+    eq_(span, 'hoge')
+    eq_(span, TextSpan('hoge', 0, 4))
+
+  def test_bytes(self):
+    source = 'ようじょ'.encode('utf-8')
+    span = TextSpan(source, 3, 9)
+    eq_(str(span), 'うじ')
+    eq_(str(TextSpan(bytearray(source), 0, 3)), 'よ')